@@ -1,9 +1,11 @@
 # agent.py
 
+import asyncio
 import logging
 import json
 import atexit
-from .network import NetworkClient, NetworkError
+import threading
+from .network import NetworkClient, AsyncNetworkClient, NetworkError
 from .color import Color
 from .language import languages
 
@@ -13,6 +15,24 @@ class GroupValidationError(Exception):
 
 class PrivateGPTAgent:
     def __init__(self, config):
+        self._init_settings(config)
+
+        self.network_client = NetworkClient(self.server_ip, self.server_port, language=self.language)
+        self.token = None
+
+        atexit.register(self.logout)
+
+        # Initialer Login
+        self.login()
+
+        # Personalisierte Gruppen abholen
+        if self.token:
+            self.allowed_groups = self.list_personal_groups()
+            self._check_allowed_groups()
+        else:
+            self.allowed_groups = []
+
+    def _init_settings(self, config):
         # mcp_server-Daten aus dem config-Objekt lesen
         self.mcp_config = config.get("mcp_server")
         # Lese host und port
@@ -23,6 +43,9 @@ class PrivateGPTAgent:
         self.email = config.get("email")
         self.password = config.get("password")
         self.chosen_groups = config.get("groups", [])
+        self.token_refreshes = 0  # Anzahl Re-Logins wegen abgelaufenem Token (Monitoring)
+        self._group_index = (frozenset(), {})
+        self._group_refresh = None
         self.language = config.get("language", "en")  # Standard ist Englisch
 
         if self.language not in languages:
@@ -31,31 +54,6 @@ class PrivateGPTAgent:
 
         self.lang = languages[self.language]
 
-        self.network_client = NetworkClient(self.server_ip, self.server_port, language=self.language)
-        self.token = None
-
-        atexit.register(self.logout)
-
-        # Initialer Login
-        self.login()
-
-        # Personalisierte Gruppen abholen
-        if self.token:
-            self.allowed_groups = self.list_personal_groups()
-            if not self.allowed_groups:
-                logging.warning(self.lang["no_personal_groups"])
-                print(self.lang["no_personal_groups"], flush=True)
-                self.allowed_groups = []
-
-            # Validierung der Gruppen
-            invalid = self.validate_groups(self.chosen_groups)
-            if invalid:
-                print(self.lang["invalid_group"].format(groups=invalid), flush=True)
-                logging.error(self.lang["invalid_group_error"])
-                raise GroupValidationError(self.lang["invalid_group"].format(groups=invalid))
-        else:
-            self.allowed_groups = []
-
         # Lokale Wissensbasis (Beispiel)
         self.knowledge_base = {
             "What is AI?": self.lang["knowledge_ai"],
@@ -63,6 +61,19 @@ class PrivateGPTAgent:
             "What is Machine Learning?": self.lang["knowledge_ml"]
         }
 
+    def _check_allowed_groups(self):
+        if not self.allowed_groups:
+            logging.warning(self.lang["no_personal_groups"])
+            print(self.lang["no_personal_groups"], flush=True)
+            self.allowed_groups = []
+
+        # Validierung der Gruppen
+        invalid = self.validate_groups(self.chosen_groups)
+        if invalid:
+            print(self.lang["invalid_group"].format(groups=invalid), flush=True)
+            logging.error(self.lang["invalid_group_error"])
+            raise GroupValidationError(self.lang["invalid_group"].format(groups=invalid))
+
     def get_lang_message(self, key, **kwargs):
         message = self.lang.get(key, "Message not defined.")
         try:
@@ -71,38 +82,109 @@ class PrivateGPTAgent:
             logging.error(f"Missing placeholder in language file for key '{key}': {e}")
             return message
 
+    # Gruppen-Index: allowed_groups ist ein frozenset; zusammen mit dem Memo der bereits geprüften
+    # Gruppen-Tupel wird es als ein Objekt getauscht (Refresh), Requests sehen also
+    # immer einen konsistenten Stand ohne Lock.
+    GROUP_MEMO_MAX = 1024
+
+    @property
+    def allowed_groups(self):
+        return self._group_index[0]
+
+    @allowed_groups.setter
+    def allowed_groups(self, groups):
+        self._group_index = (frozenset(groups or ()), {})
+
+    def _group_view(self, groups):
+        """(ungültige, erlaubte) Gruppen als Tupel – pro Gruppen-Tupel nur einmal berechnet."""
+        allowed, memo = self._group_index
+        try:
+            key = tuple(groups)
+            view = memo.get(key)
+        except TypeError:  # nicht hashbare Einträge -> ohne Memo
+            key, view = None, None
+        if view is None:
+            names = tuple(g for g in groups if isinstance(g, str))  # Gruppennamen sind Strings
+            invalid = tuple(g for g in groups if not isinstance(g, str) or g not in allowed)
+            stripped = (g.strip() for g in names)
+            view = (invalid, tuple(g for g in stripped if g and g in allowed))
+            if key is not None:
+                if len(memo) >= self.GROUP_MEMO_MAX:
+                    memo.clear()
+                memo[key] = view
+        return view
+
     def validate_groups(self, groups):
         if groups is None:
             return []
-        invalid = [g for g in groups if g not in self.allowed_groups]
+        invalid = self._group_view(groups)[0]
         if invalid:
-            logging.error(self.get_lang_message("group_validation_error", error=invalid))
-            return invalid
+            logging.error(self.get_lang_message("group_validation_error", error=list(invalid)))
+            return list(invalid)
         return []
 
+    def _swap_allowed_groups(self, groups):
+        """Neue Gruppenliste übernehmen; leere Antwort (Fehler) behält den alten Stand."""
+        if not groups:
+            return False
+        new = frozenset(groups)
+        old = self.allowed_groups
+        if new != old:
+            logging.info(f"Gruppen aktualisiert: +{sorted(new - old)} -{sorted(old - new)}")
+            self.allowed_groups = new
+        return True
+
+    def refresh_allowed_groups(self):
+        return self._swap_allowed_groups(self.list_personal_groups())
+
+    def start_group_refresh(self, interval):
+        """Gruppen alle `interval` Sekunden im Hintergrund neu holen (0 = aus)."""
+        if not interval or interval <= 0 or self._group_refresh is not None:
+            return
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.refresh_allowed_groups()
+                except Exception as e:
+                    logging.warning(f"Group refresh failed: {e}")
+
+        threading.Thread(target=loop, name="group-refresh", daemon=True).start()
+        self._group_refresh = stop
+
+    def stop_group_refresh(self):
+        if self._group_refresh is not None:
+            self._group_refresh.set()
+            self._group_refresh = None
+
     def login(self):
-        payload = {
+        logging.info(self.get_lang_message("login_attempt"))
+        try:
+            resp = self.network_client.send_request(self._login_payload())
+            return self._handle_login_response(resp)
+        except NetworkError as e:
+            logging.error(self.get_lang_message("login_failed", message=str(e)))
+            return False
+
+    def _login_payload(self):
+        return {
             "command": "login",
             "arguments": {
                 "email": self.email,
                 "password": self.password
             }
         }
-        logging.info(self.get_lang_message("login_attempt"))
-        try:
-            resp = self.network_client.send_request(payload)
-            #logging.info(self.get_lang_message("received_response", response=resp))
 
-            if resp.get("status") == 200 and resp.get("message") == "success":
-                self.token = resp.get("token")
-                logging.info(self.get_lang_message("login_success"))
-                return True
-            else:
-                msg = resp.get("message", self.get_lang_message("no_server_message"))
-                logging.error(self.get_lang_message("login_failed", message=msg))
-                return False
-        except NetworkError as e:
-            logging.error(self.get_lang_message("login_failed", message=str(e)))
+    def _handle_login_response(self, resp):
+        #logging.info(self.get_lang_message("received_response", response=resp))
+        if resp.get("status") == 200 and resp.get("message") == "success":
+            self.token = resp.get("token")
+            logging.info(self.get_lang_message("login_success"))
+            return True
+        else:
+            msg = resp.get("message", self.get_lang_message("no_server_message"))
+            logging.error(self.get_lang_message("login_failed", message=msg))
             return False
 
     def list_personal_groups(self):
@@ -110,57 +192,41 @@ class PrivateGPTAgent:
             logging.error(self.get_lang_message("authentication_failed"))
             return []
 
-        payload = {
-            "command": "list_groups",
-            "token": self.token
-        }
         try:
-            resp = self.network_client.send_request(payload)
-            data_block = resp.get("data")
-            if not data_block:
-                logging.warning(self.lang["no_data_in_response"].format(response=resp))
-                return []
-
-            if data_block.get("status") == 200 and data_block.get("message") == "success":
-                personal = data_block.get("personalGroups", [])
-                logging.info(self.lang["personal_groups"].format(groups=personal))
-                return personal
-            else:
-                logging.warning(self.lang["list_groups_failed"].format(
-                    message=data_block.get("message", self.lang["no_server_message"])))
-                return []
+            resp = self.network_client.send_request(self._list_groups_payload())
+            return self._handle_groups_response(resp)
         except NetworkError as e:
             logging.error(self.lang["list_groups_failed"].format(message=str(e)))
             return []
 
+    def _list_groups_payload(self):
+        return {
+            "command": "list_groups",
+            "token": self.token
+        }
+
+    def _handle_groups_response(self, resp):
+        data_block = resp.get("data")
+        if not data_block:
+            logging.warning(self.lang["no_data_in_response"].format(response=resp))
+            return []
+
+        if data_block.get("status") == 200 and data_block.get("message") == "success":
+            personal = data_block.get("personalGroups", [])
+            logging.info(self.lang["personal_groups"].format(groups=personal))
+            return personal
+        else:
+            logging.warning(self.lang["list_groups_failed"].format(
+                message=data_block.get("message", self.lang["no_server_message"])))
+            return []
+
     def query_private_gpt(self, prompt, use_public=False, language="en", groups=None, _retry_on_token_expired=True):
         if not self.token:
             error_msg = self.get_lang_message("authentication_failed")
             logging.error(error_msg)
             return json.dumps({"error": error_msg})
 
-        if language not in languages:
-            language = 'en'
-            logging.warning(f"Unsupported language '{language}'. Falling back to English.")
-
-        lang = languages[language]
-
-        if groups is None:
-            groups = self.chosen_groups
-        else:
-            groups = [g.strip() for g in groups if g.strip()]
-        relevant_groups = [g for g in groups if g in self.allowed_groups]
-
-        payload = {
-            "command": "chat",
-            "token": self.token,
-            "arguments": {
-                "question": prompt,
-                "usePublic": use_public,
-                "groups": relevant_groups,
-                "language": language
-            }
-        }
+        payload, language, lang = self._chat_payload(prompt, use_public, language, groups)
         #logging.info(lang["sending_payload"].format(payload=json.dumps(payload)))
 
         try:
@@ -170,10 +236,7 @@ class PrivateGPTAgent:
             # ─────────────────────────────────────────────────
             # Token abgelaufen/ungültig => Re-Login
             # ─────────────────────────────────────────────────
-            if (
-                (resp.get("status") in [401, 403])
-                or (resp.get("message") in ["token expired", "token invalid"])
-            ):
+            if self._token_expired(resp):
                 if not _retry_on_token_expired:
                     return json.dumps({"error": "Token ungültig, Re-Login fehlgeschlagen."})
 
@@ -182,6 +245,7 @@ class PrivateGPTAgent:
 
                 old_token = self.token
                 self.token = None
+                self.token_refreshes += 1
 
                 if self.login():
                     return self.query_private_gpt(
@@ -191,19 +255,54 @@ class PrivateGPTAgent:
                 else:
                     return json.dumps({"error": "Automatischer Re-Login ist fehlgeschlagen."})
 
-            # Normaler Erfolgsfall
-            if resp.get("status") == 200 and resp.get("message") == "success":
-                content = resp.get("content", {})
-                answer = content.get("answer", lang["agent_error"].format(error=lang["no_answer_received"]))
-                return json.dumps({"answer": answer})
-            else:
-                return json.dumps({"error": resp.get("message", lang["agent_error"].format(error=lang["unknown_error"]))})
+            return self._chat_result(resp, lang)
 
         except NetworkError as e:
             error_msg = lang["agent_error"].format(error=str(e))
             logging.error(f"❌ {error_msg}")
             return json.dumps({"error": error_msg})
 
+    def _chat_payload(self, prompt, use_public, language, groups):
+        """Build the chat command. Returns (payload, effective language, language dict)."""
+        if language not in languages:
+            logging.warning(f"Unsupported language '{language}'. Falling back to English.")
+            language = 'en'
+
+        lang = languages[language]
+
+        if groups is None:
+            groups = self.chosen_groups
+        relevant_groups = list(self._group_view(groups)[1])
+
+        payload = {
+            "command": "chat",
+            "token": self.token,
+            "arguments": {
+                "question": prompt,
+                "usePublic": use_public,
+                "groups": relevant_groups,
+                "language": language
+            }
+        }
+        return payload, language, lang
+
+    @staticmethod
+    def _token_expired(resp):
+        return (
+            (resp.get("status") in [401, 403])
+            or (resp.get("message") in ["token expired", "token invalid"])
+        )
+
+    @staticmethod
+    def _chat_result(resp, lang):
+        # Normaler Erfolgsfall
+        if resp.get("status") == 200 and resp.get("message") == "success":
+            content = resp.get("content", {})
+            answer = content.get("answer", lang["agent_error"].format(error=lang["no_answer_received"]))
+            return json.dumps({"answer": answer})
+        else:
+            return json.dumps({"error": resp.get("message", lang["agent_error"].format(error=lang["unknown_error"]))})
+
     def respond(self, user_input, groups=None):
         response = self.knowledge_base.get(user_input, None)
         if response:
@@ -225,28 +324,34 @@ class PrivateGPTAgent:
         return json.loads(result)
 
     def logout(self):
+        self.stop_group_refresh()
         if not self.token:
             logging.info(self.get_lang_message("no_token_logout"))
             return
 
-        payload = {
-            "command": "logout",
-            "token": self.token
-        }
         logging.info(self.get_lang_message("logout_attempt"))
         try:
-            resp = self.network_client.send_request(payload)
-            logging.info(self.get_lang_message("received_response", response=resp))
-
-            if resp.get("status") == 200 and resp.get("message") == "success":
-                logging.info(self.get_lang_message("logout_success"))
-                self.token = None
-            else:
-                msg = resp.get("message", self.get_lang_message("no_server_message"))
-                logging.warning(self.get_lang_message("logout_failed", message=msg))
+            resp = self.network_client.send_request(self._logout_payload())
+            self._handle_logout_response(resp)
         except NetworkError as e:
             logging.error(self.get_lang_message("logout_failed", message=str(e)))
 
+    def _logout_payload(self):
+        return {
+            "command": "logout",
+            "token": self.token
+        }
+
+    def _handle_logout_response(self, resp):
+        logging.info(self.get_lang_message("received_response", response=resp))
+
+        if resp.get("status") == 200 and resp.get("message") == "success":
+            logging.info(self.get_lang_message("logout_success"))
+            self.token = None
+        else:
+            msg = resp.get("message", self.get_lang_message("no_server_message"))
+            logging.warning(self.get_lang_message("logout_failed", message=msg))
+
     def run(self):
         if not self.token:
             logging.error(self.get_lang_message("authentication_failed"))
@@ -281,3 +386,126 @@ class PrivateGPTAgent:
                 print(goodbye_msg, flush=True)
                 logging.info(self.get_lang_message("session_interrupted"))
                 break
+
+
+class AsyncPrivateGPTAgent(PrivateGPTAgent):
+    """
+    asyncio variant of PrivateGPTAgent for ASGI services.
+    Construction does no I/O; call `await agent.start()` once inside the event loop.
+    Payloads and response handling are shared with the synchronous agent.
+    """
+
+    def __init__(self, config):
+        self._init_settings(config)
+        self.network_client = AsyncNetworkClient(self.server_ip, self.server_port, language=self.language)
+        self.token = None
+        self.allowed_groups = []
+        self._login_lock = asyncio.Lock()
+
+    async def start(self):
+        await self.alogin()
+        if self.token:
+            self.allowed_groups = await self.alist_personal_groups()
+            self._check_allowed_groups()
+        return bool(self.token)
+
+    async def alogin(self):
+        logging.info(self.get_lang_message("login_attempt"))
+        try:
+            resp = await self.network_client.send_request(self._login_payload())
+            return self._handle_login_response(resp)
+        except NetworkError as e:
+            logging.error(self.get_lang_message("login_failed", message=str(e)))
+            return False
+
+    async def _relogin(self, expired_token):
+        """Only one coroutine re-logs in; the others wait and reuse the fresh token."""
+        async with self._login_lock:
+            if self.token and self.token != expired_token:
+                return True
+            self.token = None
+            self.token_refreshes += 1
+            return await self.alogin()
+
+    async def arefresh_allowed_groups(self):
+        return self._swap_allowed_groups(await self.alist_personal_groups())
+
+    def start_group_refresh(self, interval):
+        """Wie beim synchronen Agenten, aber als Task im laufenden Event-Loop."""
+        if not interval or interval <= 0 or self._group_refresh is not None:
+            return
+        self._group_refresh = asyncio.get_running_loop().create_task(self._group_refresh_loop(interval))
+
+    async def _group_refresh_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.arefresh_allowed_groups()
+            except Exception as e:
+                logging.warning(f"Group refresh failed: {e}")
+
+    def stop_group_refresh(self):
+        if self._group_refresh is not None:
+            self._group_refresh.cancel()
+            self._group_refresh = None
+
+    async def alist_personal_groups(self):
+        if not self.token:
+            logging.error(self.get_lang_message("authentication_failed"))
+            return []
+
+        try:
+            resp = await self.network_client.send_request(self._list_groups_payload())
+            return self._handle_groups_response(resp)
+        except NetworkError as e:
+            logging.error(self.lang["list_groups_failed"].format(message=str(e)))
+            return []
+
+    async def aquery_private_gpt(self, prompt, use_public=False, language="en", groups=None, _retry_on_token_expired=True):
+        if not self.token:
+            error_msg = self.get_lang_message("authentication_failed")
+            logging.error(error_msg)
+            return json.dumps({"error": error_msg})
+
+        payload, language, lang = self._chat_payload(prompt, use_public, language, groups)
+        try:
+            resp = await self.network_client.send_request(payload)
+
+            if self._token_expired(resp):
+                if not _retry_on_token_expired:
+                    return json.dumps({"error": "Token ungültig, Re-Login fehlgeschlagen."})
+
+                logging.warning("TOKEN REFRESH TRIGGERED! (401/403 or token expired/invalid recognized)")
+                if await self._relogin(payload["token"]):
+                    return await self.aquery_private_gpt(
+                        prompt, use_public, language, groups,
+                        _retry_on_token_expired=False
+                    )
+                else:
+                    return json.dumps({"error": "Automatischer Re-Login ist fehlgeschlagen."})
+
+            return self._chat_result(resp, lang)
+
+        except NetworkError as e:
+            error_msg = lang["agent_error"].format(error=str(e))
+            logging.error(f"❌ {error_msg}")
+            return json.dumps({"error": error_msg})
+
+    async def arespond(self, user_input, groups=None):
+        response = self.knowledge_base.get(user_input, None)
+        if response:
+            return json.dumps({"answer": response})
+        return await self.aquery_private_gpt(user_input, groups=groups)
+
+    async def alogout(self):
+        self.stop_group_refresh()
+        if not self.token:
+            logging.info(self.get_lang_message("no_token_logout"))
+            return
+
+        logging.info(self.get_lang_message("logout_attempt"))
+        try:
+            resp = await self.network_client.send_request(self._logout_payload())
+            self._handle_logout_response(resp)
+        except NetworkError as e:
+            logging.error(self.get_lang_message("logout_failed", message=str(e)))
@@ -0,0 +1,304 @@
+# Python/log_stream.py
+"""
+Log-Dateien streamen statt komplett einzulesen (für die /logs-Endpunkte der Agenten).
+
+- Zeilen-ausgerichtete Tails: rückwärts in Blöcken nach Zeilenumbrüchen suchen
+- ?since=<offset>: nur neu hinzugekommene Bytes ab einem früheren Offset
+- Ausgabe als Chunks (konstanter Speicher, unabhängig von der Log-Größe)
+- Follow-Modus: inotify (Linux, via ctypes) oder Polling; erkennt Rotation/Truncation
+"""
+
+import asyncio
+import codecs
+import ctypes
+import ctypes.util
+import html
+import os
+import select
+import sys
+import time
+
+BLOCK_SIZE = 64 * 1024
+
+# ───────────────────────────────────────────────────────────────
+# Bereich bestimmen
+# ───────────────────────────────────────────────────────────────
+def _tail_lines_offset(f, size, lines):
+    """Offset, an dem die letzten `lines` Zeilen beginnen (Rückwärts-Scan in Blöcken)."""
+    if lines <= 0 or size == 0:
+        return size
+    end = size
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        end -= 1  # abschließender Umbruch beginnt keine neue Zeile
+    count = 0
+    pos = end
+    while pos > 0:
+        step = min(BLOCK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step)
+        idx = len(buf)
+        while True:
+            idx = buf.rfind(b"\n", 0, idx)
+            if idx < 0:
+                break
+            count += 1
+            if count == lines:
+                return pos + idx + 1
+    return 0
+
+def _align_forward(f, start, size):
+    """Erster Zeilenanfang bei oder nach `start`."""
+    if start <= 0:
+        return 0
+    pos = start - 1
+    while pos < size:
+        f.seek(pos)
+        buf = f.read(min(BLOCK_SIZE, size - pos))
+        idx = buf.find(b"\n")
+        if idx >= 0:
+            return pos + idx + 1
+        pos += len(buf)
+    return size
+
+def log_window(path, tail_bytes=None, lines=None, since=None):
+    """
+    Liefert (start, end) in Bytes. `end` ist die Dateigröße zum Zeitpunkt des Aufrufs,
+    so bleibt die Antwort konsistent, auch wenn weiter geschrieben wird.
+    Vorrang: since > lines > tail_bytes > ganze Datei. Tails beginnen immer am Zeilenanfang.
+    Ist `since` größer als die Datei (rotiert/abgeschnitten), wird ab 0 gelesen.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if since is not None and since >= 0:
+            return (since if since <= size else 0), size
+        if lines:
+            return _tail_lines_offset(f, size, int(lines)), size
+        if tail_bytes and tail_bytes > 0:
+            return _align_forward(f, max(0, size - int(tail_bytes)), size), size
+        return 0, size
+
+def iter_log(path, start, end, chunk_size=BLOCK_SIZE):
+    """Bytes [start, end) in Chunks."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            buf = f.read(min(chunk_size, remaining))
+            if not buf:
+                break
+            remaining -= len(buf)
+            yield buf
+
+def iter_log_text(path, start, end, as_html=False, chunk_size=BLOCK_SIZE):
+    """Wie iter_log, aber dekodiert (UTF-8, Multibyte-sicher über Chunk-Grenzen) und optional als <pre>-HTML."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    if as_html:
+        yield "<pre>"
+    for buf in iter_log(path, start, end, chunk_size):
+        text = decoder.decode(buf)
+        if text:
+            yield html.escape(text, quote=False) if as_html else text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield html.escape(tail, quote=False) if as_html else tail
+    if as_html:
+        yield "</pre>"
+
+# ───────────────────────────────────────────────────────────────
+# inotify (nur Linux; sonst Polling)
+# ───────────────────────────────────────────────────────────────
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_MOVE_SELF = 0x00000800
+_IN_DELETE_SELF = 0x00000400
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1
+    except (OSError, AttributeError):
+        _libc = None
+
+class LogFollower:
+    """
+    Verfolgt eine (rotierende) Log-Datei ab `offset`.
+    read_lines() liefert neue, vollständige Zeilen als (End-Offset, Text);
+    wait()/wait_async() blockieren bis zur nächsten Änderung (inotify) oder höchstens `timeout`.
+    """
+
+    def __init__(self, path, offset=0, poll_interval=1.0):
+        self.path = str(path)
+        self.offset = offset
+        self.poll_interval = poll_interval
+        self._fh = None
+        self._ino = None
+        self._pending = b""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._inotify_fd = None
+        self._open()
+
+    # Datei / Watch
+    def _open(self):
+        try:
+            self._fh = open(self.path, "rb")
+        except FileNotFoundError:
+            self._fh = None
+            return
+        st = os.fstat(self._fh.fileno())
+        self._ino = st.st_ino
+        if self.offset > st.st_size:
+            self.offset = 0
+        self._fh.seek(self.offset)
+        self._add_watch()
+
+    def _add_watch(self):
+        if _libc is None:
+            return
+        if self._inotify_fd is None:
+            fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return
+            self._inotify_fd = fd
+        _libc.inotify_add_watch(
+            self._inotify_fd, os.fsencode(self.path),
+            _IN_MODIFY | _IN_ATTRIB | _IN_MOVE_SELF | _IN_DELETE_SELF
+        )
+
+    def _drain_inotify(self):
+        try:
+            while os.read(self._inotify_fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self._ino or st.st_size < self.offset
+
+    # Lesen
+    def read_lines(self):
+        if self._fh is None:
+            self._open()
+            if self._fh is None:
+                return []
+        out = []
+        while True:
+            data = self._fh.read(BLOCK_SIZE)
+            if data:
+                out.extend(self._split(data))
+                continue
+            if self._rotated():
+                # Rest der alten Datei ist gelesen -> neue Datei ab 0
+                self._fh.close()
+                self.offset = 0
+                self._pending = b""
+                self._open()
+                if self._fh is None:
+                    break
+                continue
+            break
+        return out
+
+    def _split(self, data):
+        buf = self._pending + data
+        lines = []
+        start = 0
+        base = self.offset - len(self._pending)
+        while True:
+            idx = buf.find(b"\n", start)
+            if idx < 0:
+                break
+            text = self._decoder.decode(buf[start:idx], final=True).rstrip("\r")
+            lines.append((base + idx + 1, text))
+            start = idx + 1
+        self._pending = buf[start:]
+        self.offset += len(data)
+        return lines
+
+    # Warten
+    def wait(self, timeout):
+        if self._inotify_fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        ready, _, _ = select.select([self._inotify_fd], [], [], min(timeout, max(self.poll_interval, 5.0)))
+        if ready:
+            self._drain_inotify()
+
+    async def wait_async(self, timeout):
+        if self._inotify_fd is None:
+            await asyncio.sleep(min(timeout, self.poll_interval))
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        loop.add_reader(self._inotify_fd, lambda: fut.done() or fut.set_result(None))
+        try:
+            await asyncio.wait_for(fut, min(timeout, max(self.poll_interval, 5.0)))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self._inotify_fd)
+        self._drain_inotify()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+# ───────────────────────────────────────────────────────────────
+# SSE-Follow (sync für Flask/Waitress, async für ASGI)
+# ───────────────────────────────────────────────────────────────
+def _sse_frames(lines):
+    return "".join(f"id: {end}\ndata: {text}\n\n" for end, text in lines)
+
+def iter_follow_sse(follower, max_seconds=300.0, heartbeat=15.0):
+    """
+    SSE-Stream neuer Log-Zeilen; `id` ist der Offset hinter der Zeile (für Last-Event-ID / ?since=).
+    Heartbeat-Kommentare halten Proxys offen und lassen abgebrochene Clients schnell auffallen.
+    """
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    try:
+        while True:
+            lines = follower.read_lines()
+            now = time.monotonic()
+            if lines:
+                yield _sse_frames(lines)
+                last_sent = now
+            elif now - last_sent >= heartbeat:
+                yield ": keepalive\n\n"
+                last_sent = now
+            if now >= deadline:
+                return
+            follower.wait(min(heartbeat, deadline - now))
+    finally:
+        follower.close()
+
+async def aiter_follow_sse(follower, max_seconds=300.0, heartbeat=15.0):
+    deadline = time.monotonic() + max_seconds
+    last_sent = time.monotonic()
+    try:
+        while True:
+            lines = follower.read_lines()
+            now = time.monotonic()
+            if lines:
+                yield _sse_frames(lines)
+                last_sent = now
+            elif now - last_sent >= heartbeat:
+                yield ": keepalive\n\n"
+                last_sent = now
+            if now >= deadline:
+                return
+            await follower.wait_async(min(heartbeat, deadline - now))
+    finally:
+        follower.close()
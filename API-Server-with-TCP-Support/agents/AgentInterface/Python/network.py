@@ -1,3 +1,4 @@
+import asyncio
 import socket
 import ssl
 import json
@@ -152,3 +153,75 @@ class NetworkClient:
         # Nach allen Versuchen fehlgeschlagen
         logging.error(self.get_lang_message("all_retries_failed"))
         raise NetworkError(self.get_lang_message("all_retries_failed"))
+
+
+class AsyncNetworkClient(NetworkClient):
+    """
+    asyncio variant of NetworkClient for the ASGI agents.
+    Same wire protocol (one JSON line per connection, response until EOF) and retry policy,
+    but no thread is blocked while waiting for the MCP server.
+    """
+
+    async def send_request(self, payload):
+        payload_bytes = (json.dumps(payload) + '\n').encode("utf-8")
+
+        ssl_context = None
+        if self.use_ssl:
+            ssl_context = ssl.create_default_context()
+            if self.accept_self_signed:
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+
+        for attempt in range(1, self.retries + 1):
+            writer = None
+            try:
+                logging.debug(
+                    self.get_lang_message(
+                        "connecting_to_server",
+                        ip=self.server_ip,
+                        port=self.server_port,
+                        attempt=attempt,
+                        retries=self.retries
+                    )
+                )
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(
+                        self.server_ip, self.server_port,
+                        ssl=ssl_context,
+                        server_hostname=self.server_ip if ssl_context else None
+                    ),
+                    timeout=30
+                )
+                writer.write(payload_bytes)
+                await writer.drain()
+
+                # Alle Daten empfangen, bis der Server von sich aus schließt
+                response = await asyncio.wait_for(reader.read(), timeout=30)
+                decoded = response.decode("utf-8").strip()
+                if not decoded:
+                    raise ValueError("Empty response received")
+
+                try:
+                    return json.loads(decoded)
+                except json.JSONDecodeError:
+                    logging.error(self.get_lang_message("invalid_json_response"))
+                    raise NetworkError(self.get_lang_message("invalid_json_response"))
+
+            except asyncio.TimeoutError:
+                logging.warning(self.get_lang_message("connection_timed_out"))
+            except Exception as e:
+                logging.error(self.get_lang_message("connection_error", error=str(e)))
+            finally:
+                if writer is not None:
+                    writer.close()
+                    try:
+                        await writer.wait_closed()
+                    except Exception:
+                        pass
+
+            if attempt < self.retries:
+                logging.info(self.get_lang_message("retrying_in_seconds", delay=self.delay))
+                await asyncio.sleep(self.delay)
+
+        logging.error(self.get_lang_message("all_retries_failed"))
+        raise NetworkError(self.get_lang_message("all_retries_failed"))
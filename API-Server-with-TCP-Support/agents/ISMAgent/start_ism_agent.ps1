@@ -1,6 +1,9 @@
 param(
     [string]$ConfigPath = "agents\ISMAgent\config.json",
     [switch]$VerboseLog = $false,
+    [switch]$Batch = $false,
+    [switch]$Delta = $false,
+    [switch]$Daemon = $false,
     [string]$Language = "",
     [double]$Delay = 0.5
 )
@@ -24,6 +27,9 @@ $argList = @(
 )
 
 if ($VerboseLog) { $argList += "--verbose" }
+if ($Batch) { $argList += "--batch" }
+if ($Delta) { $argList += "--delta" }
+if ($Daemon) { $argList += "--daemon" }
 if ($Language -ne "") { $argList += @("--language", $Language) }
 if ($Delay -ne $null) {
     $argList += @("--delay", ($Delay.ToString([System.Globalization.CultureInfo]::InvariantCulture)))
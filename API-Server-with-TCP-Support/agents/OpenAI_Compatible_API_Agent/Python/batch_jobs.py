@@ -0,0 +1,508 @@
+"""
+Batch-API (/v1/files, /v1/batches) nach dem Vorbild der OpenAI Batch API
+
+Offline-Lasten (Zusammenfassen, Klassifizieren vieler Dokumente) schicken eine JSONL-Datei
+mit Requests statt tausender einzelner /chat/completions-Aufrufe:
+- POST /files (purpose=batch) lädt die Datei hoch, POST /batches startet den Job
+- Jobs, Dateien und Ergebnisse liegen in SQLite; Status per GET /batches/{id},
+  Ergebnisse als JSONL per GET /files/{output_file_id}/content
+- Pro Batch arbeiten `batch_concurrency` Worker die Zeilen ab, höchstens
+  `batch_max_running` Batches laufen gleichzeitig (weitere warten)
+- Jobs gehören dem API-Key, der sie angelegt hat (SHA-256 als Besitzer)
+
+Der API-Key wird nur im Speicher gehalten. Nach einem Neustart läuft ein unterbrochener
+Batch weiter, sobald sein Besitzer den Status abfragt.
+
+Der Runner läuft im Event-Loop (ohne Lock). SQLite-Zugriffe laufen über BatchStore.run in
+einem eigenen Thread des Stores (eine Verbindung, Aufrufe nacheinander), das Prüfen der
+Eingabedatei im Thread-Pool: große Uploads und Batches blockieren /chat/completions nicht.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.responses import Response
+
+ENDPOINTS = ("/v1/chat/completions", "/v1/completions")
+COMPLETION_WINDOW = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id          TEXT PRIMARY KEY,
+    owner       TEXT NOT NULL,
+    purpose     TEXT NOT NULL,
+    filename    TEXT NOT NULL,
+    created_at  INTEGER NOT NULL,
+    content     BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id                TEXT PRIMARY KEY,
+    owner             TEXT NOT NULL,
+    endpoint          TEXT NOT NULL,
+    input_file_id     TEXT NOT NULL,
+    completion_window TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    metadata          TEXT,
+    output_file_id    TEXT,
+    error_file_id     TEXT,
+    created_at        INTEGER NOT NULL,
+    in_progress_at    INTEGER,
+    finalizing_at     INTEGER,
+    completed_at      INTEGER,
+    cancelling_at     INTEGER,
+    cancelled_at      INTEGER
+);
+CREATE TABLE IF NOT EXISTS batch_requests (
+    batch_id   TEXT NOT NULL,
+    line_no    INTEGER NOT NULL,
+    custom_id  TEXT NOT NULL,
+    body       TEXT NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'pending',
+    result     TEXT,
+    PRIMARY KEY (batch_id, line_no)
+);
+CREATE INDEX IF NOT EXISTS batches_owner ON batches (owner);
+"""
+
+_ACTIVE = ("validating", "in_progress", "finalizing", "cancelling")
+
+
+class BatchRequestError(Exception):
+    """Fehler einer einzelnen Batch-Zeile (landet in der Fehler-Datei, der Batch läuft weiter)."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def owner_for(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def parse_batch_file(content: bytes, endpoint: str):
+    """JSONL prüfen -> [(custom_id, body)]; HTTP 400 mit Zeilennummer bei ungültigen Zeilen."""
+    lines = []
+    seen = set()
+    for line_no, raw in enumerate(content.decode("utf-8").splitlines(), start=1):
+        if not raw.strip():
+            continue
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: invalid JSON")
+        custom_id = entry.get("custom_id") if isinstance(entry, dict) else None
+        if not custom_id or custom_id in seen:
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: missing or duplicate custom_id")
+        if entry.get("method", "POST") != "POST" or entry.get("url") != endpoint:
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: method/url must be POST {endpoint}")
+        if not isinstance(entry.get("body"), dict):
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: body must be an object")
+        seen.add(custom_id)
+        lines.append((custom_id, entry["body"]))
+    if not lines:
+        raise HTTPException(status_code=400, detail="Input file contains no requests")
+    return lines
+
+
+# Store
+class BatchStore:
+    def __init__(self, path):
+        self.path = str(path)
+        # Enthält Prompts und Antworten -> nur für den Besitzer lesbar
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # ein Thread = die Verbindung wird nie parallel benutzt
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-store")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("batch_db_path", "batches.db"))
+
+    async def run(self, method, *args):
+        """Store-Methode im Thread des Stores ausführen (aus dem Event-Loop)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+    # Dateien
+    def create_file(self, owner, filename, purpose, content: bytes) -> dict:
+        file_id = f"file-{uuid.uuid4().hex}"
+        self._conn.execute(
+            "INSERT INTO files (id, owner, purpose, filename, created_at, content) VALUES (?, ?, ?, ?, ?, ?)",
+            (file_id, owner, purpose, filename, _now(), content)
+        )
+        return self.get_file(owner, file_id)
+
+    def get_file(self, owner, file_id) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT id, purpose, filename, created_at, length(content) FROM files WHERE id = ? AND owner = ?",
+            (file_id, owner)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "object": "file", "purpose": row[1], "filename": row[2],
+                "created_at": row[3], "bytes": row[4], "status": "processed"}
+
+    def file_content(self, owner, file_id) -> Optional[bytes]:
+        row = self._conn.execute(
+            "SELECT content FROM files WHERE id = ? AND owner = ?", (file_id, owner)
+        ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    # Batches
+    def create_batch(self, owner, input_file_id, endpoint, completion_window, metadata, lines) -> dict:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT INTO batches (id, owner, endpoint, input_file_id, completion_window, status, metadata, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'validating', ?, ?)",
+                (batch_id, owner, endpoint, input_file_id, completion_window,
+                 json.dumps(metadata) if metadata is not None else None, _now())
+            )
+            conn.executemany(
+                "INSERT INTO batch_requests (batch_id, line_no, custom_id, body) VALUES (?, ?, ?, ?)",
+                [(batch_id, line_no, custom_id, json.dumps(body)) for line_no, (custom_id, body) in enumerate(lines)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_batch(owner, batch_id)
+
+    def _batch_object(self, row) -> dict:
+        (batch_id, endpoint, input_file_id, completion_window, status, metadata, output_file_id,
+         error_file_id, created_at, in_progress_at, finalizing_at, completed_at, cancelling_at, cancelled_at) = row
+        counts = dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM batch_requests WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall())
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": status,
+            "output_file_id": output_file_id,
+            "error_file_id": error_file_id,
+            "created_at": created_at,
+            "in_progress_at": in_progress_at,
+            "expires_at": created_at + COMPLETION_WINDOW,
+            "finalizing_at": finalizing_at,
+            "completed_at": completed_at,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": cancelling_at,
+            "cancelled_at": cancelled_at,
+            "request_counts": {
+                "total": sum(counts.values()),
+                "completed": counts.get("completed", 0),
+                "failed": counts.get("failed", 0),
+            },
+            "metadata": json.loads(metadata) if metadata else None,
+        }
+
+    _BATCH_COLUMNS = ("id, endpoint, input_file_id, completion_window, status, metadata, output_file_id, "
+                      "error_file_id, created_at, in_progress_at, finalizing_at, completed_at, cancelling_at, cancelled_at")
+
+    def get_batch(self, owner, batch_id) -> Optional[dict]:
+        row = self._conn.execute(
+            f"SELECT {self._BATCH_COLUMNS} FROM batches WHERE id = ? AND owner = ?", (batch_id, owner)
+        ).fetchone()
+        return None if row is None else self._batch_object(row)
+
+    def list_batches(self, owner, limit=20, after=None) -> list:
+        # rowid = Anlagereihenfolge (created_at hat nur Sekunden-Auflösung)
+        if after:
+            rows = self._conn.execute(
+                f"SELECT {self._BATCH_COLUMNS} FROM batches WHERE owner = ? AND rowid < "
+                "(SELECT rowid FROM batches WHERE id = ?) ORDER BY rowid DESC LIMIT ?",
+                (owner, after, limit)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                f"SELECT {self._BATCH_COLUMNS} FROM batches WHERE owner = ? ORDER BY rowid DESC LIMIT ?",
+                (owner, limit)
+            ).fetchall()
+        return [self._batch_object(row) for row in rows]
+
+    def set_status(self, batch_id, status, timestamp_column=None):
+        if timestamp_column:
+            self._conn.execute(
+                f"UPDATE batches SET status = ?, {timestamp_column} = COALESCE({timestamp_column}, ?) WHERE id = ?",
+                (status, _now(), batch_id)
+            )
+        else:
+            self._conn.execute("UPDATE batches SET status = ? WHERE id = ?", (status, batch_id))
+
+    def status(self, batch_id) -> Optional[str]:
+        row = self._conn.execute("SELECT status FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def pending_requests(self, batch_id) -> list:
+        return self._conn.execute(
+            "SELECT line_no, custom_id, body FROM batch_requests WHERE batch_id = ? AND status = 'pending' ORDER BY line_no",
+            (batch_id,)
+        ).fetchall()
+
+    def finish_request(self, batch_id, line_no, status, result: dict):
+        self._conn.execute(
+            "UPDATE batch_requests SET status = ?, result = ? WHERE batch_id = ? AND line_no = ?",
+            (status, json.dumps(result), batch_id, line_no)
+        )
+
+    def fail_pending(self, batch_id, code, message):
+        """Zeilen, die kein Worker mehr bearbeitet hat, als fehlgeschlagen abschließen."""
+        rows = self._conn.execute(
+            "SELECT line_no, custom_id FROM batch_requests WHERE batch_id = ? AND status = 'pending'", (batch_id,)
+        ).fetchall()
+        results = []
+        for line_no, custom_id in rows:
+            request_id = f"batch_req_{uuid.uuid4().hex}"
+            result = {"id": request_id, "custom_id": custom_id, "response": None,
+                      "error": {"code": code, "message": message}}
+            results.append((json.dumps(result), batch_id, line_no))
+        self._conn.executemany(
+            "UPDATE batch_requests SET status = 'failed', result = ? WHERE batch_id = ? AND line_no = ?", results
+        )
+
+    def finalize(self, owner, batch_id, status, timestamp_column):
+        """Ergebnis- und Fehler-Datei (JSONL, in Eingabe-Reihenfolge) schreiben und Status setzen."""
+        self.set_status(batch_id, "finalizing", "finalizing_at")
+        output, errors = [], []
+        for status_, result in self._conn.execute(
+            "SELECT status, result FROM batch_requests WHERE batch_id = ? AND status != 'pending' ORDER BY line_no",
+            (batch_id,)
+        ):
+            (output if status_ == "completed" else errors).append(result)
+        # Ein erneuter Abschluss (Neustart in "finalizing") überschreibt die vorhandenen Dateien
+        output_file_id, error_file_id = self._conn.execute(
+            "SELECT output_file_id, error_file_id FROM batches WHERE id = ?", (batch_id,)
+        ).fetchone()
+        output_file_id = self._write_result_file(owner, output_file_id, f"{batch_id}_output.jsonl", output)
+        error_file_id = self._write_result_file(owner, error_file_id, f"{batch_id}_errors.jsonl", errors)
+        self._conn.execute(
+            "UPDATE batches SET output_file_id = ?, error_file_id = ? WHERE id = ?",
+            (output_file_id, error_file_id, batch_id)
+        )
+        self.set_status(batch_id, status, timestamp_column)
+
+    def _write_result_file(self, owner, file_id, filename, results) -> Optional[str]:
+        if not results:
+            return file_id
+        content = ("\n".join(results) + "\n").encode("utf-8")
+        if file_id is not None:
+            self._conn.execute("UPDATE files SET content = ? WHERE id = ?", (content, file_id))
+            return file_id
+        return self.create_file(owner, filename, "batch_output", content)["id"]
+
+
+# Runner
+class BatchRunner:
+    """
+    Arbeitet Batches im Hintergrund ab. make_worker() liefert pro Worker ein async callable
+    worker(endpoint, body) -> Antwort-Body (optional mit close()); es wird für alle Zeilen
+    dieses Workers wiederverwendet (z. B. ein Login pro Worker).
+    """
+
+    def __init__(self, store: BatchStore, concurrency=4, max_running=2):
+        self.store = store
+        self.concurrency = max(1, int(concurrency))
+        self._slots = asyncio.Semaphore(max(1, int(max_running)))
+        self._tasks = {}  # batch_id -> Task
+        self._cancelled = set()
+
+    @classmethod
+    def from_config(cls, store, config):
+        return cls(store, concurrency=config.get("batch_concurrency", 4),
+                   max_running=config.get("batch_max_running", 2))
+
+    def is_running(self, batch_id) -> bool:
+        return batch_id in self._tasks
+
+    def start(self, owner, batch_id, make_worker):
+        if batch_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(owner, batch_id, make_worker))
+        self._tasks[batch_id] = task
+        task.add_done_callback(lambda _: self._done(batch_id))
+
+    def _done(self, batch_id):
+        self._tasks.pop(batch_id, None)
+        self._cancelled.discard(batch_id)
+
+    def cancel(self, batch_id) -> bool:
+        """
+        Laufende Worker nehmen keine weiteren Zeilen an; begonnene Zeilen werden fertig.
+        False, wenn der Batch nicht läuft (der Aufrufer schließt ihn dann selbst ab).
+        """
+        if batch_id not in self._tasks:
+            return False
+        self._cancelled.add(batch_id)
+        return True
+
+    async def _run(self, owner, batch_id, make_worker):
+        store = self.store
+        async with self._slots:
+            batch = await store.run(store.get_batch, owner, batch_id)
+            if batch["status"] == "finalizing":
+                # Neustart während des Abschlusses: nur die Ergebnis-Dateien neu schreiben
+                cancelled = batch["cancelling_at"] is not None
+                await store.run(store.finalize, owner, batch_id, *(
+                    ("cancelled", "cancelled_at") if cancelled else ("completed", "completed_at")))
+                return
+            if batch["status"] != "cancelling":
+                await store.run(store.set_status, batch_id, "in_progress", "in_progress_at")
+                queue = asyncio.Queue()
+                for row in await store.run(store.pending_requests, batch_id):
+                    queue.put_nowait(row)
+                workers = min(self.concurrency, queue.qsize())
+                # Fehler eines Workers (z. B. beim Anlegen) beenden nicht den ganzen Batch
+                outcomes = await asyncio.gather(
+                    *(self._work(batch_id, batch["endpoint"], queue, make_worker) for _ in range(workers)),
+                    return_exceptions=True
+                )
+                errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+                if errors and batch_id not in self._cancelled:
+                    # Zeilen, die liegen geblieben sind, weil alle Worker ausgefallen sind
+                    await store.run(store.fail_pending, batch_id, "worker_error", str(errors[0]))
+            if batch_id in self._cancelled or await store.run(store.status, batch_id) == "cancelling":
+                await store.run(store.finalize, owner, batch_id, "cancelled", "cancelled_at")
+            else:
+                await store.run(store.finalize, owner, batch_id, "completed", "completed_at")
+
+    async def _work(self, batch_id, endpoint, queue, make_worker):
+        worker = await make_worker()
+        try:
+            while not queue.empty() and batch_id not in self._cancelled:
+                line_no, custom_id, body = queue.get_nowait()
+                request_id = f"batch_req_{uuid.uuid4().hex}"
+                try:
+                    # Antworten enthalten pydantic-Modelle (Message, Tool-Calls)
+                    response = jsonable_encoder(await worker(endpoint, json.loads(body)))
+                    result = {"id": request_id, "custom_id": custom_id,
+                              "response": {"status_code": 200, "request_id": request_id, "body": response},
+                              "error": None}
+                    await self.store.run(self.store.finish_request, batch_id, line_no, "completed", result)
+                except Exception as e:
+                    code = e.code if isinstance(e, BatchRequestError) else type(e).__name__
+                    result = {"id": request_id, "custom_id": custom_id, "response": None,
+                              "error": {"code": code, "message": str(e)}}
+                    await self.store.run(self.store.finish_request, batch_id, line_no, "failed", result)
+        finally:
+            close = getattr(worker, "close", None)
+            if close is not None:
+                await close()
+
+
+# Routen
+class BatchCreateRequest(BaseModel):
+    input_file_id: str
+    endpoint: str
+    completion_window: str = "24h"
+    metadata: Optional[dict] = None
+
+
+def create_batch_router(store: BatchStore, runner: BatchRunner, auth_dependency, make_worker,
+                        max_file_bytes=100 * 1024 * 1024) -> APIRouter:
+    """
+    Router mit /files und /batches. auth_dependency liefert den API-Key des Clients,
+    make_worker(api_key) die Worker-Fabrik für BatchRunner.start.
+    """
+    router = APIRouter()
+
+    def _resume(api_key, batch):
+        # Nach einem Neustart: unterbrochenen Batch mit dem Key seines Besitzers fortsetzen
+        if batch["status"] in _ACTIVE and not runner.is_running(batch["id"]):
+            runner.start(owner_for(api_key), batch["id"], make_worker(api_key))
+
+    @router.post("/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form("batch"),
+                          api_key: str = Depends(auth_dependency)):
+        if purpose != "batch":
+            raise HTTPException(status_code=400, detail="Only purpose 'batch' is supported")
+        content = await file.read(max_file_bytes + 1)
+        if len(content) > max_file_bytes:
+            raise HTTPException(status_code=413, detail="File too large")
+        return await store.run(store.create_file, owner_for(api_key), file.filename or "batch.jsonl", purpose, content)
+
+    @router.get("/files/{file_id}")
+    async def get_file(file_id: str, api_key: str = Depends(auth_dependency)):
+        entry = await store.run(store.get_file, owner_for(api_key), file_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return entry
+
+    @router.get("/files/{file_id}/content")
+    async def get_file_content(file_id: str, api_key: str = Depends(auth_dependency)):
+        content = await store.run(store.file_content, owner_for(api_key), file_id)
+        if content is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return Response(content, media_type="application/jsonl")
+
+    @router.post("/batches")
+    async def create_batch(request: BatchCreateRequest, api_key: str = Depends(auth_dependency)):
+        if request.endpoint not in ENDPOINTS:
+            raise HTTPException(status_code=400, detail=f"endpoint must be one of {', '.join(ENDPOINTS)}")
+        if request.completion_window != "24h":
+            raise HTTPException(status_code=400, detail="completion_window must be '24h'")
+        owner = owner_for(api_key)
+        content = await store.run(store.file_content, owner, request.input_file_id)
+        if content is None:
+            raise HTTPException(status_code=404, detail="Input file not found")
+        lines = await asyncio.to_thread(parse_batch_file, content, request.endpoint)
+        batch = await store.run(store.create_batch, owner, request.input_file_id, request.endpoint,
+                                request.completion_window, request.metadata, lines)
+        runner.start(owner, batch["id"], make_worker(api_key))
+        return batch
+
+    @router.get("/batches")
+    async def list_batches(limit: int = 20, after: Optional[str] = None, api_key: str = Depends(auth_dependency)):
+        batches = await store.run(store.list_batches, owner_for(api_key), max(1, min(limit, 100)), after)
+        return {
+            "object": "list",
+            "data": batches,
+            "first_id": batches[0]["id"] if batches else None,
+            "last_id": batches[-1]["id"] if batches else None,
+            "has_more": len(batches) == max(1, min(limit, 100)),
+        }
+
+    @router.get("/batches/{batch_id}")
+    async def get_batch(batch_id: str, api_key: str = Depends(auth_dependency)):
+        batch = await store.run(store.get_batch, owner_for(api_key), batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        _resume(api_key, batch)
+        return batch
+
+    @router.post("/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str, api_key: str = Depends(auth_dependency)):
+        owner = owner_for(api_key)
+        batch = await store.run(store.get_batch, owner, batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if batch["status"] in ("validating", "in_progress"):
+            await store.run(store.set_status, batch_id, "cancelling", "cancelling_at")
+            if not runner.cancel(batch_id):
+                await store.run(store.finalize, owner, batch_id, "cancelled", "cancelled_at")
+        return await store.run(store.get_batch, owner, batch_id)
+
+    return router
@@ -1,20 +1,18 @@
 import asyncio
+import functools
+import hashlib
 import json
 import re
+import threading
 import time
+from collections import OrderedDict
 
 import tiktoken
+from fastapi import Header, HTTPException
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Mapping
 
-from agents.AgentInterface.Python.agent import PrivateGPTAgent
-from agents.OpenAI_Compatible_API_Agent.Python.privategpt_api import PrivateGPTAPI
-
-
-class ChatInstance:
-    def __init__(self, api_key: str, agent: PrivateGPTAgent | PrivateGPTAPI):
-        self.api_key = api_key
-        self.agent = agent
+from agents.OpenAI_Compatible_API_Agent.Python.tool_calls import clean_response, parse_tool_calls
 
 
 # data models
@@ -66,6 +64,42 @@ class CompletionRequest(BaseModel):
 
 
 
+# Authentifizierung
+# Der API-Key kommt pro Request über eine Dependency aus dem Header (kein threading.local:
+# im Event-Loop teilen sich alle gleichzeitigen Requests denselben Thread).
+# Kein Cache: Klartext-Keys werden nicht über den Request hinaus gehalten.
+def parse_authorization(authorization: str) -> Optional[str]:
+    """'Bearer <key>' -> '<key>'; HTTP 401 bei anderem Schema (wie verify_api_key in openai_mcp_api)."""
+    scheme, _, token = authorization.strip().partition(" ")
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="Authorization scheme must be 'Bearer'")
+    return token.strip() or None
+
+
+def get_client_api_key(authorization: Optional[str] = Header(None)) -> str:
+    """FastAPI-Dependency: API-Key des aufrufenden Clients."""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    token = parse_authorization(authorization)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Invalid Authorization header format")
+    return token
+
+
+# Token-Zählung
+TOKEN_ENCODING = "o200k_base"
+TOKEN_MEMO_MAX = 8192           # gemerkte Zählungen einzelner Nachrichten
+TOKENIZE_OFFLOAD_CHARS = 32768  # ab dieser Textlänge wird im Threadpool gezählt
+
+_token_memo = OrderedDict()  # (Encoding, Digest des Textes) -> Anzahl Tokens, älteste zuerst
+_token_memo_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(encoding_name: str):
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens(user_input, answer):
     """
     Calculate the number of tokens used by the user input and the assistant's answer.
@@ -78,70 +112,99 @@ def num_tokens(user_input, answer):
         tuple: A tuple containing the number of tokens used by the user input,
                the assistant's answer, and the total number of tokens.
     """
-    num_tokens_request = num_tokens_from_string(user_input, "o200k_base")
-    num_tokens_reply = num_tokens_from_string(answer, "o200k_base")
+    num_tokens_request = num_tokens_from_string(user_input, TOKEN_ENCODING)
+    num_tokens_reply = num_tokens_from_string(answer, TOKEN_ENCODING)
     num_tokens_overall = num_tokens_request + num_tokens_reply
 
     return num_tokens_request, num_tokens_reply, num_tokens_overall
 
 
-def num_tokens_from_string(string: str, encoding_name: str) -> int:
+def num_tokens_from_string(string: str, encoding_name: str = TOKEN_ENCODING) -> int:
     """Returns the number of tokens in a text string."""
-    return len(tiktoken.get_encoding(encoding_name).encode(string))
+    return len(_encoding(encoding_name).encode_ordinary(string))
+
+
+def _memo_tokens(text: str, encoding_name: str = TOKEN_ENCODING) -> int:
+    """Wie num_tokens_from_string, aber gemerkt (LRU): der Verlauf kommt bei jedem Turn erneut mit."""
+    key = (encoding_name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+    with _token_memo_lock:
+        count = _token_memo.get(key)
+        if count is not None:
+            _token_memo.move_to_end(key)
+            return count
+    count = num_tokens_from_string(text, encoding_name)
+    with _token_memo_lock:
+        _token_memo[key] = count
+        if len(_token_memo) > TOKEN_MEMO_MAX:
+            _token_memo.popitem(last=False)
+    return count
+
+
+def message_tokens(messages) -> int:
+    """Prompt-Tokens eines Nachrichtenverlaufs; nur neue Nachrichten werden tatsächlich tokenisiert."""
+    return sum(
+        _memo_tokens(json.dumps({'role': message.role, 'content': message.content}))
+        for message in messages or []
+    )
+
+
+def _chat_prompt_tokens(request) -> int:
+    return message_tokens(request.messages)
+
+
+def _completion_prompt_tokens(request) -> int:
+    return _memo_tokens(request.prompt or "")
+
+
+def _prompt_chars(request) -> int:
+    if getattr(request, "messages", None):
+        return sum(len(message.content or "") for message in request.messages)
+    return len(getattr(request, "prompt", "") or "")
+
+
+def _usage(prompt_tokens: int, answer: str) -> dict:
+    # gemerkt: Antworten aus dem Antwort-Cache werden nicht erneut tokenisiert
+    completion_tokens = _memo_tokens(answer)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+async def _off_loop(request, answer, fn, *args):
+    """fn(*args) bei großen Texten im Threadpool ausführen (tiktoken blockiert sonst den Event-Loop)."""
+    if _prompt_chars(request) + len(answer or "") > TOKENIZE_OFFLOAD_CHARS:
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+    return fn(*args)
+
+
+async def respond_off_loop(fn, response, request):
+    """_resp_sync / _resp_sync_completions aus einem async-Handler; große Prompts im Threadpool."""
+    return await _off_loop(request, response.get("answer", ""), fn, response, request)
 
 
 def _resp_sync(response: json, request):
-    user_input = ""
-    reply = {}
-    for message in request.messages:
-        user_input += json.dumps({'role': message.role, 'content': message.content})
-    num_tokens_request, num_tokens_reply, num_tokens_overall = num_tokens(user_input, response["answer"])
+    usage = _usage(_chat_prompt_tokens(request), response["answer"])
     id = response.get("chatId", "0")
     citations = []
     if "sources" in response:
         citations = response["sources"]
 
-    tool_calls= None
-    if "tool_call" in response:
-        try:
-            print(response["tool_call"])
-            tool= json.loads(response["tool_call"])
-            if "arguments" in tool:
-                arguments = tool["arguments"] #  '{"operation":"multiply","a":"123","b":"4324"}'
-                parsed_arguments = json.loads(json.dumps(arguments).strip("\""))
-                print("found arguments")
-                print(parsed_arguments)
-            elif "params" in tool:
-                parsed_arguments =  json.loads(json.dumps(tool["params"]).strip("\""))
-                print("found params")
-                print(parsed_arguments)
-            else:
-                try:
-                    parsed_arguments = tool["params"]
-                except:
-                    try:
-                        parsed_arguments = json.loads(tool)
-                    except:
-                        parsed_arguments = tool
-            name = "tool"
-            if "name" in tool:
-                name = tool["name"] #'calculator'
-            if "method" in tool:
-                name = tool["method"] #'calculator'
-
-            function = Function(arguments=json.dumps(parsed_arguments), name=name, parsed_arguments=parsed_arguments)
-            tool_call = ChatCompletionMessageToolCall(id=id, function=function, type="function")
-            print("Tool Call: " + str(tool_call))
-            if tool_calls is None:
-                tool_calls = []
-            tool_calls.append(tool_call)
-
-        except Exception as e:
-            print("Tool Call error: " + str(e))
-
-
-
-           
+    tool_calls = None
+    calls = response.get("tool_call")
+    if isinstance(calls, str):
+        calls = parse_tool_calls(calls)  # Backends, die noch den Rohtext liefern
+    if calls:
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=id if i == 0 else f"{id}_{i}",
+                function=Function(arguments=call.arguments_json(), name=call.name, parsed_arguments=call.arguments),
+                type="function"
+            )
+            for i, call in enumerate(calls)
+        ]
+
     return {
         "id": id,
         "object": "chat.completion",
@@ -149,63 +212,134 @@ def _resp_sync(response: json, request):
         "model": request.model,
         "choices": [{"message": Message(role="assistant", content=clean_response(str(response["answer"])), tool_calls=tool_calls)}],
         "citations": citations,
-        "usage": {
-            "prompt_tokens": num_tokens_request,
-            "completion_tokens": num_tokens_reply,
-            "total_tokens": num_tokens_overall
-        }
+        "usage": usage
     }
 
 
-def clean_response(response):
-    # Remove artefacts from reply here
-    response = response.replace("[TOOL_CALLS] ", "")
-    if "```json" in response:
-        response = response.replace("'''json", "").replace("'''", "")
-    return response
+# Streaming
+# Antworten werden nicht mehr Wort für Wort mit Pause "gestreamt":
+# - dict (Backend liefert nur die fertige Antwort, z. B. PrivateGPT): ein einziger Chunk, sofort
+# - async iterable von Text-Stücken (z. B. vLLM): Weitergabe, sobald das Backend liefert;
+#   kleine Stücke werden gesammelt, bis stream_coalesce_bytes erreicht sind oder das älteste
+#   Stück stream_coalesce_ms alt ist (0 = jedes Stück sofort senden)
+STREAM_COALESCE = {"max_bytes": 256, "max_delay": 0.05}
 
-async def _resp_async_generator(response: json, request):
-    user_input = ""
-    for message in request.messages:
-            user_input += json.dumps({'role': message.role, 'content': message.content})
 
+def configure_streaming(max_bytes=None, max_ms=None):
+    """Coalescing für alle Streaming-Antworten setzen (z. B. aus der Server-Konfiguration)."""
+    if max_bytes is not None:
+        STREAM_COALESCE["max_bytes"] = max(0, int(max_bytes))
+    if max_ms is not None:
+        STREAM_COALESCE["max_delay"] = max(0.0, float(max_ms) / 1000.0)
 
-    num_tokens_request, num_tokens_reply, num_tokens_overall = num_tokens(user_input, response["answer"])
 
-    tokens = response["answer"].split(" ")
-    citations = []
-    if "sources" in response:
-        citations = response["sources"]
+async def coalesce(pieces, max_bytes=None, max_delay=None):
+    """
+    Text-Stücke aus `pieces` (async iterable) zusammenfassen. Ein Block wird gesendet, sobald
+    er max_bytes (UTF-8) erreicht oder sein erstes Stück max_delay Sekunden wartet – auch
+    wenn das Backend gerade nichts liefert.
+    """
+    max_bytes = STREAM_COALESCE["max_bytes"] if max_bytes is None else max_bytes
+    max_delay = STREAM_COALESCE["max_delay"] if max_delay is None else max_delay
+    loop = asyncio.get_running_loop()
+    iterator = pieces.__aiter__()
+    buffer, size, first = [], 0, 0.0
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, first + max_delay - loop.time()) if buffer else None
+            done, _ = await asyncio.wait((pending,), timeout=timeout)
+            if not done:
+                # Zeit abgelaufen, das nächste Stück läuft weiter
+                yield "".join(buffer)
+                buffer, size = [], 0
+                continue
+            task, pending = pending, None
+            try:
+                piece = task.result()
+            except StopAsyncIteration:
+                break
+            if not piece:
+                continue
+            if not buffer:
+                first = loop.time()
+            buffer.append(piece)
+            size += len(piece.encode("utf-8"))
+            if size >= max_bytes or max_delay <= 0:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def _request_usage(request, answer, prompt_tokens):
+    return _usage(prompt_tokens(request), answer)
+
+
+async def _stream_chunks(response, make_chunk, request, prompt_tokens, on_usage=None):
+    """
+    Gemeinsamer Ablauf beider Streaming-Endpunkte. make_chunk(i, text, citations, usage, finish_reason)
+    baut das Chunk-Dict; Usage wird einmal pro Antwort berechnet und mit dem letzten Chunk gesendet
+    (und an on_usage(usage) übergeben, z. B. für Metriken).
+    """
+    if isinstance(response, Mapping):
+        answer = response["answer"]
+        usage = await _off_loop(request, answer, _request_usage, request, answer, prompt_tokens)
+        if on_usage is not None:
+            on_usage(usage)
+        chunk = make_chunk(0, answer, response.get("sources", []), usage, "stop")
+        yield f"data: {json.dumps(chunk)}\n\n"
+    else:
+        parts = []
+        i = 0
+        async for text in coalesce(response):
+            parts.append(text)
+            yield f"data: {json.dumps(make_chunk(i, text, [], None, None))}\n\n"
+            i += 1
+        answer = "".join(parts)
+        usage = await _off_loop(request, answer, _request_usage, request, answer, prompt_tokens)
+        if on_usage is not None:
+            on_usage(usage)
+        yield f"data: {json.dumps(make_chunk(i, '', [], usage, 'stop'))}\n\n"
+    yield "data: [DONE]\n\n"
+
 
-    for i, token in enumerate(tokens):
+async def _resp_async_generator(response, request, on_usage=None):
+    """
+    Streaming für /chat/completions. `response` ist entweder das fertige Antwort-Dict
+    oder ein async iterable von Text-Stücken (siehe coalesce).
+    """
+    def make_chunk(i, text, citations, usage, finish_reason):
         chunk = {
             "id": i,
             "object": "chat.completion.chunk",
             "created": time.time(),
             "model": request.model,
-            "choices": [{"delta": {"content": token + " "}}],
+            "choices": [{"delta": {"content": text}, "finish_reason": finish_reason}],
             "citations": citations,
-            "usage": {
-                "prompt_tokens": num_tokens_request,
-                "completion_tokens": num_tokens_reply,
-                "total_tokens": num_tokens_overall
-            }
         }
-        yield f"data: {json.dumps(chunk)}\n\n"
-        await asyncio.sleep(0.05)
-    yield "data: [DONE]\n\n"
+        if usage is not None:
+            chunk["usage"] = usage
+        return chunk
+
+    async for line in _stream_chunks(response, make_chunk, request, _chat_prompt_tokens, on_usage):
+        yield line
 
 
 
 # Legacy Completions API
 def _resp_sync_completions(response: json, request):
-    user_input = request.prompt
     reply = [{"text": response["answer"],
             "index": 0,
             "logprobs": None,
             "finish_reason": "length"}]
 
-    num_tokens_request, num_tokens_reply, num_tokens_overall = num_tokens(user_input, response["answer"])
+    usage = _usage(_completion_prompt_tokens(request), response["answer"])
 
     citations = []
     if "sources" in response:
@@ -220,25 +354,13 @@ def _resp_sync_completions(response: json, request):
         "model": request.model,
         "choices": reply,
         "citations": citations,
-        "usage": {
-            "prompt_tokens": num_tokens_request,
-            "completion_tokens": num_tokens_reply,
-            "total_tokens": num_tokens_overall
-        }
+        "usage": usage
     }
 
-async def _resp_async_generator_completions(response: json, request):
+async def _resp_async_generator_completions(response, request, on_usage=None):
+    """Streaming für /completions; `response` wie bei _resp_async_generator."""
 
-    user_input = request.prompt
-    num_tokens_request, num_tokens_reply, num_tokens_overall = num_tokens(user_input, response["answer"])
-
-    tokens = response["answer"].split(" ")
-    citations = []
-    if "sources" in response:
-        citations = response["sources"]
-
-
-    for i, token in enumerate(tokens):
+    def make_chunk(i, text, citations, usage, finish_reason):
         chunk = {
             "id": i,
             "object": "text_completion",
@@ -246,23 +368,20 @@ async def _resp_async_generator_completions(response: json, request):
             "model": request.model,
             "choices": [
                 {
-                  "text": token + " ",
+                  "text": text,
                   "index": 0,
                   "logprobs": None,
-                  "finish_reason": None
+                  "finish_reason": finish_reason
                 }
             ],
-
             "citations": citations,
-            "usage": {
-                "prompt_tokens": num_tokens_request,
-                "completion_tokens": num_tokens_reply,
-                "total_tokens": num_tokens_overall
-            }
         }
-        yield f"data: {json.dumps(chunk)}\n\n"
-        await asyncio.sleep(0.05)
-    yield "data: [DONE]\n\n"
+        if usage is not None:
+            chunk["usage"] = usage
+        return chunk
+
+    async for line in _stream_chunks(response, make_chunk, request, _completion_prompt_tokens, on_usage):
+        yield line
 
 
 models = [
@@ -1,21 +1,26 @@
 import json
 from pathlib import Path
 
-from starlette.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
 
-from fastapi import FastAPI, Request, HTTPException
-from threading import local
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException
+from typing import Optional
 
-from agents.OpenAI_Compatible_API_Agent.Python.open_ai_helper import ChatInstance, \
-    ChatCompletionRequest, CompletionRequest, _resp_sync, _resp_async_generator, models, Message, _resp_async_generator_completions, _resp_sync_completions
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+
+from agents.OpenAI_Compatible_API_Agent.Python.open_ai_helper import \
+    ChatCompletionRequest, CompletionRequest, _resp_sync, _resp_async_generator, models, Message, _resp_async_generator_completions, _resp_sync_completions, \
+    configure_streaming, respond_off_loop, get_client_api_key
 from .privategpt_api import PrivateGPTAPI
+from .batch_jobs import BatchRequestError, BatchRunner, BatchStore, create_batch_router
+from .response_cache import ResponseCache
+from .session_registry import SessionRegistry, close_agent
 
 from ...AgentInterface.Python.config import Config, ConfigError
 import uvicorn
 
 app = FastAPI(title="OpenAI-compatible API for PrivateGPT")
-request_context = local()
-instances = []
 
 # Konfiguration laden
 try:
@@ -26,19 +31,19 @@ except ConfigError as e:
     print(f"Configuration Error: {e}")
     exit(1)
 
+# Eine PrivateGPTAPI-Instanz pro API-Key (Hash-Index, Idle/LRU-Eviction, Lock pro Key)
+sessions = SessionRegistry.from_config(config)
+# /completions: jede Anfrage ohne Verlauf in einem eigenen, danach gelöschten Chat
+completions_one_shot = bool(config.get("completions_one_shot", True))
+configure_streaming(config.get("stream_coalesce_bytes"), config.get("stream_coalesce_ms"))
+# Antworten auf deterministische Requests (temperature=0) pro API-Key merken; aus, solange TTL 0
+response_cache = ResponseCache.from_config(config)
 
 
-@app.middleware("http")
-async def store_request_headers(request: Request, call_next):
-    request_context.headers = dict(request.headers)
-    response = await call_next(request)
-    return response
-
 
 @app.post("/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
-    headers = getattr(request_context, "headers", {})
-    client_api_key = str(headers['authorization']).split(" ")[1]
+async def chat_completions(request: ChatCompletionRequest, client_api_key: str = Depends(get_client_api_key),
+                           cache_control: Optional[str] = Header(None)):
     groups = default_groups
     force_new_session = False
 
@@ -50,45 +55,15 @@ async def chat_completions(request: ChatCompletionRequest):
     print("Groups: " + str(groups))
 
     if  request.messages:
-        #Check if this api-key already has a running instance
-        indices = [i for i, x in enumerate(instances) if
-                   x.api_key == client_api_key]
-        index = -1
-        if len(indices) > 0:
-            index = indices[0]
-        if index > -1:
-            # if we already have an instance, just reuse it. No need to open new connection
-            if instances[index].agent.chosen_groups != groups:
-                print("⚠️ New Groups requested, switching to new Chat..")
-                config.set_value("groups", groups)
-                instances[index].agent.chat_id = None
-            elif force_new_session:
-                print("⚠️ New Session Requested, switching to new Chat..")
-                config.set_value("groups", groups)
-                instances[index].agent.chat_id = None
-
-            pgpt = instances[index].agent
-
-        else:
-            #otherwise connect via api-key
-            config.set_value("groups", groups)
-            pgpt = PrivateGPTAPI(config, client_api_key=client_api_key)
-            # remember that we already have an instance for the api key
-            instance = ChatInstance(client_api_key, pgpt)
-            instances.append(instance)
-
-        if pgpt.logged_in:
-            response = pgpt.respond_with_context(request.messages, request.response_format, request.tools)
-            if response is not None:
-                if "answer" not in response:
-                    response["answer"] = "No Response received"
-            if response is None or ("answer" in response and response["answer"] == "error"):
-                   pgpt.login()
-        else:
-            response = {
-                "chatId": "0",
-                "answer": "API Key not valid",
-            }
+        cache_key = response_cache.key_for("chat", request, groups, scope=client_api_key)
+        response = response_cache.get(cache_key, cache_control)
+        if response is None:
+            # Requests desselben API-Keys laufen nacheinander (chat_id), verschiedene Keys parallel
+            async with sessions.session(client_api_key) as session:
+                response = await run_in_threadpool(
+                    _chat_in_session, session, client_api_key, groups, force_new_session, request
+                )
+            response_cache.put(cache_key, response, cache_control)
     else:
         response = {
             "chatId": "0",
@@ -100,38 +75,71 @@ async def chat_completions(request: ChatCompletionRequest):
             _resp_async_generator(response, request), media_type="application/x-ndjson"
         )
     else:
-        return _resp_sync(response, request)
+        return await respond_off_loop(_resp_sync, response, request)
+
+
+def _chat_in_session(session, client_api_key, groups, force_new_session, request):
+    """Blockierender Teil von /chat/completions (Threadpool, Lock des API-Keys gehalten)."""
+    pgpt = session.agent
+    if pgpt is not None:
+        # if we already have an instance, just reuse it. No need to open new connection
+        if pgpt.chosen_groups != groups:
+            print("⚠️ New Groups requested, switching to new Chat..")
+            pgpt.chosen_groups = groups
+            pgpt.chat_id = None
+        elif force_new_session:
+            print("⚠️ New Session Requested, switching to new Chat..")
+            pgpt.chat_id = None
+    else:
+        pgpt = _new_session_agent(session, client_api_key, groups)
+
+    if pgpt.logged_in:
+        response = pgpt.respond_with_context(request.messages, request.response_format, request.tools)
+        if response is not None:
+            if "answer" not in response:
+                response["answer"] = "No Response received"
+        if response is None or ("answer" in response and response["answer"] == "error"):
+               pgpt.login()
+    else:
+        close_agent(pgpt)
+        response = {
+            "chatId": "0",
+            "answer": "API Key not valid",
+        }
+    return response
+
+
+def _new_session_agent(session, client_api_key, groups):
+    """Login via API-Key; die Instanz wird nur bei gültigem Key gemerkt, damit ein späterer Request den Login wiederholt."""
+    pgpt = PrivateGPTAPI(config, client_api_key=client_api_key)
+    pgpt.chosen_groups = groups
+    if pgpt.logged_in:
+        session.agent = pgpt
+    return pgpt
 
 
 # legacy completions API
 @app.post("/completions")
-async def completions(request: CompletionRequest):
-    headers = getattr(request_context, "headers", {})
-    client_api_key = str(headers['authorization']).split(" ")[1]
+async def completions(request: CompletionRequest, background_tasks: BackgroundTasks,
+                      client_api_key: str = Depends(get_client_api_key),
+                      cache_control: Optional[str] = Header(None)):
     groups = default_groups
     if request.groups:
         groups = request.groups
     print("Groups: " + str(groups))
     if request.prompt:
-
-        #otherwise connect via api-key
-        config.set_value("groups", groups)
-        pgpt = PrivateGPTAPI(config, client_api_key=client_api_key)
-        # remember that we already have an instance for the api key
-
-        if pgpt.logged_in:
-            response = pgpt.respond_with_context([Message(role="user", content=request.prompt)], request.response_format, request.tools)
-
-            if "answer" not in response:
-                response["answer"] = "No Response received"
-            if "answer" in response and response["answer"] == "error":
-                if pgpt.login():
-                    pgpt.create_chat()
-        else:
-            response = {
-                "chatId": "0",
-                "answer": "API Key not valid",
-            }
+        cache_key = response_cache.key_for("completions", request, groups, scope=client_api_key)
+        response = response_cache.get(cache_key, cache_control)
+        if response is None:
+            # gleiche Session (kein Login pro Request) wie /chat/completions
+            async with sessions.session(client_api_key) as session:
+                response, one_shot_chats = await run_in_threadpool(
+                    _complete_in_session, session, client_api_key, groups, request
+                )
+            if one_shot_chats:
+                # erst nach dem Senden der Antwort aufräumen
+                background_tasks.add_task(_delete_chats, client_api_key, one_shot_chats)
+            response_cache.put(cache_key, response, cache_control)
     else:
         response = {
             "chatId": "0",
@@ -143,8 +151,112 @@ async def completions(request: CompletionRequest):
             _resp_async_generator_completions(response, request), media_type="application/x-ndjson"
         )
     else:
-        return _resp_sync_completions(response, request)
+        return await respond_off_loop(_resp_sync_completions, response, request)
+
+
+
+def _complete_in_session(session, client_api_key, groups, request):
+    """Blockierender Teil von /completions (Threadpool, Lock des API-Keys gehalten)."""
+    pgpt = session.agent or _new_session_agent(session, client_api_key, groups)
+    if not pgpt.logged_in:
+        close_agent(pgpt)
+        return {"chatId": "0", "answer": "API Key not valid"}, []
+
+    messages = [Message(role="user", content=request.prompt)]
+    if completions_one_shot:
+        # Gruppen nur für diese Frage; der Chat von /chat/completions bleibt unberührt
+        response = pgpt.respond_with_context(
+            messages, request.response_format, request.tools, one_shot=True, groups=groups
+        )
+    else:
+        if pgpt.chosen_groups != groups:
+            pgpt.chosen_groups = groups
+            pgpt.chat_id = None
+        response = pgpt.respond_with_context(messages, request.response_format, request.tools)
+
+    if response is None:
+        response = {"chatId": "0"}
+    if "answer" not in response:
+        response["answer"] = "No Response received"
+    if response["answer"] == "error":
+        pgpt.login()
+    return response, pgpt.pop_one_shot_chats()
+
+
+async def _delete_chats(client_api_key, chat_ids):
+    """Hintergrund-Task: One-Shot-Chats wieder löschen (unter dem Lock des API-Keys)."""
+    async with sessions.session(client_api_key) as session:
+        pgpt = session.agent
+        if pgpt is not None:
+            for chat_id in chat_ids:
+                await run_in_threadpool(pgpt.delete_chat, chat_id)
+
+
+# Batch-API (/files, /batches, auch unter /v1): Jobs in SQLite, eigene Logins pro Batch-Worker
+batch_store = BatchStore.from_config(config)
+batch_runner = BatchRunner.from_config(batch_store, config)
+
+
+class _BatchWorker:
+    """
+    Batch-Worker mit eigenem Login. Jede Zeile läuft als One-Shot-Chat (ohne Verlauf), daher
+    unabhängig von der Session des API-Keys und parallel zu den anderen Workern.
+    """
+
+    def __init__(self, client_api_key):
+        self.client_api_key = client_api_key
+        self.pgpt = None
+
+    async def __call__(self, endpoint, body):
+        body["stream"] = False
+        if endpoint == "/v1/chat/completions":
+            request = ChatCompletionRequest(**body)
+            messages, render = request.messages, _resp_sync
+        else:
+            request = CompletionRequest(**body)
+            messages, render = [Message(role="user", content=request.prompt)], _resp_sync_completions
+        response = await run_in_threadpool(self._respond, request, messages)
+        return await respond_off_loop(render, response, request)
+
+    def _respond(self, request, messages):
+        if self.pgpt is None or not self.pgpt.logged_in:
+            if self.pgpt is not None:
+                close_agent(self.pgpt)
+            self.pgpt = PrivateGPTAPI(config, client_api_key=self.client_api_key)
+        if not self.pgpt.logged_in:
+            raise BatchRequestError("invalid_api_key", "API Key not valid")
+        response = self.pgpt.respond_with_context(
+            messages, request.response_format, request.tools, one_shot=True, groups=request.groups or default_groups
+        )
+        for chat_id in self.pgpt.pop_one_shot_chats():
+            self.pgpt.delete_chat(chat_id)
+        if not response or "error" in response or response.get("answer", "error") == "error":
+            self.pgpt.login()
+            raise BatchRequestError("backend_error", "No valid response from PrivateGPT")
+        return response
+
+    async def close(self):
+        if self.pgpt is not None:
+            close_agent(self.pgpt)
+
+
+def _batch_worker_factory(client_api_key):
+    async def make_worker():
+        return _BatchWorker(client_api_key)
+    return make_worker
+
+
+batch_router = create_batch_router(
+    batch_store, batch_runner, get_client_api_key, _batch_worker_factory,
+    max_file_bytes=int(config.get("batch_max_file_bytes", 100 * 1024 * 1024))
+)
+app.include_router(batch_router)
+app.include_router(batch_router, prefix="/v1")
+
 
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/models")
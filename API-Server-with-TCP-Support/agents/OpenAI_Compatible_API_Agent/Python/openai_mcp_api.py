@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import logging
 import time
 from pathlib import Path
@@ -38,12 +39,13 @@ except ConfigError as e:
     exit(1)
 
 # ------------------------------------------------------------------
-#   3) Globaler Agent (nur eine Instanz)
+#   3) Agenten-Pool (agent_pool_size Instanzen = eben so viele Logins)
 # ------------------------------------------------------------------
 try:
     from ...AgentInterface.Python.agent import PrivateGPTAgent
-    GLOBAL_AGENT = PrivateGPTAgent(config)
-    logger.info("Global PrivateGPTAgent instance initialized.")
+    AGENT_POOL_SIZE = max(1, int(config.get("agent_pool_size", 1)))
+    AGENTS = [PrivateGPTAgent(config) for _ in range(AGENT_POOL_SIZE)]
+    logger.info(f"{AGENT_POOL_SIZE} PrivateGPTAgent instance(s) initialized.")
 except Exception as e:
     logger.error(f"Error initializing global agent: {e}")
     exit(1)
@@ -69,23 +71,73 @@ from agents.OpenAI_Compatible_API_Agent.Python.open_ai_helper import (
     _resp_async_generator,
     _resp_async_generator_completions,
     _resp_sync_completions,
+    configure_streaming,
+    respond_off_loop,
     models
 )
 
+configure_streaming(config.get("stream_coalesce_bytes"), config.get("stream_coalesce_ms"))
+
 # ------------------------------------------------------------------
 #   5) Asynchroner Aufruf des Agenten via Thread-Pool
 # ------------------------------------------------------------------
 from concurrent.futures import ThreadPoolExecutor
 
-executor = ThreadPoolExecutor(max_workers=4)
+WORKER_THREADS = max(1, int(config.get("worker_threads", 4)))
+WORKER_QUEUE_MAX = max(0, int(config.get("worker_queue_max", 100)))
+executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="agent-worker")
+
+_agent_cycle = itertools.cycle(AGENTS)  # Requests reihum auf die Agenten verteilen
+_pending = 0  # Requests im Pool (wartend + laufend); nur im Event-Loop verändert
+BATCH_BACKOFF_MIN, BATCH_BACKOFF_MAX = 0.05, 2.0  # s; Warten der Batch-Zeilen auf einen freien Thread
 
-async def async_respond(agent: PrivateGPTAgent, messages: List[Message]) -> dict:
+async def async_respond(messages: List[Message], wait: bool = False) -> dict:
     """
     Führt den blockierenden respond_with_context-Aufruf in einem Threadpool aus,
-    um den Haupt-Eventloop nicht zu blockieren.
+    um den Haupt-Eventloop nicht zu blockieren. Sind alle Threads belegt und
+    WORKER_QUEUE_MAX Requests wartend, wird mit 503 abgelehnt statt unbegrenzt zu puffern.
+    Mit wait=True (Batch-Zeilen) wird stattdessen mit Backoff gewartet, bis ein Thread frei ist;
+    Batch-Last belegt so nie die Warteschlange der interaktiven Requests.
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, agent.respond_with_context, messages)
+    global _pending
+    if wait:
+        delay = BATCH_BACKOFF_MIN
+        while _pending >= WORKER_THREADS:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BATCH_BACKOFF_MAX)
+    elif _pending >= WORKER_THREADS + WORKER_QUEUE_MAX:
+        REJECTED_REQUESTS.inc()
+        raise HTTPException(status_code=503, detail="Server busy, please retry later")
+
+    agent = next(_agent_cycle)
+    submitted = time.perf_counter()
+
+    def run():
+        QUEUED_REQUESTS.dec()
+        QUEUE_WAIT.observe(time.perf_counter() - submitted)
+        ACTIVE_WORKER.inc()
+        started = time.perf_counter()
+        try:
+            return agent.respond_with_context(messages)
+        finally:
+            EXECUTION_TIME.observe(time.perf_counter() - started)
+            ACTIVE_WORKER.dec()
+
+    _pending += 1
+    QUEUED_REQUESTS.inc()
+    future = executor.submit(run)
+    try:
+        return await asyncio.wrap_future(future)
+    finally:
+        _pending -= 1
+        if future.cancel():
+            # Client weg, bevor ein Thread frei wurde -> run() läuft nie
+            QUEUED_REQUESTS.dec()
+
+# Antworten auf deterministische Requests (temperature=0) merken; aus, solange response_cache_ttl_seconds 0.
+# Alle Clients teilen sich denselben MCP-Login, daher ein gemeinsamer Cache ohne Scope pro API-Key.
+from .response_cache import ResponseCache
+response_cache = ResponseCache.from_config(config)
 
 # ------------------------------------------------------------------
 #   6) FastAPI-App erstellen
@@ -121,20 +173,42 @@ COMPLETION_COUNT = Counter(
     "Number of successful Completions requests"
 )
 
-# Ggf. ein Gauge für "laufende Threads" oder "Queue-Länge", falls relevant
-# (Beispiel: wir nehmen hier einen Dummy-Gauge für aktive Worker)
+# Worker-Pool: laufende Threads, wartende Requests, Wartezeit, Ausführungszeit, Ablehnungen
 ACTIVE_WORKER = Gauge(
     "active_worker",
     "Number of active threads in the ThreadPoolExecutor"
 )
 
-# (Optional) Counter für Token, wenn du das aus dem Agent extrahieren kannst:
+QUEUED_REQUESTS = Gauge(
+    "worker_queue_length",
+    "Number of requests waiting for a free worker thread"
+)
+
+QUEUE_WAIT = Histogram(
+    "worker_queue_wait_seconds",
+    "Time a request waited for a free worker thread"
+)
+
+EXECUTION_TIME = Histogram(
+    "worker_execution_seconds",
+    "Time spent in respond_with_context on a worker thread"
+)
+
+REJECTED_REQUESTS = Counter(
+    "worker_rejected_requests",
+    "Requests rejected with 503 because the worker queue was full"
+)
+
+# Token pro Modell (Usage, wie sie auch an den Client geht)
 TOKEN_USAGE = Counter(
     "token_usage",
     "Count of tokens used",
     ["model"]
 )
 
+def count_tokens(request, usage: dict):
+    TOKEN_USAGE.labels(request.model or "unknown_model").inc(usage["total_tokens"])
+
 # ------------------------------------------------------------------
 #   8) Middleware zum Messen und Zählen der Requests
 # ------------------------------------------------------------------
@@ -144,10 +218,6 @@ async def prometheus_middleware(request: Request, call_next):
     
     # Zähle Request
     REQUEST_COUNT.labels(request.method, request.url.path).inc()
-    
-    # Schätze aktive Worker
-    #   (Im ThreadPool ist das nicht exakt; man könnte hier "max_workers - free" ermitteln.)
-    ACTIVE_WORKER.set(executor._work_queue.qsize())
 
     try:
         response = await call_next(request)
@@ -191,11 +261,12 @@ def verify_api_key(authorization: str = Header(None)) -> str:
 @app.post("/chat/completions")
 async def chat_completions(
     request: ChatCompletionRequest,
-    client_api_key: str = Depends(verify_api_key)
+    client_api_key: str = Depends(verify_api_key),
+    cache_control: Optional[str] = Header(None)
 ):
     """
     Beispielhafter Endpoint für Chat Completion.
-    Nutzt GLOBAL_AGENT und führt die Logik asynchron aus.
+    Nutzt den Agenten-Pool und führt die Logik asynchron aus.
     """
     logger.info(f"[/chat/completions] Request received with API key: {client_api_key}")
 
@@ -205,30 +276,31 @@ async def chat_completions(
         logger.warning("No messages provided.")
         return _resp_sync(response, request)
 
-    # Asynchrone Agent-Antwort
-    response = await async_respond(GLOBAL_AGENT, request.messages)
-    if "answer" not in response:
-        response["answer"] = "No Response received"
+    # Asynchrone Agent-Antwort (oder aus dem Antwort-Cache)
+    cache_key = response_cache.key_for("chat", request)
+    response = response_cache.get(cache_key, cache_control)
+    if response is None:
+        response = await async_respond(request.messages)
+        if "answer" not in response:
+            response["answer"] = "No Response received"
+        response_cache.put(cache_key, response, cache_control)
 
     # Metrik hochzählen
     CHAT_COMPLETION_COUNT.inc()
 
-    # (Optional) Token-Usage-Tracking, falls du im response-Dict Token-Infos hast
-    # Hier beispielhaft: response["usage"]["tokens"] (falls existiert)
-    # if "usage" in response and "tokens" in response["usage"]:
-    #     TOKEN_USAGE.labels(request.model or "unknown_model").inc(response["usage"]["tokens"])
-
     preview_len = 80
     logger.info(f"💡 Response (preview): {response['answer'][:preview_len]}...")
 
     # Streaming?
     if request.stream:
         return StreamingResponse(
-            _resp_async_generator(response, request),
+            _resp_async_generator(response, request, on_usage=lambda usage: count_tokens(request, usage)),
             media_type="application/x-ndjson"
         )
     else:
-        return _resp_sync(response, request)
+        result = await respond_off_loop(_resp_sync, response, request)
+        count_tokens(request, result["usage"])
+        return result
 
 # ------------------------------------------------------------------
 #   11) Text-Completions Endpoint
@@ -236,7 +308,8 @@ async def chat_completions(
 @app.post("/completions")
 async def completions(
     request: CompletionRequest,
-    client_api_key: str = Depends(verify_api_key)
+    client_api_key: str = Depends(verify_api_key),
+    cache_control: Optional[str] = Header(None)
 ):
     logger.info(f"[/completions] Request received with API key: {client_api_key}")
 
@@ -245,30 +318,68 @@ async def completions(
         logger.warning("No prompt provided.")
         return _resp_sync(response, request)
 
-    # Asynchrone Agent-Antwort
-    response = await async_respond(GLOBAL_AGENT, [Message(role="user", content=request.prompt)])
-    if "answer" not in response:
-        response["answer"] = "No Response received"
+    # Asynchrone Agent-Antwort (oder aus dem Antwort-Cache)
+    cache_key = response_cache.key_for("completions", request)
+    response = response_cache.get(cache_key, cache_control)
+    if response is None:
+        response = await async_respond([Message(role="user", content=request.prompt)])
+        if "answer" not in response:
+            response["answer"] = "No Response received"
+        response_cache.put(cache_key, response, cache_control)
 
     # Completion-Metrik hochzählen
     COMPLETION_COUNT.inc()
 
-    # (Optional) Token-Usage-Tracking
-    # if "usage" in response and "tokens" in response["usage"]:
-    #     TOKEN_USAGE.labels("some_model").inc(response["usage"]["tokens"])
-
     logger.info(f"💡 Response (preview): {response['answer'][:80]}...")
 
     if request.stream:
         return StreamingResponse(
-            _resp_async_generator_completions(response, request),
+            _resp_async_generator_completions(response, request, on_usage=lambda usage: count_tokens(request, usage)),
             media_type="application/x-ndjson"
         )
     else:
-        return _resp_sync_completions(response, request)
+        result = await respond_off_loop(_resp_sync_completions, response, request)
+        count_tokens(request, result["usage"])
+        return result
+
+# ------------------------------------------------------------------
+#   12) Batch-API (/files, /batches, auch unter /v1)
+#       Zeilen laufen über denselben Worker-Pool wie die Einzel-Requests
+# ------------------------------------------------------------------
+from .batch_jobs import BatchRequestError, BatchRunner, BatchStore, create_batch_router
+
+batch_store = BatchStore.from_config(config)
+batch_runner = BatchRunner.from_config(batch_store, config)
+
+async def _batch_respond(endpoint: str, body: dict) -> dict:
+    body["stream"] = False
+    if endpoint == "/v1/chat/completions":
+        request = ChatCompletionRequest(**body)
+        messages, render = request.messages, _resp_sync
+    else:
+        request = CompletionRequest(**body)
+        messages, render = [Message(role="user", content=request.prompt)], _resp_sync_completions
+    response = await async_respond(messages, wait=True)  # verlangsamen statt 503
+    if not response or "answer" not in response:
+        raise BatchRequestError("backend_error", "No Response received")
+    result = await respond_off_loop(render, response, request)
+    count_tokens(request, result["usage"])
+    return result
+
+def _batch_worker_factory(client_api_key: str):
+    async def make_worker():
+        return _batch_respond
+    return make_worker
+
+batch_router = create_batch_router(
+    batch_store, batch_runner, verify_api_key, _batch_worker_factory,
+    max_file_bytes=int(config.get("batch_max_file_bytes", 100 * 1024 * 1024))
+)
+app.include_router(batch_router)
+app.include_router(batch_router, prefix="/v1")
 
 # ------------------------------------------------------------------
-#   12) Modelle abfragen
+#   13) Modelle abfragen
 # ------------------------------------------------------------------
 @app.get("/models")
 def return_models():
@@ -282,7 +393,7 @@ async def get_model(model_id: str):
     return filtered_entries[0]
 
 # ------------------------------------------------------------------
-#   13) /metrics Endpoint für Prometheus
+#   14) /metrics Endpoint für Prometheus
 # ------------------------------------------------------------------
 @app.get("/metrics")
 def metrics():
@@ -293,7 +404,7 @@ def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # ------------------------------------------------------------------
-#   14) App-Start via uvicorn.run()
+#   15) App-Start via uvicorn.run()
 # ------------------------------------------------------------------
 if __name__ == "__main__":
     import uvicorn
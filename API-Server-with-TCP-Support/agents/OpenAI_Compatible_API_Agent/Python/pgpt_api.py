@@ -6,6 +6,7 @@ import requests
 import urllib3
 import base64
 
+from .tool_calls import parse_tool_calls
 from ...AgentInterface.Python.config import Config
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -240,8 +241,11 @@ class PrivateGPTAPI:
 
             if 'data' in result:
                 response_data = result.get("data")
-                if request_tools is not None and not hastoolresult and is_json(clean_response(response_data.get("answer"))):
-                    response_data["tool_call"] = clean_response(response_data.get("answer", ""))
+                if request_tools is not None and not hastoolresult:
+                    # einmal geparst; _resp_sync bekommt die ToolCall-Objekte statt des Strings
+                    tool_calls = parse_tool_calls(response_data.get("answer"))
+                    if tool_calls:
+                        response_data["tool_call"] = tool_calls
                 return response_data
             elif 'error' in result:
                 # Try to login again and send the query once more on error.
@@ -259,13 +263,6 @@ class PrivateGPTAPI:
             else:
                 return result
 
-def is_json(myjson):
-  try:
-    json.loads(myjson)
-  except ValueError as e:
-    return False
-  return True
-
 def add_response_format(response_format):
     #prompt = "\nPlease fill in the following template with realistic and appropriate information. Be creative. The field 'type' defines the output format. In your reply, only return the generated json\n"
     prompt = "\nPlease fill in the following json template with realistic and appropriate information. In your reply, only return the generated json. If you can't answer return an empty json.\n"
@@ -283,11 +280,6 @@ def add_tools(response_tools, last_tool_message):
 
     return prompt
 
-def clean_response(response):
-    # Remove artefacts from reply here
-    response = response.replace("[TOOL_CALLS]", "")
-    return response
-
 def decrypt_api_key(api_key):
     """
     This is PoC code and methods should be replaced with a more secure way to deal with credentials (e.g. in a db)
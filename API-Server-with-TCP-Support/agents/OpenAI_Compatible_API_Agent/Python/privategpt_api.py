@@ -8,6 +8,7 @@ import base64
 
 from httpcore import NetworkError
 
+from .tool_calls import parse_tool_calls
 from ...AgentInterface.Python.config import Config
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -52,6 +53,7 @@ class PrivateGPTAPI:
         self.use_public = config.get("use_public", True)
         self.whitelist_keys = config.get("whitelist_keys", [])
         self.logged_in = False
+        self.one_shot_chats = []  # Chats von ask_one_shot, die noch gelöscht werden müssen
 
 
         if client_api_key is not None:
@@ -88,18 +90,19 @@ class PrivateGPTAPI:
             print(f"❌ Login failed: {e}")
         return False
 
-    def create_chat(self, user_input):
+    def create_chat(self, user_input, groups=None):
         """Start a new chat session.
 
         This method sends a POST request to the '/chats' endpoint with the provided parameters.
         It initializes a new chat session and stores the chat ID for future use.
+        `groups` overrides the chosen groups for this chat only.
         """
         url = f"{self.base_url}/chats"
         payload = {
             "language": self.language,
             "question": user_input,  # Initial question to start the chat
             "usePublic": self.use_public,
-            "groups": self.chosen_groups
+            "groups": self.chosen_groups if groups is None else groups
         }
         try:
             response = self.session.post(url, json=payload)
@@ -138,6 +141,38 @@ class PrivateGPTAPI:
                 print(f"❌ Failed to get response: {e}")
                 return {"error": f"❌ Failed to get response: {e}"}
 
+    def ask_one_shot(self, user_input, groups=None):
+        """Ask a single question without history.
+
+        PrivateGPT has no stateless endpoint, so the question gets its own chat. The
+        conversation of this session (self.chat_id) is left untouched and the new chat
+        is remembered in one_shot_chats, to be removed later with delete_chat.
+        """
+        chat_id = self.chat_id
+        self.chat_id = None
+        try:
+            result = self.create_chat(user_input, groups)
+            if self.chat_id is not None:
+                self.one_shot_chats.append(self.chat_id)
+            return result
+        finally:
+            self.chat_id = chat_id
+
+    def pop_one_shot_chats(self):
+        chats, self.one_shot_chats = self.one_shot_chats, []
+        return chats
+
+    def delete_chat(self, chat_id):
+        """Delete a chat on the server (DELETE /chats/{chatId})."""
+        url = f"{self.base_url}/chats/{chat_id}"
+        try:
+            response = self.session.delete(url)
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ Failed to delete chat {chat_id}: {e}")
+            return False
+
     def list_personal_groups(self):
         url = f"{self.base_url}/groups"
         try:
@@ -210,7 +245,15 @@ class PrivateGPTAPI:
             return {"error": f"❌ Failed to get response: {e}"}
 
 
-    def respond_with_context(self, messages, response_format=None, request_tools=None):
+    def _ask(self, user_input, one_shot=False, groups=None):
+        if one_shot:
+            return self.ask_one_shot(user_input, groups)
+        if self.chat_id is None:
+            return self.create_chat(user_input)
+        return self.query_private_gpt(user_input)
+
+    def respond_with_context(self, messages, response_format=None, request_tools=None, one_shot=False, groups=None):
+        """Answer the messages; with one_shot=True in a separate chat without history (see ask_one_shot)."""
         last_user_message = next((p for p in reversed(messages) if p.role == "user"), None)
         user_input = ""
 
@@ -251,23 +294,20 @@ class PrivateGPTAPI:
         if not self.logged_in:
             self.login()
         else:
-            if self.chat_id is None:
-                result = self.create_chat(user_input)
-            else:
-                result = self.query_private_gpt(user_input)
+            result = self._ask(user_input, one_shot, groups)
 
             if 'data' in result:
                 response_data = result.get("data")
-                if request_tools is not None and not hastoolresult and is_json(clean_response(response_data.get("answer"))):
-                    response_data["tool_call"] = clean_response(response_data.get("answer", ""))
+                if request_tools is not None and not hastoolresult:
+                    # einmal geparst; _resp_sync bekommt die ToolCall-Objekte statt des Strings
+                    tool_calls = parse_tool_calls(response_data.get("answer"))
+                    if tool_calls:
+                        response_data["tool_call"] = tool_calls
                 return response_data
             elif 'error' in result:
                 # Try to login again and send the query once more on error.
                 if self.login():
-                    if self.chat_id is None:
-                        result = self.create_chat(user_input)
-                    else:
-                        result = self.query_private_gpt(user_input)
+                    result = self._ask(user_input, one_shot, groups)
 
                     if 'data' in result:
                         return result['data']
@@ -277,13 +317,6 @@ class PrivateGPTAPI:
             else:
                 return result
 
-def is_json(myjson):
-  try:
-    json.loads(myjson)
-  except ValueError as e:
-    return False
-  return True
-
 def add_response_format(response_format):
     #prompt = "\nPlease fill in the following template with realistic and appropriate information. Be creative. The field 'type' defines the output format. In your reply, only return the generated json\n"
     prompt = "\nPlease fill in the following json template with realistic and appropriate information. In your reply, only return the generated json. If you can't answer return an empty json.\n"
@@ -301,11 +334,6 @@ def add_tools(response_tools, last_tool_message):
 
     return prompt
 
-def clean_response(response):
-    # Remove artefacts from reply here
-    response = response.replace("[TOOL_CALLS]", "")
-    return response
-
 def decrypt_api_key(api_key):
     """
     This is PoC code and methods should be replaced with a more secure way to deal with credentials (e.g. in a db)
@@ -0,0 +1,131 @@
+"""
+Antwort-Cache für deterministische Requests (opt-in)
+
+Viele Clients (MCP-Client, Agenten) schicken byte-gleiche Requests mit temperature=0,
+v. a. Tool-Auswahl- und JSON-Template-Prompts. Solche Antworten werden für eine TTL gemerkt:
+- Schlüssel: SHA-256 über eine kanonische JSON-Form von Endpoint, Modell, Nachrichten bzw.
+  Prompt, Tools, response_format, max_tokens, Gruppen und optional einem Scope (z. B. API-Key)
+- nur bei temperature=0; nur erfolgreiche Antworten
+- TTL und LRU-Obergrenze (max_entries)
+- Cache-Control: no-cache -> nicht aus dem Cache lesen (aber neu speichern), no-store -> weder noch
+- Prometheus: Lookups nach Ergebnis (hit/miss/bypass), Anzahl Einträge
+
+Gespeichert wird die Antwort des Backends (Dict), nicht die gerenderte Antwort; Streaming und
+Nicht-Streaming teilen sich so einen Eintrag. Alle Zugriffe laufen im Event-Loop, daher ohne Lock.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+
+CACHE_LOOKUPS = Counter(
+    "openai_api_response_cache_lookups",
+    "Response cache lookups by result",
+    ["result"]
+)
+_HIT = CACHE_LOOKUPS.labels("hit")
+_MISS = CACHE_LOOKUPS.labels("miss")
+_BYPASS = CACHE_LOOKUPS.labels("bypass")
+
+CACHE_ENTRIES = Gauge(
+    "openai_api_response_cache_entries",
+    "Responses currently held by the response cache"
+)
+
+# Antworten, die nicht gemerkt werden (Fehler/Platzhalter der Endpunkte)
+_UNCACHEABLE_ANSWERS = {"error", "No Response received", "API Key not valid", "No Input given", "No input provided"}
+
+
+def _directives(cache_control: Optional[str]) -> set:
+    if not cache_control:
+        return set()
+    return {part.strip().lower() for part in cache_control.split(",")}
+
+
+def _dump(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
+
+
+class ResponseCache:
+    PURGE_EVERY = 256  # Schreibzugriffe zwischen zwei Läufen über alle Einträge
+
+    def __init__(self, ttl=0.0, max_entries=1024):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()  # Schlüssel -> (Ablaufzeit, Antwort), älteste Nutzung zuerst
+        self._puts = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            ttl=config.get("response_cache_ttl_seconds", 0),
+            max_entries=config.get("response_cache_max_entries", 1024),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key_for(self, endpoint, request, groups=None, scope=None) -> Optional[str]:
+        """Schlüssel des Requests oder None, wenn er nicht gecacht werden darf."""
+        if not self.enabled or (getattr(request, "temperature", 0) or 0) != 0:
+            return None
+        messages = getattr(request, "messages", None)
+        canonical = {
+            "endpoint": endpoint,
+            "scope": scope,
+            "model": request.model,
+            "messages": [_dump(message) for message in messages] if messages else None,
+            "prompt": getattr(request, "prompt", None),
+            "tools": getattr(request, "tools", None),
+            "response_format": getattr(request, "response_format", None),
+            "max_tokens": getattr(request, "max_tokens", None),
+            "groups": groups,
+        }
+        raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key, cache_control=None) -> Optional[dict]:
+        if key is None:
+            return None
+        directives = _directives(cache_control)
+        if "no-cache" in directives or "no-store" in directives:
+            _BYPASS.inc()
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            _MISS.inc()
+            return None
+        self._entries.move_to_end(key)
+        _HIT.inc()
+        return dict(entry[1])  # Endpunkte ergänzen Felder in der Antwort
+
+    def put(self, key, response, cache_control=None):
+        if key is None or not isinstance(response, dict) or "no-store" in _directives(cache_control):
+            return
+        if "error" in response or response.get("answer") in _UNCACHEABLE_ANSWERS:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, dict(response))
+        self._entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """Über max_entries die am längsten ungenutzten, gelegentlich alle abgelaufenen Einträge entfernen."""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            now = time.monotonic()
+            for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+                del self._entries[key]
+        CACHE_ENTRIES.set(len(self._entries))
@@ -0,0 +1,108 @@
+"""
+Session-Registry für openai_compatible_api.py
+
+Pro API-Key eine PrivateGPTAPI-Instanz (Login, requests.Session, chat_id):
+- Dict mit dem SHA-256 des API-Keys als Schlüssel (O(1), Klartext-Keys werden nicht gehalten)
+- Ein asyncio.Lock pro Key: parallele Requests desselben Keys laufen nacheinander und
+  überschreiben sich nicht gegenseitig die chat_id
+- Eviction nach Leerlaufzeit und LRU bei mehr als max_sessions; die Session wird dabei
+  geschlossen (Sessions, die gerade benutzt werden, bleiben)
+- Prometheus: aktive Sessions (Gauge), Evictions nach Grund (Counter)
+
+Alle Zugriffe auf die Registry laufen im Event-Loop, daher ohne Thread-Lock.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge
+
+ACTIVE_SESSIONS = Gauge(
+    "openai_api_sessions_active",
+    "PrivateGPT sessions currently held by the OpenAI-compatible API"
+)
+
+EVICTED_SESSIONS = Counter(
+    "openai_api_sessions_evicted",
+    "PrivateGPT sessions closed by the session registry",
+    ["reason"]
+)
+_EVICTED_IDLE = EVICTED_SESSIONS.labels("idle")
+_EVICTED_LRU = EVICTED_SESSIONS.labels("lru")
+
+
+class Session:
+    """Eintrag der Registry; `agent` wird vom Aufrufer (unter dem Lock) gesetzt."""
+    __slots__ = ("agent", "lock", "last_used", "in_use")
+
+    def __init__(self, lock):
+        self.agent = None
+        self.lock = lock
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+def close_agent(agent):
+    session = getattr(agent, "session", None)
+    if session is not None:
+        session.close()
+
+
+class SessionRegistry:
+    def __init__(self, max_sessions=256, idle_timeout=1800.0, close=close_agent):
+        self.max_sessions = max(1, int(max_sessions))
+        self.idle_timeout = float(idle_timeout)
+        self._close = close
+        self._sessions = OrderedDict()  # key hash -> Session, älteste Nutzung zuerst
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_sessions=config.get("session_max", 256),
+            idle_timeout=config.get("session_idle_seconds", 1800),
+        )
+
+    @staticmethod
+    def key_for(api_key):
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @asynccontextmanager
+    async def session(self, api_key):
+        """Session des API-Keys exklusiv (Lock gehalten) benutzen; legt den Eintrag bei Bedarf an."""
+        key = self.key_for(api_key)
+        entry = self._sessions.get(key)
+        if entry is None:
+            entry = self._sessions[key] = Session(asyncio.Lock())
+            ACTIVE_SESSIONS.set(len(self._sessions))
+        else:
+            self._sessions.move_to_end(key)
+        entry.in_use += 1
+        try:
+            async with entry.lock:
+                yield entry
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            self.evict()
+
+    def evict(self):
+        """Leerlaufende und (über max_sessions) am längsten ungenutzte Sessions schließen."""
+        now = time.monotonic()
+        for key, entry in list(self._sessions.items()):
+            if entry.in_use:
+                continue
+            if now - entry.last_used > self.idle_timeout:
+                _EVICTED_IDLE.inc()
+            elif len(self._sessions) > self.max_sessions:
+                _EVICTED_LRU.inc()
+            else:
+                break  # Rest ist jünger und passt in die Obergrenze
+            del self._sessions[key]
+            if entry.agent is not None:
+                self._close(entry.agent)
+        ACTIVE_SESSIONS.set(len(self._sessions))
@@ -0,0 +1,82 @@
+"""
+Micro-Benchmark: Tool-Call-Erkennung und Nachbearbeitung der Antworten
+
+Vergleicht die frühere Pipeline (is_json + clean_response in PrivateGPTAPI, erneutes
+json.loads samt dumps/strip/loads in _resp_sync) mit parse_tool_calls über aufgezeichnete
+Modellantworten. Aufruf aus dem Verzeichnis, das `agents` enthält:
+
+    python -m agents.OpenAI_Compatible_API_Agent.Python.tool_call_benchmark [--repeat 20000]
+"""
+import argparse
+import json
+import timeit
+
+from agents.OpenAI_Compatible_API_Agent.Python.tool_calls import parse_tool_calls
+
+# Aufgezeichnete Antworten (gekürzt) von Mistral, Llama und PrivateGPT auf Tool-Prompts
+RECORDED_RESPONSES = {
+    "mistral": '[TOOL_CALLS] [{"name": "calculator", "arguments": {"operation": "multiply", "a": "123", "b": "4324"}}]',
+    "name_arguments": '{"name": "get_weather", "arguments": {"city": "Berlin", "unit": "celsius"}}',
+    "method_params": '{"method": "send_email", "params": {"to": "team@example.com", "subject": "Status", "body": "Alles erledigt."}}',
+    "string_arguments": '{"name": "search", "arguments": "{\\"query\\": \\"Quartalszahlen 2024\\", \\"limit\\": 5}"}',
+    "fenced": '```json\n{"name": "list_files", "arguments": {"path": "/data/reports"}}\n```',
+    "plain_text": "Die Hauptstadt von Frankreich ist Paris. Sie liegt an der Seine und hat rund 2,1 Millionen Einwohner. " * 4,
+}
+
+
+def _legacy_clean(response):
+    return response.replace("[TOOL_CALLS]", "")
+
+
+def _legacy_is_json(text):
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def legacy_pipeline(answer):
+    """Frühere Verarbeitung: Prüfen, Säubern und in _resp_sync erneut parsen (ohne die prints)."""
+    if not _legacy_is_json(_legacy_clean(answer)):
+        return None
+    try:
+        tool = json.loads(_legacy_clean(answer))
+        if "arguments" in tool:
+            parsed_arguments = json.loads(json.dumps(tool["arguments"]).strip("\""))
+        elif "params" in tool:
+            parsed_arguments = json.loads(json.dumps(tool["params"]).strip("\""))
+        else:
+            parsed_arguments = tool
+        name = tool.get("method") or tool.get("name") or "tool"
+        return [(name, json.dumps(parsed_arguments))]
+    except Exception:
+        return None
+
+
+def new_pipeline(answer):
+    calls = parse_tool_calls(answer)
+    if not calls:
+        return None
+    return [(call.name, call.arguments_json()) for call in calls]
+
+
+def _names(result):
+    return ", ".join(name for name, _ in result) if result else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool-call extraction micro-benchmark")
+    parser.add_argument("--repeat", type=int, default=20000, help="Calls per sample")
+    args = parser.parse_args()
+
+    print(f"{'sample':<18}{'legacy µs':>11}{'new µs':>9}{'speedup':>9}  legacy -> new")
+    for label, answer in RECORDED_RESPONSES.items():
+        legacy = min(timeit.repeat(lambda: legacy_pipeline(answer), number=args.repeat, repeat=3)) / args.repeat
+        new = min(timeit.repeat(lambda: new_pipeline(answer), number=args.repeat, repeat=3)) / args.repeat
+        summary = " -> ".join(_names(pipeline(answer)) for pipeline in (legacy_pipeline, new_pipeline))
+        print(f"{label:<18}{legacy * 1e6:>11.2f}{new * 1e6:>9.2f}{legacy / new:>8.1f}x  {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Tool-Calls aus Modellantworten (einheitlicher Parser)
+
+Die Antwort wird genau einmal dekodiert (orjson, falls installiert) und als Liste von
+ToolCall-Objekten durch die Pipeline gereicht (PrivateGPTAPI -> _resp_sync), statt als
+String, der unterwegs erneut geprüft und geparst wird.
+
+Unterstützte Formen (nach Entfernen von "[TOOL_CALLS]" und einem ```json-Block):
+- {"name": ..., "arguments": {...}}          (arguments auch als JSON-String)
+- {"method": ..., "params": {...}}           (JSON-RPC-artig; method hat Vorrang vor name)
+- [{"name": ..., "arguments": {...}}, ...]   (Mistral: mehrere Calls)
+- sonstiges Objekt                           -> das ganze Objekt sind die Argumente
+"""
+import json
+import re
+from typing import List, NamedTuple, Optional
+
+try:
+    import orjson
+
+    def _loads(text):
+        return orjson.loads(text)
+except ImportError:  # optional, nur schneller
+    _loads = json.loads
+
+_TOOL_CALLS_MARKER = re.compile(r"\[TOOL_CALLS\]\s*")
+_FENCED_JSON = re.compile(r"^\s*```(?:json)?[ \t]*\n?(.*?)\s*```\s*$", re.DOTALL | re.IGNORECASE)
+
+
+class ToolCall(NamedTuple):
+    name: str
+    arguments: object  # i. d. R. dict; sonst so, wie das Modell es geliefert hat
+
+    def arguments_json(self) -> str:
+        return json.dumps(self.arguments)
+
+
+def clean_response(text: str) -> str:
+    """Artefakte entfernen: "[TOOL_CALLS]"-Marker und ein ```json-Block um die ganze Antwort."""
+    if "[TOOL_CALLS]" in text:
+        text = _TOOL_CALLS_MARKER.sub("", text)
+    if "```" in text:
+        match = _FENCED_JSON.match(text)
+        if match:
+            text = match.group(1)
+    return text
+
+
+def _tool_call(item) -> Optional[ToolCall]:
+    if not isinstance(item, dict):
+        return None
+    name = item.get("method") or item.get("name") or "tool"
+    if "arguments" in item:
+        arguments = item["arguments"]
+    elif "params" in item:
+        arguments = item["params"]
+    else:
+        arguments = item
+    if isinstance(arguments, str):
+        try:
+            arguments = _loads(arguments)
+        except ValueError:
+            pass  # Freitext-Argumente unverändert durchreichen
+    return ToolCall(name, arguments)
+
+
+def parse_tool_calls(text: Optional[str]) -> Optional[List[ToolCall]]:
+    """Tool-Calls der Antwort oder None, wenn sie keinen (gültigen JSON-)Tool-Call enthält."""
+    if not text:
+        return None
+    cleaned = clean_response(text).strip()
+    if not cleaned or cleaned[0] not in "{[":
+        return None  # Fließtext: ohne Parse-Versuch ablehnen
+    try:
+        data = _loads(cleaned)
+    except ValueError:
+        return None
+    items = data if isinstance(data, list) else [data]
+    calls = [call for call in map(_tool_call, items) if call is not None]
+    return calls or None
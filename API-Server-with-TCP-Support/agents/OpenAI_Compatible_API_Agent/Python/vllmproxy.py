@@ -1,46 +1,69 @@
 import argparse
-import asyncio
-import json
 import time
+from contextlib import asynccontextmanager
+
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionUserMessageParam, ChatCompletionAssistantMessageParam, \
     ChatCompletionSystemMessageParam, ChatCompletionToolParam
 from starlette.responses import StreamingResponse
 
-from fastapi import FastAPI, Request, HTTPException
-from threading import local
+from fastapi import FastAPI, HTTPException
 
-from agents.OpenAI_Compatible_API_Agent.Python.open_ai_helper import ChatCompletionRequest, models, Message, num_tokens, \
-    CompletionRequest
+from agents.OpenAI_Compatible_API_Agent.Python.open_ai_helper import ChatCompletionRequest, models, Message, \
+    _resp_async_generator, _chat_prompt_tokens, _usage, configure_streaming
 import uvicorn
 
 
-app = FastAPI(title="OpenAI-compatible API for PrivateGPT")
-request_context = local()
-
-
-@app.middleware("http")
-async def store_request_headers(request: Request, call_next):
-    request_context.headers = dict(request.headers)
-    response = await call_next(request)
-    return response
-
-@app.post("/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Provide an API key to connect to OpenAI-compatible API.")
     parser.add_argument("--api_key", required=True, help="API key for login")
     parser.add_argument("--base_url", required=True, help="The base url of the VLLM server")
-    args = parser.parse_args()
+    parser.add_argument("--model", default="/models/mistral-nemo-12b", help="Model name on the VLLM server")
+    parser.add_argument("--api_ip", default="0.0.0.0", help="Listen address of the proxy")
+    parser.add_argument("--api_port", type=int, default=8003, help="Listen port of the proxy")
+    parser.add_argument("--max_connections", type=int, default=100, help="Max. connections to the VLLM server")
+    parser.add_argument("--max_keepalive", type=int, default=20, help="Max. idle keep-alive connections")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Request timeout towards VLLM in seconds")
+    parser.add_argument("--http2", action="store_true", help="Use HTTP/2 towards VLLM (needs the 'h2' package)")
+    parser.add_argument("--stream_coalesce_bytes", type=int, default=None, help="See stream_coalesce_bytes in the README")
+    parser.add_argument("--stream_coalesce_ms", type=float, default=None, help="See stream_coalesce_ms in the README")
+    return parser.parse_args(argv)
 
 
-    client = OpenAI(
-        base_url=args.base_url,
-        api_key=args.api_key,
-        http_client=httpx.Client(verify=False)
-    )
+# Einmal beim Start gesetzt (Argumente, gemeinsamer Client mit Connection-Pool)
+settings = None
+client = None
+
+
+def _create_client(args) -> AsyncOpenAI:
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_keepalive)
+    try:
+        http_client = httpx.AsyncClient(verify=False, limits=limits, timeout=args.timeout, http2=args.http2)
+    except ImportError:
+        print("⚠️ HTTP/2 requested but 'h2' is not installed, using HTTP/1.1.")
+        http_client = httpx.AsyncClient(verify=False, limits=limits, timeout=args.timeout)
+    return AsyncOpenAI(base_url=args.base_url, api_key=args.api_key, http_client=http_client)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global settings, client
+    if settings is None:
+        settings = parse_args()
+    configure_streaming(settings.stream_coalesce_bytes, settings.stream_coalesce_ms)
+    client = _create_client(settings)
+    try:
+        yield
+    finally:
+        await client.close()
+
 
+app = FastAPI(title="OpenAI-compatible API for PrivateGPT", lifespan=lifespan)
 
+
+@app.post("/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
     msgs = []
     for message in request.messages:
         if message.role == "system":
@@ -60,11 +83,11 @@ async def chat_completions(request: ChatCompletionRequest):
     #if len(tools) == 0:
     #    tools = None
 
-    response = client.chat.completions.create(
-        model="/models/mistral-nemo-12b",
+    response = await client.chat.completions.create(
+        model=settings.model,
         temperature=request.temperature,
         #top_p=float(request.top_p),
-        stream=True,
+        stream=bool(request.stream),
         tools=tools or None,
         messages=msgs
     )
@@ -76,45 +99,47 @@ async def chat_completions(request: ChatCompletionRequest):
         )
 
     else:
+        choice = response.choices[0]
+        content = choice.message.content or ""
+        tool_calls = None
+        if choice.message.tool_calls:
+            tool_calls = [tool_call.model_dump() for tool_call in choice.message.tool_calls]
+        if response.usage is not None:
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            }
+        else:
+            usage = _usage(_chat_prompt_tokens(request), content)
         return {
             "id": response.id,
             "object": "chat.completion",
-            "created": time.time(),
+            "created": response.created or time.time(),
             "model": request.model,
-            "choices": [{"message": Message(role="assistant", content="Response", tool_calls=[])}],
+            "choices": [{
+                "index": 0,
+                "message": Message(role="assistant", content=content, tool_calls=tool_calls),
+                "finish_reason": choice.finish_reason
+            }],
             "citations": [],
-            "usage": {
-                "prompt_tokens": 10,
-                "completion_tokens": 10,
-                "total_tokens": 20
-            }
+            "usage": usage
         }
 
+async def _vllm_deltas(response):
+    """Text-Deltas des vLLM-Streams, sobald sie eintreffen."""
+    try:
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # Client hat abgebrochen o. ä. -> Verbindung zu vLLM nicht offen lassen
+        await response.close()
+
+
 async def _resp_async_generator_vllm(response, request):
-    partial_message = ""
-    user_input = ""
-    for message in request.messages:
-        user_input += json.dumps({'role': message.role, 'content': message.content})
-
-    i = 0
-    for chunk in response:
-        num_tokens_request, num_tokens_reply, num_tokens_overall = num_tokens(user_input, chunk.choices[0].delta.content)
-        chunk = {
-            "id": i,
-            "object": "chat.completion.chunk",
-            "created": time.time(),
-            "model": request.model,
-            "choices": [{"delta": {"content": chunk.choices[0].delta.content}}],
-            "usage": {
-                "prompt_tokens": num_tokens_request,
-                "completion_tokens": num_tokens_reply,
-                "total_tokens": num_tokens_overall
-            }
-        }
-        i = i+1
-        yield f"data: {json.dumps(chunk)}\n\n"
-        await asyncio.sleep(0.05)
-    yield "data: [DONE]\n\n"
+    async for line in _resp_async_generator(_vllm_deltas(response), request):
+        yield line
 
 
 @app.get("/models")
@@ -136,9 +161,8 @@ async def get_model(model_id: str):
 
 
 if __name__ == "__main__":
-    api_ip = "0.0.0.0"
-    api_port = 8003
-    uvicorn.run(app, host=api_ip, port=int(api_port))
+    settings = parse_args()
+    uvicorn.run(app, host=settings.api_ip, port=int(settings.api_port))
 
 
 
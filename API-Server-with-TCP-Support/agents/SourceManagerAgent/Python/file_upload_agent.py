@@ -2,7 +2,7 @@
 import ssl
 from pathlib import Path
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import logging
 import json
 import threading
@@ -17,6 +17,7 @@ from agents.SourceManagerAgent.Python.local_db import create_sql_table, list_db,
     get_from_sql_table, get_all_db_entries
 from ...AgentInterface.Python.agent import PrivateGPTAgent
 from ...AgentInterface.Python.config import Config, ConfigError
+from ...AgentInterface.Python.log_stream import log_window, iter_log_text, LogFollower, iter_follow_sse
 import os
 import platform
 import socket
@@ -43,6 +44,18 @@ class FileUploadAgent(PrivateGPTAgent):
     werkzeug_handler.setFormatter(werkzeug_formatter)
     werkzeug_logger.addHandler(werkzeug_handler)
 
+    def __init__(self, config):
+        super().__init__(config)
+        self.api_key = config.get("api_key", "default_api_key")
+        # /logs?follow=1 hält pro Follower einen Waitress-Thread -> begrenzt, Threads zusätzlich eingeplant
+        self.logs_follow_max = float(config.get("logs_follow_max_seconds", 300))
+        self.logs_follow_clients = max(0, int(config.get("logs_follow_max_clients", 4)))
+        self._log_followers = threading.BoundedSemaphore(self.logs_follow_clients) if self.logs_follow_clients else None
+        # Als gebundene Methoden registrieren: Dekoratoren im Klassenrumpf würden ohne self aufgerufen
+        app.before_request(self.authenticate)
+        app.add_url_rule('/logs', 'view_logs', self.view_logs, methods=['GET'])
+        app.add_url_rule('/status', 'status', self.status, methods=['GET'])
+
 
     def display_startup_header(self):
         server_ip = config.get("api_ip", "0.0.0.0")
@@ -98,7 +111,6 @@ class FileUploadAgent(PrivateGPTAgent):
         print(header)
         print(f"Current working directory: {os.getcwd()}")
 
-    @app.before_request
     def authenticate(self):
         # Erlaube OPTIONS-Anfragen ohne Authentifizierung
         if request.method == 'OPTIONS':
@@ -110,22 +122,48 @@ class FileUploadAgent(PrivateGPTAgent):
 
 
 
-    @app.route('/logs', methods=['GET'])
     def view_logs(self):
         """
         Endpoint, um das Flask-Log per Browser anzuzeigen.
+        Gestreamt statt komplett eingelesen: ?lines=N, ?tail=N (Bytes), ?since=<Offset>,
+        ?format=text, ?follow=1 (SSE) – wie beim ChatBot-Agenten.
         """
-        try:
-            with open('flask.log', 'r') as log_file:
-                log_content = log_file.read()
-            # Rückgabe des Logs als Text
-            return f"<pre>{log_content}</pre>", 200  # <pre> für eine schönere Darstellung
-        except FileNotFoundError:
+        log_path = Path('flask.log')
+        if not log_path.exists():
             return "Log file not found.", 404
+        tail = request.args.get("tail", type=int)
+        lines = request.args.get("lines", type=int)
+        since = request.args.get("since", type=int)
+        if since is None:
+            since = request.headers.get("Last-Event-ID", type=int)
+        try:
+            start, end = log_window(log_path, tail_bytes=tail, lines=lines, since=since)
         except Exception as e:
             return f"An error occurred: {str(e)}", 500
 
-    @app.route('/status', methods=['GET'])
+        if request.args.get("follow", "").lower() in ("1", "true", "yes"):
+            if self._log_followers is None or not self._log_followers.acquire(blocking=False):
+                return Response("Too many log followers.", status=429, headers={"Retry-After": "5"})
+            if since is None and not lines and not tail:
+                start = end  # nur neue Zeilen
+            response = Response(
+                iter_follow_sse(LogFollower(log_path, start), max_seconds=self.logs_follow_max),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+            # close() der Response kommt immer (auch wenn der Stream nie startet)
+            response.call_on_close(self._log_followers.release)
+            return response
+
+        as_html = request.args.get("format", "html").lower() != "text"
+        # <pre> für eine schönere Darstellung
+        return Response(
+            iter_log_text(log_path, start, end, as_html=as_html),
+            status=200,
+            mimetype="text/html" if as_html else "text/plain",
+            headers={"X-Log-Offset": str(end)}
+        )
+
     def status(self):
         """
         Endpoint zur Überprüfung des Serverstatus.
@@ -137,7 +175,8 @@ class FileUploadAgent(PrivateGPTAgent):
         server_ip = config.get("api_ip", "0.0.0.0")
         server_port = config.get("api_port", 5001)
 
-        serve(app, host=server_ip, port=int(server_port))
+        # Waitress-Standard (4 Threads) plus je einer pro möglichem Log-Follower
+        serve(app, host=server_ip, port=int(server_port), threads=4 + self.logs_follow_clients)
 
     def delete_source(self, source_id, use_ssl=False, accept_self_signed=False):
         """
@@ -1,9 +1,11 @@
 # agent.py
 
+import asyncio
 import logging
 import json
 import atexit
-from .network import NetworkClient, NetworkError
+import threading
+from .network import NetworkClient, AsyncNetworkClient, NetworkError
 from .color import Color
 from .language import languages
 
@@ -12,20 +14,7 @@ class GroupValidationError(Exception):
 
 class PrivateGPTAgent:
     def __init__(self, config):
-        self.mcp_config = config.get("mcp_server")
-        self.mcp_host = self.mcp_config.get("host")
-        self.mcp_port = self.mcp_config.get("port")
-        
-        self.email = config.get("email")
-        self.password = config.get("password")
-        self.chosen_groups = config.get("groups", [])
-        self.language = config.get("language", "en")
-
-        if self.language not in languages:
-            self.language = "en"
-            logging.warning(f"Unsupported language. Fallback to English.")
-
-        self.lang = languages[self.language]
+        self._init_settings(config)
 
         # Initialize new MCP Network Client
         # Note: Assuming config has use_ssl or defaults to False
@@ -45,21 +34,42 @@ class PrivateGPTAgent:
         if self.login():
             # Get groups via MCP tool
             self.allowed_groups = self.list_personal_groups()
-            
-            # Validate groups
-            invalid = self.validate_groups(self.chosen_groups)
-            if invalid:
-                print(self.lang["invalid_group"].format(groups=invalid), flush=True)
-                raise GroupValidationError(str(invalid))
+            self._check_allowed_groups()
         else:
             self.allowed_groups = []
 
+    def _init_settings(self, config):
+        self.mcp_config = config.get("mcp_server")
+        self.mcp_host = self.mcp_config.get("host")
+        self.mcp_port = self.mcp_config.get("port")
+        
+        self.email = config.get("email")
+        self.password = config.get("password")
+        self.chosen_groups = config.get("groups", [])
+        self.token_refreshes = 0  # Anzahl Re-Logins wegen abgelaufenem Token (Monitoring)
+        self._group_index = (frozenset(), {})
+        self._group_refresh = None
+        self.language = config.get("language", "en")
+
+        if self.language not in languages:
+            self.language = "en"
+            logging.warning(f"Unsupported language. Fallback to English.")
+
+        self.lang = languages[self.language]
+
         self.knowledge_base = {
             "What is AI?": self.lang["knowledge_ai"],
             "Who created Python?": self.lang["knowledge_python"],
             "What is Machine Learning?": self.lang["knowledge_ml"]
         }
 
+    def _check_allowed_groups(self):
+        # Validate groups
+        invalid = self.validate_groups(self.chosen_groups)
+        if invalid:
+            print(self.lang["invalid_group"].format(groups=invalid), flush=True)
+            raise GroupValidationError(str(invalid))
+
     def get_lang_message(self, key, **kwargs):
         message = self.lang.get(key, "Message not defined.")
         try:
@@ -67,59 +77,129 @@ class PrivateGPTAgent:
         except Exception:
             return message
 
+    # Gruppen-Index: allowed_groups ist ein frozenset; zusammen mit dem Memo der bereits geprüften
+    # Gruppen-Tupel wird es als ein Objekt getauscht (Refresh), Requests sehen also
+    # immer einen konsistenten Stand ohne Lock.
+    GROUP_MEMO_MAX = 1024
+
+    @property
+    def allowed_groups(self):
+        return self._group_index[0]
+
+    @allowed_groups.setter
+    def allowed_groups(self, groups):
+        self._group_index = (frozenset(groups or ()), {})
+
+    def _group_view(self, groups):
+        """(ungültige, erlaubte) Gruppen als Tupel – pro Gruppen-Tupel nur einmal berechnet."""
+        allowed, memo = self._group_index
+        try:
+            key = tuple(groups)
+            view = memo.get(key)
+        except TypeError:  # nicht hashbare Einträge -> ohne Memo
+            key, view = None, None
+        if view is None:
+            names = tuple(g for g in groups if isinstance(g, str))  # Gruppennamen sind Strings
+            invalid = tuple(g for g in groups if not isinstance(g, str) or g not in allowed)
+            stripped = (g.strip() for g in names)
+            view = (invalid, tuple(g for g in stripped if g and g in allowed))
+            if key is not None:
+                if len(memo) >= self.GROUP_MEMO_MAX:
+                    memo.clear()
+                memo[key] = view
+        return view
+
     def validate_groups(self, groups):
         if groups is None:
             return []
-        invalid = [g for g in groups if g not in self.allowed_groups]
+        invalid = self._group_view(groups)[0]
         if invalid:
-            logging.error(self.get_lang_message("group_validation_error", error=invalid))
-            return invalid
+            logging.error(self.get_lang_message("group_validation_error", error=list(invalid)))
+            return list(invalid)
         return []
 
+    def _swap_allowed_groups(self, groups):
+        """Neue Gruppenliste übernehmen; leere Antwort (Fehler) behält den alten Stand."""
+        if not groups:
+            return False
+        new = frozenset(groups)
+        old = self.allowed_groups
+        if new != old:
+            logging.info(f"Gruppen aktualisiert: +{sorted(new - old)} -{sorted(old - new)}")
+            self.allowed_groups = new
+        return True
+
+    def refresh_allowed_groups(self):
+        return self._swap_allowed_groups(self.list_personal_groups())
+
+    def start_group_refresh(self, interval):
+        """Gruppen alle `interval` Sekunden im Hintergrund neu holen (0 = aus)."""
+        if not interval or interval <= 0 or self._group_refresh is not None:
+            return
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.refresh_allowed_groups()
+                except Exception as e:
+                    logging.warning(f"Group refresh failed: {e}")
+
+        threading.Thread(target=loop, name="group-refresh", daemon=True).start()
+        self._group_refresh = stop
+
+    def stop_group_refresh(self):
+        if self._group_refresh is not None:
+            self._group_refresh.set()
+            self._group_refresh = None
+
     def login(self):
-        payload = {
-            "email": self.email,
-            "password": self.password
-        }
         logging.info(self.get_lang_message("login_attempt"))
         try:
             # MCP TOOL CALL: login
-            result = self.network_client.call_tool("login", payload)
-            
-            # Ergebnis parsen (kann JSON-Dict oder Error-Dict mit Rohtext sein)
-            parsed_data = self._parse_mcp_content(result)
-            
-            # FALL 1: Standard JSON Antwort { "data": { "token": "..." } }
-            if isinstance(parsed_data, dict) and "data" in parsed_data and "token" in parsed_data["data"]:
-                self.token = parsed_data["data"]["token"]
+            result = self.network_client.call_tool("login", self._login_args())
+            return self._handle_login_result(result)
+        except NetworkError as e:
+            logging.error(self.get_lang_message("login_failed", message=str(e)))
+            return False
+
+    def _login_args(self):
+        return {
+            "email": self.email,
+            "password": self.password
+        }
+
+    def _handle_login_result(self, result):
+        # Ergebnis parsen (kann JSON-Dict oder Error-Dict mit Rohtext sein)
+        parsed_data = self._parse_mcp_content(result)
+        
+        # FALL 1: Standard JSON Antwort { "data": { "token": "..." } }
+        if isinstance(parsed_data, dict) and "data" in parsed_data and "token" in parsed_data["data"]:
+            self.token = parsed_data["data"]["token"]
+            logging.info(self.get_lang_message("login_success"))
+            return True
+
+        # FALL 2: Server sendet Token als reinen Text (wird vom Parser als "error" markiert)
+        # Wir prüfen, ob der Text wie ein Token aussieht (enthält Pipe '|' und ist kein Fehlertext)
+        if isinstance(parsed_data, dict) and parsed_data.get("status") == "error":
+            raw_text = parsed_data.get("message", "").strip()
+            # Ein Token ist normalerweise lang und hat das Format 'ID|HASH'
+            if "|" in raw_text and len(raw_text) > 10 and "error" not in raw_text.lower():
+                self.token = raw_text
                 logging.info(self.get_lang_message("login_success"))
                 return True
 
-            # FALL 2: Server sendet Token als reinen Text (wird vom Parser als "error" markiert)
-            # Wir prüfen, ob der Text wie ein Token aussieht (enthält Pipe '|' und ist kein Fehlertext)
-            if isinstance(parsed_data, dict) and parsed_data.get("status") == "error":
-                raw_text = parsed_data.get("message", "").strip()
-                # Ein Token ist normalerweise lang und hat das Format 'ID|HASH'
-                if "|" in raw_text and len(raw_text) > 10 and "error" not in raw_text.lower():
-                    self.token = raw_text
-                    logging.info(self.get_lang_message("login_success"))
-                    return True
-
-            # FALL 3: Parser hat direkt einen String zurückgegeben (falls er quoted war)
-            if isinstance(parsed_data, str):
-                if "|" in parsed_data and len(parsed_data) > 10:
-                    self.token = parsed_data
-                    logging.info(self.get_lang_message("login_success"))
-                    return True
-
-            # Fehlgeschlagen
-            msg = parsed_data.get("message", "Login failed") if isinstance(parsed_data, dict) else str(parsed_data)
-            logging.error(self.get_lang_message("login_failed", message=msg))
-            return False
+        # FALL 3: Parser hat direkt einen String zurückgegeben (falls er quoted war)
+        if isinstance(parsed_data, str):
+            if "|" in parsed_data and len(parsed_data) > 10:
+                self.token = parsed_data
+                logging.info(self.get_lang_message("login_success"))
+                return True
 
-        except NetworkError as e:
-            logging.error(self.get_lang_message("login_failed", message=str(e)))
-            return False
+        # Fehlgeschlagen
+        msg = parsed_data.get("message", "Login failed") if isinstance(parsed_data, dict) else str(parsed_data)
+        logging.error(self.get_lang_message("login_failed", message=msg))
+        return False
 
     def list_personal_groups(self):
         if not self.token:
@@ -130,77 +210,91 @@ class PrivateGPTAgent:
             result = self.network_client.call_tool("list_groups", {
                 "token": self.token
             })
-            
-            parsed_data = self._parse_mcp_content(result)
-            
-            # Navigate structure based on Node Server: res.data.data.personalGroups
-            if parsed_data and "data" in parsed_data:
-                # Sometimes it might be directly in data, or nested depending on API
-                # Based on server.js: res.data.data or res.data
-                inner_data = parsed_data["data"]
-                if "personalGroups" in inner_data:
-                    groups = inner_data["personalGroups"]
-                    logging.info(self.lang["personal_groups"].format(groups=groups))
-                    return groups
-                
-            return []
+            return self._handle_groups_result(result)
         except NetworkError as e:
             logging.error(self.lang["list_groups_failed"].format(message=str(e)))
             return []
 
+    def _handle_groups_result(self, result):
+        parsed_data = self._parse_mcp_content(result)
+        
+        # Navigate structure based on Node Server: res.data.data.personalGroups
+        if parsed_data and "data" in parsed_data:
+            # Sometimes it might be directly in data, or nested depending on API
+            # Based on server.js: res.data.data or res.data
+            inner_data = parsed_data["data"]
+            if "personalGroups" in inner_data:
+                groups = inner_data["personalGroups"]
+                logging.info(self.lang["personal_groups"].format(groups=groups))
+                return groups
+            
+        return []
+
     def query_private_gpt(self, prompt, use_public=False, language="en", groups=None, _retry_on_token_expired=True):
         if not self.token:
             return json.dumps({"error": self.get_lang_message("authentication_failed")})
 
-        if groups is None:
-            groups = self.chosen_groups
-        relevant_groups = [g for g in groups if g in self.allowed_groups]
-
         try:
             # MCP TOOL CALL: chat
-            # Note: Server expects 'question', 'language', 'usePublic', 'groups'
-            args = {
-                "token": self.token,
-                "question": prompt,
-                "language": language,
-                "usePublic": use_public,
-                "groups": relevant_groups
-            }
-            
-            result = self.network_client.call_tool("chat", args)
+            result = self.network_client.call_tool("chat", self._chat_args(prompt, use_public, language, groups))
             parsed_data = self._parse_mcp_content(result)
 
-            # Check for Token Expiry inside the response data
-            # (Assuming the API returns 401/403 equivalent in the message body if failed)
-            if parsed_data and isinstance(parsed_data, dict):
-                status = parsed_data.get("status")
-                message = parsed_data.get("message", "").lower()
-                
-                if status in [401, 403] or "token expired" in message:
-                     if _retry_on_token_expired:
-                        logging.warning("Token expired, refreshing...")
-                        self.token = None
-                        if self.login():
-                            return self.query_private_gpt(prompt, use_public, language, groups, False)
-                        else:
-                            return json.dumps({"error": "Re-login failed"})
-
-                # Success case
-                # API usually returns { content: { answer: "..." } } or similar
-                # Adjust based on exact PGPT API response.
-                if "content" in parsed_data and "answer" in parsed_data["content"]:
-                    return json.dumps({"answer": parsed_data["content"]["answer"]})
-                
-                # Fallback if structure is flat or different
-                if "answer" in parsed_data:
-                     return json.dumps({"answer": parsed_data["answer"]})
+            if self._token_expired(parsed_data):
+                 if _retry_on_token_expired:
+                    logging.warning("Token expired, refreshing...")
+                    self.token = None
+                    self.token_refreshes += 1
+                    if self.login():
+                        return self.query_private_gpt(prompt, use_public, language, groups, False)
+                    else:
+                        return json.dumps({"error": "Re-login failed"})
 
-            return json.dumps({"answer": str(parsed_data)})
+            return self._chat_result(parsed_data)
 
         except NetworkError as e:
             return json.dumps({"error": str(e)})
 
+    def _chat_args(self, prompt, use_public, language, groups):
+        if groups is None:
+            groups = self.chosen_groups
+        relevant_groups = list(self._group_view(groups)[1])
+
+        # Note: Server expects 'question', 'language', 'usePublic', 'groups'
+        return {
+            "token": self.token,
+            "question": prompt,
+            "language": language,
+            "usePublic": use_public,
+            "groups": relevant_groups
+        }
+
+    @staticmethod
+    def _token_expired(parsed_data):
+        # Check for Token Expiry inside the response data
+        # (Assuming the API returns 401/403 equivalent in the message body if failed)
+        if parsed_data and isinstance(parsed_data, dict):
+            status = parsed_data.get("status")
+            message = parsed_data.get("message", "").lower()
+            return status in [401, 403] or "token expired" in message
+        return False
+
+    @staticmethod
+    def _chat_result(parsed_data):
+        if parsed_data and isinstance(parsed_data, dict):
+            # Success case
+            # API usually returns { content: { answer: "..." } } or similar
+            # Adjust based on exact PGPT API response.
+            if "content" in parsed_data and "answer" in parsed_data["content"]:
+                return json.dumps({"answer": parsed_data["content"]["answer"]})
+            
+            # Fallback if structure is flat or different
+            if "answer" in parsed_data:
+                 return json.dumps({"answer": parsed_data["answer"]})
+
+        return json.dumps({"answer": str(parsed_data)})
+
     def logout(self):
+        self.stop_group_refresh()
         if not self.token:
             return
 
@@ -269,3 +363,118 @@ class PrivateGPTAgent:
                     print(f"{Color.FAIL}{self.get_lang_message('agent_error', error=parsed_result.get('error'))}{Color.ENDC}", flush=True)
             except (KeyboardInterrupt, EOFError):
                 break
+
+
+class AsyncPrivateGPTAgent(PrivateGPTAgent):
+    """
+    asyncio variant of PrivateGPTAgent for ASGI services.
+    Construction does no I/O; call `await agent.start()` once inside the event loop.
+    Argument building and response parsing are shared with the synchronous agent.
+    """
+
+    def __init__(self, config):
+        self._init_settings(config)
+        self.network_client = AsyncNetworkClient(
+            self.mcp_host,
+            self.mcp_port,
+            language=self.language,
+            use_ssl=self.mcp_config.get("use_ssl", False)
+        )
+        self.token = None
+        self.allowed_groups = []
+        self._login_lock = asyncio.Lock()
+
+    async def start(self):
+        if await self.alogin():
+            self.allowed_groups = await self.alist_personal_groups()
+            self._check_allowed_groups()
+        return bool(self.token)
+
+    async def alogin(self):
+        logging.info(self.get_lang_message("login_attempt"))
+        try:
+            result = await self.network_client.call_tool("login", self._login_args())
+            return self._handle_login_result(result)
+        except NetworkError as e:
+            logging.error(self.get_lang_message("login_failed", message=str(e)))
+            return False
+
+    async def _relogin(self, expired_token):
+        """Only one coroutine re-logs in; the others wait and reuse the fresh token."""
+        async with self._login_lock:
+            if self.token and self.token != expired_token:
+                return True
+            self.token = None
+            self.token_refreshes += 1
+            return await self.alogin()
+
+    async def arefresh_allowed_groups(self):
+        return self._swap_allowed_groups(await self.alist_personal_groups())
+
+    def start_group_refresh(self, interval):
+        """Wie beim synchronen Agenten, aber als Task im laufenden Event-Loop."""
+        if not interval or interval <= 0 or self._group_refresh is not None:
+            return
+        self._group_refresh = asyncio.get_running_loop().create_task(self._group_refresh_loop(interval))
+
+    async def _group_refresh_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.arefresh_allowed_groups()
+            except Exception as e:
+                logging.warning(f"Group refresh failed: {e}")
+
+    def stop_group_refresh(self):
+        if self._group_refresh is not None:
+            self._group_refresh.cancel()
+            self._group_refresh = None
+
+    async def alist_personal_groups(self):
+        if not self.token:
+            return []
+        try:
+            result = await self.network_client.call_tool("list_groups", {"token": self.token})
+            return self._handle_groups_result(result)
+        except NetworkError as e:
+            logging.error(self.lang["list_groups_failed"].format(message=str(e)))
+            return []
+
+    async def aquery_private_gpt(self, prompt, use_public=False, language="en", groups=None, _retry_on_token_expired=True):
+        if not self.token:
+            return json.dumps({"error": self.get_lang_message("authentication_failed")})
+
+        try:
+            args = self._chat_args(prompt, use_public, language, groups)
+            result = await self.network_client.call_tool("chat", args)
+            parsed_data = self._parse_mcp_content(result)
+
+            if self._token_expired(parsed_data) and _retry_on_token_expired:
+                logging.warning("Token expired, refreshing...")
+                if await self._relogin(args["token"]):
+                    return await self.aquery_private_gpt(prompt, use_public, language, groups, False)
+                return json.dumps({"error": "Re-login failed"})
+
+            return self._chat_result(parsed_data)
+
+        except NetworkError as e:
+            return json.dumps({"error": str(e)})
+
+    async def arespond(self, user_input, groups=None):
+        response = self.knowledge_base.get(user_input, None)
+        if response:
+            return json.dumps({"answer": response})
+        return await self.aquery_private_gpt(user_input, groups=groups)
+
+    async def alogout(self):
+        self.stop_group_refresh()
+        if not self.token:
+            return
+        try:
+            await self.network_client.call_tool("logout", {"token": self.token})
+            logging.info(self.get_lang_message("logout_success"))
+            self.token = None
+        except NetworkError:
+            pass
+        finally:
+            await self.network_client.close()
@@ -0,0 +1,192 @@
+# Python/logging_setup.py
+"""
+Gemeinsames Logging-Setup der Agenten (ChatBot, IoT, ISM).
+
+- Request-Threads legen Records nur in eine Queue (QueueHandler); Formatieren und
+  Schreiben nach stdout/Datei erledigt ein QueueListener-Thread. Ein blockierendes
+  stdout (Pipe, langsames Terminal, Log-Collector) bremst so keine Requests mehr.
+- Formatter mit festen Spaltenbreiten (Emoji + component/tag/message_type);
+  gepolsterte Spalten und der Zeitstempel (pro Sekunde) werden gecacht.
+- DebugSampler: lässt auf Hot-Paths (z. B. Request-Tracing) nur jede n-te
+  DEBUG-Meldung durch, bevor die Meldung überhaupt gebaut wird.
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+COMPONENT_WIDTH = 16
+TAG_WIDTH       = 10
+MESSAGE_WIDTH   = 12
+
+LEVEL_ICONS = {
+    'DEBUG': '🐛', 'INFO': 'ℹ️', 'WARNING': '⚠️', 'ERROR': '❌', 'CRITICAL': '‼️'
+}
+
+# ───────────────────────────────────────────────────────────────
+# Formatter
+# ───────────────────────────────────────────────────────────────
+class FixedWidthFormatter(logging.Formatter):
+    """
+    "<Zeit> | <Icon> <component> :<tag> | <message_type> | <Meldung>"
+
+    Läuft nur im Listener-Thread, daher ohne Locks. Die Records werden nicht
+    verändert (andere Handler sehen die Original-Attribute).
+    """
+
+    _PAD_CACHE_MAX = 4096
+
+    def __init__(self, default_component: str = "main", datefmt: str = "%Y-%m-%d %H:%M:%S"):
+        super().__init__(datefmt=datefmt)
+        self.default_component = default_component
+        self._pad_cache = {}
+        self._time_second = None
+        self._time_text = ""
+
+    def _pad(self, text, width):
+        key = (text, width)
+        padded = self._pad_cache.get(key)
+        if padded is None:
+            if len(self._pad_cache) >= self._PAD_CACHE_MAX:
+                self._pad_cache.clear()
+            padded = f"{text or '':<{width}}"[:width]
+            self._pad_cache[key] = padded
+        return padded
+
+    def _asctime(self, created):
+        second = int(created)
+        if second != self._time_second:
+            self._time_second = second
+            self._time_text = time.strftime(self.datefmt, self.converter(created))
+        return self._time_text
+
+    def format(self, record):
+        line = "{} | {} {} :{} | {} | {}".format(
+            self._asctime(record.created),
+            LEVEL_ICONS.get(record.levelname, record.levelname),
+            self._pad(getattr(record, "component", self.default_component), COMPONENT_WIDTH),
+            self._pad(getattr(record, "tag", "-"), TAG_WIDTH),
+            self._pad(getattr(record, "message_type", "-"), MESSAGE_WIDTH),
+            record.getMessage(),
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line = f"{line}\n{record.exc_text}"
+        return line
+
+# ───────────────────────────────────────────────────────────────
+# Sampling für DEBUG-Hot-Paths
+# ───────────────────────────────────────────────────────────────
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+class DebugSampler:
+    """
+    `if sampler(): logging.debug(...)` – True für jede `every`-te Meldung,
+    und nur, wenn DEBUG überhaupt aktiv ist (f-Strings werden sonst gar nicht gebaut).
+    every=1: alle, every<=0: keine. Default aus LOG_DEBUG_SAMPLE (1).
+    """
+
+    def __init__(self, every=None, logger=None):
+        self.every = _env_int("LOG_DEBUG_SAMPLE", 1) if every is None else int(every)
+        self._logger = logger or logging.getLogger()
+        self._counter = itertools.count()
+
+    def __call__(self):
+        if self.every <= 0 or not self._logger.isEnabledFor(logging.DEBUG):
+            return False
+        return self.every == 1 or next(self._counter) % self.every == 0
+
+# ───────────────────────────────────────────────────────────────
+# Setup
+# ───────────────────────────────────────────────────────────────
+class _DroppingQueueHandler(QueueHandler):
+    """Volle Queue -> Record verwerfen und zählen, statt den Aufrufer zu blockieren."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+_listener = None
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # arbeitet die Queue noch ab
+        _listener = None
+
+def setup_logging(level="INFO", default_component="main", fmt=None, log_file=None,
+                  access_logger=None, access_log_file=None, access_level=logging.ERROR,
+                  max_bytes=2 * 1024 * 1024, backup_count=2, queue_size=10000):
+    """
+    Richtet das Root-Logging asynchron ein und gibt den QueueListener zurück.
+
+    level            : Name ("DEBUG", ...) oder Zahl
+    default_component: component-Spalte für Records ohne extra={"component": ...}
+    fmt              : statt des Spalten-Formatters ein klassisches Format (z. B. "%(message)s")
+    log_file         : zusätzlich alle Records rotierend in diese Datei
+    access_logger    : Logger des HTTP-Servers (werkzeug, uvicorn.error, ...); dessen Records
+                       ab `access_level` landen zusätzlich rotierend in `access_log_file`
+    Mehrfacher Aufruf ersetzt das vorherige Setup.
+    """
+    global _listener
+    if isinstance(level, str):
+        level = getattr(logging, level.upper(), logging.INFO)
+
+    formatter = logging.Formatter(fmt) if fmt else FixedWidthFormatter(default_component)
+
+    handlers = []
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(formatter)
+    handlers.append(console)
+
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    if access_logger:
+        access = logging.getLogger(access_logger)
+        access.setLevel(access_level)
+        access.handlers.clear()  # Records laufen über den Root-Logger in die Queue
+        if access_log_file:
+            access_handler = RotatingFileHandler(
+                access_log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            access_handler.setLevel(access_level)
+            access_handler.addFilter(logging.Filter(access_logger))
+            access_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+            handlers.append(access_handler)
+
+    _stop_listener()
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    # QueueHandler ohne Formatter: im Aufrufer-Thread wird nur die Meldung zusammengesetzt
+    root.addHandler(_DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def dropped_records() -> int:
+    """Anzahl wegen voller Queue verworfener Records."""
+    return _DroppingQueueHandler.dropped
+
+atexit.register(_stop_listener)
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 import json
 import logging
@@ -6,6 +7,11 @@ import threading
 import uuid
 from .language import languages
 
+try:
+    import httpx  # only needed by AsyncNetworkClient (ASGI agents)
+except ImportError:
+    httpx = None
+
 class NetworkError(Exception):
     pass
 
@@ -172,3 +178,146 @@ class NetworkClient:
         self.listening = False
         if self.session:
             self.session.close()
+
+
+class AsyncNetworkClient:
+    """
+    asyncio variant of NetworkClient for the ASGI agents (MCP over SSE, httpx).
+    One SSE listener task resolves a Future per JSON-RPC id, so thousands of tool calls
+    can be in flight without holding a thread each.
+    """
+
+    def __init__(
+        self, server_ip, server_port, language="en",
+        retries=3, delay=5, use_ssl=False, accept_self_signed=True, timeout=60
+    ):
+        protocol = "https" if use_ssl else "http"
+        self.base_url = f"{protocol}://{server_ip}:{server_port}"
+
+        self.retries = retries
+        self.delay = delay
+        self.timeout = timeout
+        self.language = language if language in languages else "en"
+        self.lang = languages[self.language]
+        self.verify_ssl = not (use_ssl and accept_self_signed)
+
+        self.client = None
+        self.post_endpoint = None
+        self.pending_requests = {}
+        self._listener = None
+        self._connect_lock = asyncio.Lock()
+        self._endpoint_ready = asyncio.Event()
+
+    def get_lang_message(self, key, **kwargs):
+        message = self.lang.get(key, "Message not defined.")
+        try:
+            return message.format(**kwargs)
+        except Exception:
+            return message
+
+    async def connect(self):
+        """Opens the SSE stream (once) and waits briefly for the 'endpoint' event."""
+        async with self._connect_lock:
+            if self.post_endpoint and self._listener and not self._listener.done():
+                return
+
+            url = f"{self.base_url}/sse"
+            logging.info(f"Connecting to MCP SSE Stream at {url}...")
+            if httpx is None:
+                raise NetworkError("httpx is required for the async MCP client. Install via 'pip install httpx'.")
+            if self.client is None:
+                self.client = httpx.AsyncClient(
+                    verify=self.verify_ssl,
+                    timeout=httpx.Timeout(self.timeout, connect=5),
+                    limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+                )
+
+            self._endpoint_ready.clear()
+            self._listener = asyncio.create_task(self._listen_sse(url))
+            try:
+                await asyncio.wait_for(self._endpoint_ready.wait(), timeout=5)
+                logging.info(self.get_lang_message("connection_established"))
+            except asyncio.TimeoutError:
+                if self._listener.done():
+                    raise NetworkError(f"Could not connect to MCP server: {self.base_url}")
+                logging.warning("Connected to SSE, but no endpoint received yet.")
+
+    async def _listen_sse(self, url):
+        """Background task to process Server-Sent Events."""
+        try:
+            async with self.client.stream("GET", url, timeout=httpx.Timeout(None, connect=5)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data_str = line[6:]
+                    if data_str.startswith("/") or data_str.startswith("http"):
+                        self.post_endpoint = data_str.strip()
+                        logging.debug(f"MCP Endpoint set to: {self.post_endpoint}")
+                        self._endpoint_ready.set()
+                        continue
+                    try:
+                        data = json.loads(data_str)
+                    except json.JSONDecodeError:
+                        continue
+                    future = self.pending_requests.get(data.get("id"))
+                    if future is not None and not future.done():
+                        future.set_result(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"SSE Listener crashed: {e}")
+        finally:
+            self.post_endpoint = None
+            for future in list(self.pending_requests.values()):
+                if not future.done():
+                    future.set_exception(NetworkError("MCP SSE stream closed"))
+
+    async def call_tool(self, tool_name, arguments):
+        """Sends a JSON-RPC 2.0 request to call a tool and awaits the SSE response."""
+        if not self.post_endpoint:
+            await self.connect()
+            if not self.post_endpoint:
+                raise NetworkError("No MCP endpoint available. Connection lost?")
+
+        request_id = str(uuid.uuid4())
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "tools/call",
+            "params": {
+                "name": tool_name,
+                "arguments": arguments
+            },
+            "id": request_id
+        }
+
+        target_url = self.post_endpoint
+        if target_url.startswith("/"):
+            target_url = f"{self.base_url}{target_url}"
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[request_id] = future
+        try:
+            resp = await self.client.post(target_url, json=payload)
+            resp.raise_for_status()
+            full_response = await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise NetworkError("Timeout waiting for MCP tool response")
+        except NetworkError:
+            raise
+        except Exception as e:
+            logging.error(self.get_lang_message("connection_error", error=str(e)))
+            raise NetworkError(str(e))
+        finally:
+            self.pending_requests.pop(request_id, None)
+
+        if "error" in full_response:
+            raise NetworkError(f"MCP Error: {full_response['error']['message']}")
+        return full_response.get("result", {})
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        if self.client:
+            await self.client.aclose()
+            self.client = None
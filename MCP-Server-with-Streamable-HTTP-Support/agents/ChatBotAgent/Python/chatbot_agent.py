@@ -3,16 +3,18 @@
 Fujitsu PrivateGPT ChatBot Agent – optimierte Flask/Waitress-API
 
 Speed-Ups (ohne Funktionsänderung der API):
-- MCP-Connectivity-Check mit Cache/TTL (vermeidet TCP-Handshakes pro Request)
+- MCP-Connectivity über Hintergrund-Prober (Jitter, Hysterese) – kein Check im Request-Pfad
 - Keep-Alive/Verbindungs-Reuse serverseitig (Waitress-Settings) + Hinweise für Client
 - Schneller JSON-Pfad via orjson/ujson (Fallback: stdlib json)
-- Log-I/O: Rotierende Logs, schlankes Format, optionales Tail in /logs
+- Log-I/O: Rotierende Logs, schlankes Format; /logs streamt (Zeilen-Tail, ?since, SSE-Follow)
 - Konstantzeit-Vergleich für API-Key (hmac.compare_digest)
 - O(1)-Sprachprüfung via Set
 - Leichtgewichtiges Request-Tracing zum Aufspüren von Zusatzaufrufen
+- Prometheus-Metriken unter /metrics (vorab gebundene Label-Kinder)
+- Multi-Worker-Betrieb (chatbot_supervisor): Token/Gruppen/Antwort-Cache über SQLite geteilt
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import logging
 import threading
 from waitress import serve
@@ -23,90 +25,27 @@ import platform
 import socket
 import sys
 import time
-import hmac
-from logging.handlers import RotatingFileHandler
-import http.client # Add this for light-weight HTTP check
 
-# ───────────────────────────────────────────────────────────────
-# Optionale schnelle JSON-Engines (orjson > ujson > json)
-# ───────────────────────────────────────────────────────────────
-try:
-    import orjson as _fastjson
-    _fast_loads = _fastjson.loads
-
-    def _fast_dumps(obj):
-        # orjson.dumps -> bytes
-        return _fastjson.dumps(obj).decode("utf-8")
-except Exception:
-    try:
-        import ujson as _fastjson
-        _fast_loads = _fastjson.loads
-
-        def _fast_dumps(obj):
-            return _fastjson.dumps(obj)
-    except Exception:
-        import json as _fastjson
-        _fast_loads = _fastjson.loads
-
-        def _fast_dumps(obj):
-            return _fastjson.dumps(obj)
+from . import chatbot_metrics as metrics
+from .chatbot_shared_state import SharedState, create_agent
+from .chatbot_common import (
+    _fast_dumps, setup_logging, parse_ask_request, mcp_failure_message,
+    answer_object, api_key_valid, McpHealthProber, LOG_FILE,
+    AdmissionController, AdmissionRejected, parse_deadline, deadline_expired, DEADLINE_EXCEEDED,
+)
 
 # ───────────────────────────────────────────────────────────────
 # Agent-Imports
 # ───────────────────────────────────────────────────────────────
-from ...AgentInterface.Python.agent import PrivateGPTAgent, GroupValidationError
+from ...AgentInterface.Python.agent import GroupValidationError
 from ...AgentInterface.Python.config import Config, ConfigError
 from ...AgentInterface.Python.language import languages
+from ...AgentInterface.Python.logging_setup import DebugSampler
+from ...AgentInterface.Python.log_stream import log_window, iter_log_text, LogFollower, iter_follow_sse
 
 # ───────────────────────────────────────────────────────────────
-# Logging (schlank, rotierend)
+# Logging (schlank, rotierend) – Formatter/Setup in chatbot_common
 # ───────────────────────────────────────────────────────────────
-TIMESTAMP_WIDTH = 20
-COMPONENT_WIDTH = 16
-TAG_WIDTH       = 10
-MESSAGE_WIDTH   = 12
-
-def _fmt_fixed(text: str, width: int, align: str = "<") -> str:
-    return f"{text or '':{align}{width}}"[:width]
-
-class CustomFormatter(logging.Formatter):
-    LEVEL_ICONS = {
-        'DEBUG': '🐛', 'INFO': 'ℹ️', 'WARNING': '⚠️', 'ERROR': '❌', 'CRITICAL': '‼️'
-    }
-
-    def format(self, record):
-        record.level_icon   = self.LEVEL_ICONS.get(record.levelname, record.levelname)
-        record.component    = _fmt_fixed(getattr(record, "component", "main"), COMPONENT_WIDTH)
-        record.tag          = _fmt_fixed(getattr(record, "tag", "-"), TAG_WIDTH)
-        record.message_type = _fmt_fixed(getattr(record, "message_type", "-"), MESSAGE_WIDTH)
-        return "{asctime} | {level_icon} {component} :{tag} | {message_type} | {msg}".format(
-            asctime=self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
-            level_icon=record.level_icon,
-            component=record.component,
-            tag=record.tag,
-            message_type=record.message_type,
-            msg=record.getMessage()
-        )
-
-def setup_logging(level_name: str = "INFO"):
-    log_level = getattr(logging, level_name.upper(), logging.INFO)
-
-    # Console
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setFormatter(CustomFormatter())
-
-    logging.basicConfig(level=log_level, handlers=[stream_handler])
-
-    # Werkzeug (HTTP-Access) -> rotierende Datei
-    werk = logging.getLogger('werkzeug')
-    werk.setLevel(logging.ERROR)
-    werk.handlers.clear()
-    file_handler = RotatingFileHandler(
-        "flask.log", maxBytes=2 * 1024 * 1024, backupCount=2, encoding="utf-8"
-    )
-    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
-    werk.addHandler(file_handler)
-
 # LOG_LEVEL kann via Env gesetzt werden, z. B. LOG_LEVEL=DEBUG
 setup_logging(os.environ.get("LOG_LEVEL", "DEBUG"))
 
@@ -134,9 +73,14 @@ except ConfigError as e:
 # ───────────────────────────────────────────────────────────────
 # Agent initialisieren
 # ───────────────────────────────────────────────────────────────
+# Im Multi-Worker-Betrieb teilen sich alle Worker Token, Gruppen und Antwort-Cache
+shared_state = SharedState.from_config(config)
+
 try:
-    agent = PrivateGPTAgent(config)
+    agent = create_agent(config, shared_state)
     logging.info("PrivateGPTAgent initialisiert.", extra={"component": "Agent", "tag": "INIT", "message_type": "INFO"})
+    # Gruppenänderungen auf dem Server ohne Neustart übernehmen (atomarer Tausch im Agenten)
+    agent.start_group_refresh(float(config.get("groups_refresh_seconds", 300)))
 except GroupValidationError as e:
     logging.error(f"Group Validation Error: {e}", extra={"component": "Agent", "tag": "VALIDATION", "message_type": "ERROR"})
     sys.exit(1)
@@ -150,46 +94,18 @@ except Exception as e:
 api_key = config.get("api_key", "default_api_key")
 _languages_set = set(languages)  # O(1)-Mitgliedschaft
 
-# MCP-Check mit Cache/TTL (Standard 5s, per config überschreibbar)
-_MCP_CACHE = {"ok": False, "ts": 0.0}
-_MCP_TTL = float(config.get("mcp_check_ttl_seconds", 5))
+# MCP-Health: Hintergrund-Prober statt Check im Request-Pfad (Requests lesen nur das Flag)
+mcp_health = McpHealthProber.from_config(config)
+mcp_health.start()
 
-def _connect_to_mcp_server_once() -> bool:
-    """
-    Checks if MCP Server is reachable.
-    Since the new server is HTTP based (Express), we can check the /health endpoint.
-    """
-    mcp_cfg = config.get("mcp_server")
-    if not (isinstance(mcp_cfg, dict) and "host" in mcp_cfg and "port" in mcp_cfg):
-        raise Exception("Invalid MCP config (host/port missing).")
-        
-    host, port = mcp_cfg["host"], int(mcp_cfg["port"])
-    
-    try:
-        # Simple TCP Connect first (fastest)
-        with socket.create_connection((host, port), timeout=2):
-            pass
-            
-        # Optional: Verify it's actually the HTTP server we expect
-        # This part ensures we aren't just hitting an open raw socket
-        conn = http.client.HTTPConnection(host, port, timeout=2)
-        conn.request("GET", "/health")
-        resp = conn.getresponse()
-        conn.close()
-        
-        return resp.status == 200
-    except Exception:
-        return False
-
-def connect_to_mcp_server_cached() -> bool:
-    now = time.monotonic()
-    if (now - _MCP_CACHE["ts"]) < _MCP_TTL:
-        return _MCP_CACHE["ok"]
-    ok = _connect_to_mcp_server_once()
-    _MCP_CACHE.update(ok=ok, ts=now)
-    if ok:
-        logging.debug("MCP ok (cached).", extra={"component": "MCP", "tag": "CONNECT", "message_type": "DEBUG"})
-    return ok
+# Admission-Control (ersetzt das reine connection_limit=1000 von Waitress):
+# max. admission_max_inflight Requests arbeiten, bis zu admission_max_queue warten kurz,
+# der Rest bekommt sofort 429/503 mit Retry-After statt sich unbegrenzt aufzustauen.
+_MAX_INFLIGHT = int(config.get("admission_max_inflight", min(32, (os.cpu_count() or 4) * 2)))
+_MAX_QUEUE = int(config.get("admission_max_queue", 16))
+admission = AdmissionController(
+    _MAX_INFLIGHT, _MAX_QUEUE, float(config.get("admission_queue_timeout_seconds", 2.0))
+)
 
 # ───────────────────────────────────────────────────────────────
 # Startup-Header
@@ -222,24 +138,34 @@ Logs:
 # ───────────────────────────────────────────────────────────────
 # Request-Tracing & Auth
 # ───────────────────────────────────────────────────────────────
+_trace_sampled = DebugSampler(config.get("log_debug_sample_every"))
+
 @app.before_request
 def _trace_and_auth():
-    # Tracing
-    logging.debug(
-        f"{request.remote_addr} {request.method} {request.path} UA={request.headers.get('User-Agent','-')}",
-        extra={"component": "HTTP", "tag": "REQ", "message_type": "DEBUG"}
-    )
+    g.request_started = time.perf_counter()
+    # Tracing (gesampelt, siehe LOG_DEBUG_SAMPLE)
+    if _trace_sampled():
+        logging.debug(
+            f"{request.remote_addr} {request.method} {request.path} UA={request.headers.get('User-Agent','-')}",
+            extra={"component": "HTTP", "tag": "REQ", "message_type": "DEBUG"}
+        )
 
-    # OPTIONS sowie /status ohne Auth
-    if request.method == 'OPTIONS' or request.endpoint == 'status':
+    # OPTIONS sowie /status und /metrics (Prometheus-Scrape) ohne Auth
+    if request.method == 'OPTIONS' or request.endpoint in ('status', 'metrics_endpoint'):
         return
 
     # API-Key prüfen (konstante Zeit)
-    provided_key = request.headers.get('X-API-KEY')
-    if not provided_key or not hmac.compare_digest(provided_key, api_key):
+    if not api_key_valid(request.headers.get('X-API-KEY'), api_key):
         logging.warning("Unauthorized.", extra={"component": "Auth", "tag": "FAIL", "message_type": "WARNING"})
         return jsonify({"error": "Unauthorized"}), 401
 
+@app.after_request
+def _observe_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        metrics.observe_request(request.method, request.path, time.perf_counter() - started)
+    return response
+
 # ───────────────────────────────────────────────────────────────
 # /ask
 # ───────────────────────────────────────────────────────────────
@@ -252,25 +178,41 @@ def ask():
     data = request.get_json(silent=True, cache=False) or {}
     logging.debug("Request /ask empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "DEBUG"})
 
-    # FIPA-ACL?
-    if "performative" in data and "content" in data:
-        content = data.get("content") or {}
-        question = content.get("question")
-        if not question:
-            return jsonify({"error": "Invalid FIPA-ACL request. 'content.question' is required."}), 400
-        use_public = bool(content.get("usePublic", False))
-        groups = content.get("groups")
-        language = (content.get("language") or "en").lower()
+    ask_req, error = parse_ask_request(data)
+    if error:
+        return jsonify({"error": error}), 400
+    if ask_req.fipa:
         logging.info("FIPA-ACL empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "INFO"})
     else:
-        # Legacy
-        question = data.get("question")
-        if not question:
-            return jsonify({"error": "Invalid request. 'question' field is required."}), 400
-        use_public = bool(data.get("usePublic", False))
-        groups = data.get("groups")
-        language = (data.get("language") or "en").lower()
         logging.info("Legacy JSON empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "INFO"})
+    metrics.count_ask("/ask", ask_req.fipa)
+
+    # Admission-Control: begrenzte In-Flight-Zahl + kurze Warteschlange
+    deadline = parse_deadline(request.headers)
+    try:
+        metrics.QUEUE_TIME.observe(admission.acquire(deadline))
+    except AdmissionRejected as rejected:
+        logging.warning(
+            f"Request abgelehnt ({rejected.status}): {rejected.reason}",
+            extra={"component": "Route", "tag": "ADMIT", "message_type": "WARNING"}
+        )
+        return jsonify(rejected.body()), rejected.status, rejected.headers()
+
+    started = time.monotonic()
+    try:
+        resp_obj, status_code = _answer(ask_req, deadline)
+    finally:
+        admission.release(time.monotonic() - started)
+
+    serialize_started = time.perf_counter()
+    body = _fast_dumps(resp_obj).encode("utf-8")
+    metrics.SERIALIZATION_TIME.observe(time.perf_counter() - serialize_started)
+    metrics.ANSWER_SIZE.observe(len(body))
+    return Response(body, status=status_code, mimetype="application/json")
+
+def _answer(ask_req, deadline):
+    """Sprache/Gruppen prüfen, MCP prüfen, Agent fragen -> (Body, HTTP-Status)."""
+    question, use_public, groups, language = ask_req.question, ask_req.use_public, ask_req.groups, ask_req.language
 
     # Sprache validieren
     if language not in _languages_set:
@@ -284,99 +226,141 @@ def ask():
             if invalid_groups:
                 msg = f"Invalid groups: {invalid_groups}"
                 logging.error(msg, extra={"component": "Agent", "tag": "GROUP", "message_type": "ERROR"})
-                return jsonify({"error": msg}), 400
+                return {"error": msg}, 400
             logging.debug("Gruppen validiert.", extra={"component": "Agent", "tag": "GROUP", "message_type": "DEBUG"})
         except Exception as e:
             logging.error(f"Group validation failed: {e}", extra={"component": "Agent", "tag": "GROUP", "message_type": "ERROR"})
-            return jsonify({"error": "Group validation failed."}), 500
+            return {"error": "Group validation failed."}, 500
 
-    # MCP (mit Cache/TTL)
-    try:
-        connect_to_mcp_server_cached()
-    except Exception as e:
-        failure_message = {
-            "performative": "failure",
-            "sender": "Chatbot_Agent",
-            "receiver": "IoT_MQTT_Agent",
-            "language": "fipa-sl",
-            "ontology": "mcp-connection-ontology",
-            "content": {"reason": f"Could not connect to MCP server: {str(e)}"}
-        }
+    # MCP (Flag des Health-Probers)
+    if not mcp_health.healthy:
         logging.error("MCP-Verbindung fehlgeschlagen.", extra={"component": "MCP", "tag": "CONNECT", "message_type": "ERROR"})
-        return jsonify(failure_message), 200
+        return mcp_failure_message(mcp_health.last_error or "health check failed"), 200
+
+    # Client hat bereits aufgegeben -> keinen LLM-Aufruf mehr starten
+    if deadline_expired(deadline):
+        logging.warning("Deadline abgelaufen, Query verworfen.", extra={"component": "Route", "tag": "DEADLINE", "message_type": "WARNING"})
+        return DEADLINE_EXCEEDED, 504
+
+    # Gemeinsamer Antwort-Cache (nur Multi-Worker-Betrieb mit answer_cache_ttl_seconds > 0)
+    cache_key = None
+    if shared_state is not None and shared_state.answers_enabled:
+        cache_key = SharedState.answer_key(question, use_public, groups, language)
+        cached = shared_state.answer_get(cache_key)
+        if cached is not None:
+            logging.info("Antwort aus Cache.", extra={"component": "Agent", "tag": "CACHE", "message_type": "INFO"})
+            return cached, 200
 
     # Agent Query
+    mcp_started = time.perf_counter()
     resp_json_text = agent.query_private_gpt(
         prompt=question,
         use_public=use_public,
         language=language,
         groups=groups
     )
-    if not resp_json_text or not str(resp_json_text).strip():
-        # LLM / MCP returned empty -> return minimal fallback
-        return jsonify({"content": {"answer": "ERROR: empty LLM response"}}), 200
-
+    metrics.MCP_TIME.observe(time.perf_counter() - mcp_started)
     logging.info("Agent-Query ok.", extra={"component": "Agent", "tag": "QUERY", "message_type": "INFO"})
-
-    # Antwort ist JSON-String -> robust/schnell parsen
-    try:
-        resp_obj = _fast_loads(resp_json_text)
-    except Exception:
-        # Fallback, falls Agent Unerwartetes liefert
-        resp_obj = {"content": {"answer": resp_json_text}}
-
-    return jsonify(resp_obj), 200
+    resp_obj = answer_object(resp_json_text)
+    if cache_key is not None and "answer" in resp_obj and "error" not in resp_obj:
+        shared_state.answer_put(cache_key, resp_obj)
+    return resp_obj, 200
 
 # ───────────────────────────────────────────────────────────────
-# /logs – optionales Tail (?tail=N Bytes)
+# /logs – gestreamt, konstanter Speicher
+#   ?lines=N      letzte N Zeilen          ?tail=N   letzte ~N Bytes (zeilen-ausgerichtet)
+#   ?since=OFF    ab Byte-Offset (X-Log-Offset der letzten Antwort)
+#   ?format=text  Klartext statt <pre>-HTML
+#   ?follow=1     SSE-Follow neuer Zeilen (inotify/Polling), Resume per Last-Event-ID
 # ───────────────────────────────────────────────────────────────
+_LOGS_FOLLOW_MAX = float(config.get("logs_follow_max_seconds", 300))
+# Jeder Follower hält einen Waitress-Thread -> begrenzt und im Thread-Pool zusätzlich eingeplant
+_LOGS_FOLLOW_CLIENTS = max(0, int(config.get("logs_follow_max_clients", 4)))
+_log_followers = threading.BoundedSemaphore(_LOGS_FOLLOW_CLIENTS) if _LOGS_FOLLOW_CLIENTS else None
+
 @app.route('/logs', methods=['GET'])
 def view_logs():
     logging.debug("Request /logs.", extra={"component": "Route", "tag": "LOGS", "message_type": "DEBUG"})
-    log_path = Path("flask.log")
+    log_path = Path(LOG_FILE)
     if not log_path.exists():
         return "Log file not found.", 404
 
     tail = request.args.get("tail", type=int)
+    lines = request.args.get("lines", type=int)
+    since = request.args.get("since", type=int)
+    if since is None:
+        since = request.headers.get("Last-Event-ID", type=int)
     try:
-        if tail and tail > 0:
-            with log_path.open("rb") as f:
-                f.seek(0, os.SEEK_END)
-                size = f.tell()
-                start = max(0, size - tail)
-                f.seek(start, os.SEEK_SET)
-                data = f.read().decode("utf-8", errors="replace")
-        else:
-            data = log_path.read_text(encoding="utf-8", errors="replace")
-        return f"<pre>{data}</pre>", 200
+        start, end = log_window(log_path, tail_bytes=tail, lines=lines, since=since)
     except Exception as e:
         logging.error(f"Log read error: {e}", extra={"component": "Route", "tag": "LOGS", "message_type": "ERROR"})
         return f"An error occurred: {str(e)}", 500
 
+    if request.args.get("follow", "").lower() in ("1", "true", "yes"):
+        if _log_followers is None or not _log_followers.acquire(blocking=False):
+            return Response("Too many log followers.", status=429, headers={"Retry-After": "5"})
+        if since is None and not lines and not tail:
+            start = end  # nur neue Zeilen
+        response = Response(
+            iter_follow_sse(LogFollower(log_path, start), max_seconds=_LOGS_FOLLOW_MAX),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        # close() der Response kommt immer (auch wenn der Stream nie startet)
+        response.call_on_close(_log_followers.release)
+        return response
+
+    as_html = request.args.get("format", "html").lower() != "text"
+    return Response(
+        iter_log_text(log_path, start, end, as_html=as_html),
+        status=200,
+        mimetype="text/html" if as_html else "text/plain",
+        headers={"X-Log-Offset": str(end)}
+    )
+
 # ───────────────────────────────────────────────────────────────
 # /status
 # ───────────────────────────────────────────────────────────────
 @app.route('/status', methods=['GET'])
 def status():
-    return jsonify({"status": "PrivateGPT Agent is running."}), 200
+    return jsonify({
+        "status": "PrivateGPT Agent is running.",
+        "admission": admission.stats(),
+        "mcp": mcp_health.status(),
+        "worker": os.environ.get("CHATBOT_WORKER_ID"),
+        "shared_state": shared_state.stats() if shared_state is not None else None,
+    }), 200
+
+# ───────────────────────────────────────────────────────────────
+# /metrics (Prometheus)
+# ───────────────────────────────────────────────────────────────
+metrics.bind_state(agent, admission, mcp_health)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render_metrics(), content_type=metrics.METRICS_CONTENT_TYPE)
 
 # ───────────────────────────────────────────────────────────────
 # API-Server starten (Waitress mit sinnvollen Defaults)
 # ───────────────────────────────────────────────────────────────
-def run_api_server():
+def run_api_server(sockets=None):
+    """`sockets`: bereits gebundene Listen-Sockets (Worker des Supervisors) statt api_ip/api_port."""
     server_ip = config.get("api_ip", "0.0.0.0")
     server_port = int(config.get("api_port", 5001))
-    threads = min(32, (os.cpu_count() or 4) * 2)
+    # Wartende Requests belegen einen Thread (blockiert in der Admission-Queue),
+    # /logs?follow=1 hält je Follower einen weiteren
+    threads = admission.max_inflight + admission.max_queue + _LOGS_FOLLOW_CLIENTS
+    connection_limit = int(config.get("connection_limit", max(100, threads * 2)))
     logging.info(
         f"Starte API-Server auf {server_ip}:{server_port} (threads={threads})",
         extra={"component": "Server", "tag": "START", "message_type": "INFO"}
     )
+    listen = {"sockets": sockets} if sockets else {"host": server_ip, "port": server_port}
     serve(
         app,
-        host=server_ip,
-        port=server_port,
+        **listen,
         threads=threads,
-        connection_limit=1000,
+        connection_limit=connection_limit,
         channel_timeout=60,  # Keep-Alive ermöglicht Reuse
         ident=None           # spart ein paar Header-Bytes
     )
@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+"""
+Fujitsu PrivateGPT ChatBot Agent – asynchrone ASGI-Variante (FastAPI/Uvicorn)
+
+Gleiche API wie chatbot_agent.py (/ask FIPA-ACL + Legacy, /logs, /status),
+gleiche API-Key-Prüfung und gleiche Antwort-Formate – aber:
+- /ask/stream: Antwort als SSE/NDJSON, erstes Byte sofort nach Annahme
+- /ask/batch: viele Fragen pro Request, nebenläufig mit Limit pro Batch
+- Prometheus-Metriken unter /metrics (vorab gebundene Label-Kinder)
+- Ein Event-Loop statt Thread-pro-Request: wartende MCP-Aufrufe blockieren keine Worker-Threads
+- Asynchroner MCP-Client (AsyncPrivateGPTAgent) mit einer geteilten Verbindung/Session
+- Admission-Control: In-Flight-Limit (asgi_max_concurrency) + kurze Warteschlange, 429/503 + Retry-After,
+  Deadlines per X-Request-Deadline/X-Request-Timeout
+- MCP-Connectivity über Hintergrund-Prober (Jitter, Hysterese) – kein Check im Request-Pfad
+- Schneller JSON-Pfad via orjson/ujson (Fallback: stdlib json)
+- Multi-Worker-Betrieb (chatbot_supervisor --asgi): Token/Gruppen/Antwort-Cache über SQLite geteilt
+
+Start:
+    python -m agents.ChatBotAgent.Python.chatbot_agent_asgi
+"""
+
+import asyncio
+import logging
+import os
+import platform
+import socket
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from . import chatbot_metrics as metrics
+from .chatbot_shared_state import SharedState, create_agent
+from .chatbot_common import (
+    _fast_loads, _fast_dumps, setup_logging, parse_ask_request, mcp_failure_message,
+    answer_object, api_key_valid, McpHealthProber, LOG_FILE,
+    fipa_reply, stream_format, stream_event, SSE_MEDIA_TYPE, NDJSON_MEDIA_TYPE,
+    AsyncAdmissionController, AdmissionRejected, parse_deadline, deadline_expired, DEADLINE_EXCEEDED,
+)
+
+# ───────────────────────────────────────────────────────────────
+# Agent-Imports
+# ───────────────────────────────────────────────────────────────
+from ...AgentInterface.Python.agent import GroupValidationError
+from ...AgentInterface.Python.config import Config, ConfigError
+from ...AgentInterface.Python.language import languages
+from ...AgentInterface.Python.logging_setup import DebugSampler
+from ...AgentInterface.Python.log_stream import log_window, iter_log_text, LogFollower, aiter_follow_sse
+
+# ───────────────────────────────────────────────────────────────
+# Logging (schlank, rotierend)
+# ───────────────────────────────────────────────────────────────
+# LOG_LEVEL kann via Env gesetzt werden, z. B. LOG_LEVEL=DEBUG
+setup_logging(os.environ.get("LOG_LEVEL", "DEBUG"), access_logger="uvicorn.error")
+
+# ───────────────────────────────────────────────────────────────
+# Konfiguration laden
+# ───────────────────────────────────────────────────────────────
+try:
+    config_file = (Path(__file__).parent.parent / "config.json").resolve()
+    config = Config(
+        config_file=config_file,
+        required_fields=["email", "password", "mcp_server", "api_ip", "api_port", "api_key"]
+    )
+    logging.info("Konfiguration geladen.", extra={"component": "Config", "tag": "LOAD", "message_type": "INFO"})
+except ConfigError as e:
+    logging.error(f"Configuration Error: {e}", extra={"component": "Config", "tag": "ERROR", "message_type": "ERROR"})
+    sys.exit(1)
+
+# ───────────────────────────────────────────────────────────────
+# Agent (ohne I/O; Login erfolgt im Lifespan innerhalb des Event-Loops)
+# ───────────────────────────────────────────────────────────────
+# Im Multi-Worker-Betrieb teilen sich alle Worker Token, Gruppen und Antwort-Cache
+shared_state = SharedState.from_config(config)
+agent = create_agent(config, shared_state, use_async=True)
+
+# ───────────────────────────────────────────────────────────────
+# Routen/Globals
+# ───────────────────────────────────────────────────────────────
+api_key = config.get("api_key", "default_api_key")
+_languages_set = set(languages)  # O(1)-Mitgliedschaft
+# Admission-Control: max. asgi_max_concurrency Requests arbeiten, bis zu admission_max_queue
+# warten kurz, der Rest bekommt sofort 429/503 mit Retry-After statt sich aufzustauen.
+_MAX_CONCURRENCY = max(1, int(config.get("asgi_max_concurrency", 256)))
+admission = AsyncAdmissionController(
+    _MAX_CONCURRENCY,
+    int(config.get("admission_max_queue", 16)),
+    float(config.get("admission_queue_timeout_seconds", 2.0))
+)
+
+# MCP-Health: Hintergrund-Prober (Thread) statt Check im Request-Pfad (Requests lesen nur das Flag)
+mcp_health = McpHealthProber.from_config(config)
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return _fast_dumps(content).encode("utf-8")
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, die `on_close` in jedem Fall aufruft – auch wenn der Generator nie startet
+    (Client vor dem ersten Chunk weg, Senden der Header schlägt fehl)."""
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._on_close()
+
+# ───────────────────────────────────────────────────────────────
+# Lifespan: Login/Gruppen beim Start, Logout beim Stop
+# ───────────────────────────────────────────────────────────────
+@asynccontextmanager
+async def lifespan(_app):
+    await asyncio.to_thread(mcp_health.start)
+    try:
+        await agent.start()
+        logging.info("AsyncPrivateGPTAgent initialisiert.", extra={"component": "Agent", "tag": "INIT", "message_type": "INFO"})
+        # Gruppenänderungen auf dem Server ohne Neustart übernehmen (atomarer Tausch im Agenten)
+        agent.start_group_refresh(float(config.get("groups_refresh_seconds", 300)))
+    except GroupValidationError as e:
+        logging.error(f"Group Validation Error: {e}", extra={"component": "Agent", "tag": "VALIDATION", "message_type": "ERROR"})
+        raise
+    display_startup_header_safe()
+    try:
+        yield
+    finally:
+        mcp_health.stop()
+        await agent.alogout()
+
+app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+# ───────────────────────────────────────────────────────────────
+# Startup-Header
+# ───────────────────────────────────────────────────────────────
+def display_startup_header():
+    server_ip = config.get("api_ip", "0.0.0.0")
+    server_port = config.get("api_port", 8000)
+    api_key_status = "✔️ Set" if api_key != "default_api_key" else "❌ Not Set"
+    header = f"""
+────────────────────────────────────────────────
+Fujitsu PrivateGPT ChatBot Agent (ASGI) - Startup
+────────────────────────────────────────────────
+System Information:
+- Hostname      : {socket.gethostname()}
+- Operating Sys : {platform.system()} {platform.release()}
+- Python Version: {platform.python_version()}
+
+Server Configuration:
+- API Endpoint  : http://{server_ip}:{server_port}
+- API Key Status: {api_key_status}
+- Concurrency   : {_MAX_CONCURRENCY}
+
+Logs:
+- Server Log    : {LOG_FILE} (rotating)
+────────────────────────────────────────────────
+🚀 Ready to serve requests!
+"""
+    print(header)
+    logging.info("Startup-Header angezeigt.", extra={"component": "Startup", "tag": "HEADER", "message_type": "INFO"})
+
+def display_startup_header_safe():
+    try:
+        display_startup_header()
+    except Exception as e:
+        logging.warning(f"Startup header failed: {e}", extra={"component": "Startup", "tag": "HEADER", "message_type": "WARNING"})
+
+# ───────────────────────────────────────────────────────────────
+# Request-Tracing & Auth
+# ───────────────────────────────────────────────────────────────
+_trace_sampled = DebugSampler(config.get("log_debug_sample_every"))
+
+@app.middleware("http")
+async def _trace_and_auth(request: Request, call_next):
+    started = time.perf_counter()
+    response = await _auth_and_call(request, call_next)
+    # Bei Streams: Zeit bis zum Beginn der Antwort
+    metrics.observe_request(request.method, request.url.path, time.perf_counter() - started)
+    return response
+
+async def _auth_and_call(request: Request, call_next):
+    # Tracing (gesampelt, siehe LOG_DEBUG_SAMPLE)
+    if _trace_sampled():
+        logging.debug(
+            f"{request.client.host if request.client else '-'} {request.method} {request.url.path} "
+            f"UA={request.headers.get('User-Agent', '-')}",
+            extra={"component": "HTTP", "tag": "REQ", "message_type": "DEBUG"}
+        )
+
+    # CORS-Preflight, Status und /metrics (Prometheus-Scrape) ohne Auth
+    if request.method == 'OPTIONS' or request.url.path in ('/status', '/metrics'):
+        return await call_next(request)
+
+    # API-Key prüfen (konstante Zeit)
+    if not api_key_valid(request.headers.get('X-API-KEY'), api_key):
+        logging.warning("Unauthorized.", extra={"component": "Auth", "tag": "FAIL", "message_type": "WARNING"})
+        return FastJSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    return await call_next(request)
+
+# CORS als äußerste Schicht (zuletzt registriert), damit auch 401-Antworten CORS-Header tragen
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ───────────────────────────────────────────────────────────────
+# /ask
+# ───────────────────────────────────────────────────────────────
+async def _read_ask_request(request: Request, route: str):
+    """Body lesen und parsen -> (AskRequest, None) oder (None, 400-Response)."""
+    try:
+        data = _fast_loads(await request.body())
+    except Exception:
+        data = {}
+    logging.debug(f"Request {route} empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "DEBUG"})
+
+    ask_req, error = parse_ask_request(data)
+    if error:
+        return None, FastJSONResponse({"error": error}, status_code=400)
+    if ask_req.fipa:
+        logging.info("FIPA-ACL empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "INFO"})
+    else:
+        logging.info("Legacy JSON empfangen.", extra={"component": "Route", "tag": "ASK", "message_type": "INFO"})
+    metrics.count_ask(route, ask_req.fipa)
+    return ask_req, None
+
+@app.post('/ask')
+async def ask(request: Request):
+    """
+    Stellt eine Frage an den Agenten.
+    Akzeptiert FIPA-ACL oder Legacy-JSON.
+    """
+    ask_req, error_response = await _read_ask_request(request, "/ask")
+    if error_response:
+        return error_response
+
+    deadline = parse_deadline(request.headers)
+    rejected = await _admit(deadline)
+    if rejected:
+        return FastJSONResponse(rejected.body(), status_code=rejected.status, headers=rejected.headers())
+    started = time.monotonic()
+    try:
+        body, status_code = await _answer(ask_req, deadline)
+    finally:
+        await admission.release(time.monotonic() - started)
+
+    serialize_started = time.perf_counter()
+    response = FastJSONResponse(body, status_code=status_code)
+    metrics.SERIALIZATION_TIME.observe(time.perf_counter() - serialize_started)
+    metrics.ANSWER_SIZE.observe(len(response.body))
+    return response
+
+async def _admit(deadline):
+    """Slot belegen -> None, oder AdmissionRejected (429/503/504) zurückgeben."""
+    try:
+        metrics.QUEUE_TIME.observe(await admission.acquire(deadline))
+        return None
+    except AdmissionRejected as rejected:
+        logging.warning(
+            f"Request abgelehnt ({rejected.status}): {rejected.reason}",
+            extra={"component": "Route", "tag": "ADMIT", "message_type": "WARNING"}
+        )
+        return rejected
+
+async def _prepare(ask_req):
+    """Sprache/Gruppen prüfen, MCP prüfen -> (Sprache, None) oder (None, (Body, HTTP-Status))."""
+    language = ask_req.language
+    # Sprache validieren
+    if language not in _languages_set:
+        language = 'en'
+        logging.warning("Unsupported language -> fallback to en.", extra={"component": "Route", "tag": "LANG", "message_type": "WARNING"})
+
+    # Gruppen validieren (nur wenn übergeben)
+    if ask_req.groups:
+        try:
+            invalid_groups = agent.validate_groups(ask_req.groups)
+            if invalid_groups:
+                msg = f"Invalid groups: {invalid_groups}"
+                logging.error(msg, extra={"component": "Agent", "tag": "GROUP", "message_type": "ERROR"})
+                return None, ({"error": msg}, 400)
+            logging.debug("Gruppen validiert.", extra={"component": "Agent", "tag": "GROUP", "message_type": "DEBUG"})
+        except Exception as e:
+            logging.error(f"Group validation failed: {e}", extra={"component": "Agent", "tag": "GROUP", "message_type": "ERROR"})
+            return None, ({"error": "Group validation failed."}, 500)
+
+    # MCP (Flag des Health-Probers)
+    if not mcp_health.healthy:
+        logging.error("MCP-Verbindung fehlgeschlagen.", extra={"component": "MCP", "tag": "CONNECT", "message_type": "ERROR"})
+        return None, (mcp_failure_message(mcp_health.last_error or "health check failed"), 200)
+
+    return language, None
+
+async def _query(ask_req, language) -> dict:
+    # Gemeinsamer Antwort-Cache (nur Multi-Worker-Betrieb mit answer_cache_ttl_seconds > 0)
+    cache_key = None
+    if shared_state is not None and shared_state.answers_enabled:
+        cache_key = SharedState.answer_key(ask_req.question, ask_req.use_public, ask_req.groups, language)
+        # SQLite (BEGIN/Busy-Timeout bei Schreibsperre eines anderen Workers) nicht im Event-Loop
+        cached = await asyncio.to_thread(shared_state.answer_get, cache_key)
+        if cached is not None:
+            logging.info("Antwort aus Cache.", extra={"component": "Agent", "tag": "CACHE", "message_type": "INFO"})
+            return cached
+
+    mcp_started = time.perf_counter()
+    resp_json_text = await agent.aquery_private_gpt(
+        prompt=ask_req.question,
+        use_public=ask_req.use_public,
+        language=language,
+        groups=ask_req.groups
+    )
+    metrics.MCP_TIME.observe(time.perf_counter() - mcp_started)
+    logging.info("Agent-Query ok.", extra={"component": "Agent", "tag": "QUERY", "message_type": "INFO"})
+    resp_obj = answer_object(resp_json_text)
+    if cache_key is not None and "answer" in resp_obj and "error" not in resp_obj:
+        await asyncio.to_thread(shared_state.answer_put, cache_key, resp_obj)
+    return resp_obj
+
+def _deadline_passed(deadline) -> bool:
+    # Client hat bereits aufgegeben -> keinen LLM-Aufruf mehr starten
+    if deadline_expired(deadline):
+        logging.warning("Deadline abgelaufen, Query verworfen.", extra={"component": "Route", "tag": "DEADLINE", "message_type": "WARNING"})
+        return True
+    return False
+
+async def _answer(ask_req, deadline=None):
+    """Prüfen und Agent fragen -> (Body, HTTP-Status)."""
+    language, early = await _prepare(ask_req)
+    if early:
+        return early
+    if _deadline_passed(deadline):
+        return DEADLINE_EXCEEDED, 504
+    return await _query(ask_req, language), 200
+
+# ───────────────────────────────────────────────────────────────
+# /ask/stream – Antwort als SSE oder NDJSON (?format=sse|ndjson bzw. Accept-Header)
+# ───────────────────────────────────────────────────────────────
+async def _answer_chunks(ask_req, language):
+    """
+    Liefert Antwort-Stücke, sobald sie vom Upstream kommen; das letzte Element ist das Antwort-Objekt.
+    Das MCP-Tool "chat" liefert die Antwort derzeit in einem Stück – ein streamendes
+    MCP-Tool wird hier eingehängt, ohne dass sich das Framing für Clients ändert.
+    """
+    resp_obj = await _query(ask_req, language)
+    answer = resp_obj.get("answer") if isinstance(resp_obj, dict) else None
+    if answer:
+        yield str(answer)
+    yield resp_obj
+
+@app.post('/ask/stream')
+async def ask_stream(request: Request, format: str = None):
+    """
+    Wie /ask, aber gestreamt: "meta" sofort nach Annahme, "chunk" je Antwort-Stück,
+    zum Schluss "final" mit der Antwort im FIPA-ACL-Umschlag.
+    Fehler vor Stream-Beginn (400/429/500/503/504) kommen als normale JSON-Antwort.
+    """
+    ask_req, error_response = await _read_ask_request(request, "/ask/stream")
+    if error_response:
+        return error_response
+    fmt = stream_format(format, request.headers.get("Accept"))
+
+    deadline = parse_deadline(request.headers)
+    rejected = await _admit(deadline)
+    if rejected:
+        return FastJSONResponse(rejected.body(), status_code=rejected.status, headers=rejected.headers())
+    started = time.monotonic()
+    released = False
+
+    async def release_slot():
+        # einmalig: Ende des Generators oder Abschluss der Response, was zuerst kommt
+        nonlocal released
+        if not released:
+            released = True
+            await admission.release(time.monotonic() - started)
+
+    try:
+        language, early = await _prepare(ask_req)
+        if not early and _deadline_passed(deadline):
+            early = (DEADLINE_EXCEEDED, 504)
+    except BaseException:
+        await release_slot()
+        raise
+    if early and early[1] != 200:
+        await release_slot()
+        return FastJSONResponse(early[0], status_code=early[1])
+
+    async def events():
+        try:
+            yield stream_event(fmt, "meta", {"status": "accepted", "fipa": ask_req.fipa})
+            if early:
+                # MCP nicht erreichbar -> FIPA-ACL-Failure als Abschluss
+                yield stream_event(fmt, "final", early[0])
+                return
+            async for piece in _answer_chunks(ask_req, language):
+                if isinstance(piece, str):
+                    yield stream_event(fmt, "chunk", {"delta": piece})
+                else:
+                    yield stream_event(fmt, "final", fipa_reply(ask_req, piece))
+        finally:
+            await release_slot()
+
+    return _ClosingStreamingResponse(
+        events(),
+        release_slot,
+        media_type=NDJSON_MEDIA_TYPE if fmt == "ndjson" else SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ───────────────────────────────────────────────────────────────
+# /ask/batch – viele Fragen in einem Request, Ergebnisse in Eingabe-Reihenfolge
+# ───────────────────────────────────────────────────────────────
+_BATCH_MAX_ITEMS = max(1, int(config.get("ask_batch_max_items", 500)))
+_BATCH_CONCURRENCY = max(1, int(config.get("ask_batch_concurrency", 8)))
+
+async def _answer_item(index, item, batch_slots, deadline):
+    ask_req, error = parse_ask_request(item)
+    if error:
+        return {"index": index, "status": 400, "response": {"error": error}}
+    metrics.count_ask("/ask/batch", ask_req.fipa)
+    async with batch_slots:
+        rejected = await _admit(deadline)
+        if rejected:
+            return {"index": index, "status": rejected.status, "response": rejected.body()}
+        started = time.monotonic()
+        try:
+            body, status_code = await _answer(ask_req, deadline)
+        except Exception as e:
+            logging.error(f"Batch item {index} failed: {e}", extra={"component": "Route", "tag": "BATCH", "message_type": "ERROR"})
+            body, status_code = {"error": "Internal error."}, 500
+        finally:
+            await admission.release(time.monotonic() - started)
+    return {"index": index, "status": status_code, "response": body}
+
+@app.post('/ask/batch')
+async def ask_batch(request: Request, concurrency: int = 0):
+    """
+    Nimmt ein Array von FIPA-ACL- oder Legacy-Requests (oder {"requests": [...]}) entgegen,
+    beantwortet sie nebenläufig (?concurrency=N, begrenzt durch ask_batch_concurrency)
+    und liefert {"results": [...]} in Eingabe-Reihenfolge mit Status pro Eintrag.
+    """
+    try:
+        data = _fast_loads(await request.body())
+    except Exception:
+        data = None
+    if isinstance(data, dict):
+        data = data.get("requests")
+    if not isinstance(data, list) or not data:
+        return FastJSONResponse({"error": "Invalid batch request. A non-empty JSON array of requests is required."}, status_code=400)
+    if len(data) > _BATCH_MAX_ITEMS:
+        return FastJSONResponse({"error": f"Batch too large ({len(data)} > {_BATCH_MAX_ITEMS} items)."}, status_code=413)
+
+    limit = min(concurrency, _BATCH_CONCURRENCY) if concurrency > 0 else _BATCH_CONCURRENCY
+    logging.info(
+        f"Batch empfangen: {len(data)} Einträge (concurrency={limit}).",
+        extra={"component": "Route", "tag": "BATCH", "message_type": "INFO"}
+    )
+    batch_slots = asyncio.Semaphore(limit)
+    deadline = parse_deadline(request.headers)
+    results = await asyncio.gather(*(_answer_item(i, item, batch_slots, deadline) for i, item in enumerate(data)))
+    return FastJSONResponse({"results": results}, status_code=200)
+
+# ───────────────────────────────────────────────────────────────
+# /logs – gestreamt, konstanter Speicher
+#   ?lines=N      letzte N Zeilen          ?tail=N   letzte ~N Bytes (zeilen-ausgerichtet)
+#   ?since=OFF    ab Byte-Offset (X-Log-Offset der letzten Antwort)
+#   ?format=text  Klartext statt <pre>-HTML
+#   ?follow=1     SSE-Follow neuer Zeilen (inotify/Polling), Resume per Last-Event-ID
+# ───────────────────────────────────────────────────────────────
+_LOGS_FOLLOW_MAX = float(config.get("logs_follow_max_seconds", 300))
+
+@app.get('/logs')
+async def view_logs(request: Request, tail: int = 0, lines: int = 0, since: int = None,
+                    format: str = "html", follow: str = ""):
+    logging.debug("Request /logs.", extra={"component": "Route", "tag": "LOGS", "message_type": "DEBUG"})
+    log_path = Path(LOG_FILE)
+    if not log_path.exists():
+        return PlainTextResponse("Log file not found.", status_code=404)
+
+    if since is None and request.headers.get("Last-Event-ID", "").isdigit():
+        since = int(request.headers["Last-Event-ID"])
+    try:
+        start, end = await asyncio.to_thread(log_window, log_path, tail, lines, since)
+    except Exception as e:
+        logging.error(f"Log read error: {e}", extra={"component": "Route", "tag": "LOGS", "message_type": "ERROR"})
+        return PlainTextResponse(f"An error occurred: {str(e)}", status_code=500)
+
+    if follow.lower() in ("1", "true", "yes"):
+        if since is None and not lines and not tail:
+            start = end  # nur neue Zeilen
+        return StreamingResponse(
+            aiter_follow_sse(LogFollower(log_path, start), max_seconds=_LOGS_FOLLOW_MAX),
+            media_type=SSE_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    as_html = format.lower() != "text"
+    # Sync-Iterator -> Starlette liest ihn im Thread-Pool, der Loop bleibt frei
+    return StreamingResponse(
+        iter_log_text(log_path, start, end, as_html=as_html),
+        media_type="text/html" if as_html else "text/plain",
+        headers={"X-Log-Offset": str(end)}
+    )
+
+# ───────────────────────────────────────────────────────────────
+# /status
+# ───────────────────────────────────────────────────────────────
+@app.get('/status')
+async def status():
+    return FastJSONResponse({
+        "status": "PrivateGPT Agent is running.",
+        "admission": admission.stats(),
+        "mcp": mcp_health.status(),
+        "worker": os.environ.get("CHATBOT_WORKER_ID"),
+        "shared_state": shared_state.stats() if shared_state is not None else None,
+    }, status_code=200)
+
+# ───────────────────────────────────────────────────────────────
+# /metrics (Prometheus)
+# ───────────────────────────────────────────────────────────────
+metrics.bind_state(agent, admission, mcp_health)
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    return Response(metrics.render_metrics(), media_type=metrics.METRICS_CONTENT_TYPE)
+
+# ───────────────────────────────────────────────────────────────
+# Main (Uvicorn)
+# ───────────────────────────────────────────────────────────────
+def run_api_server(sockets=None):
+    """`sockets`: bereits gebundene Listen-Sockets (Worker des Supervisors) statt api_ip/api_port."""
+    server_ip = config.get("api_ip", "0.0.0.0")
+    server_port = int(config.get("api_port", 5001))
+    logging.info(
+        f"Starte ASGI-Server auf {server_ip}:{server_port} (concurrency={_MAX_CONCURRENCY})",
+        extra={"component": "Server", "tag": "START", "message_type": "INFO"}
+    )
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        host=server_ip,
+        port=server_port,
+        log_level="warning",
+        access_log=False,
+        timeout_keep_alive=60,  # Keep-Alive ermöglicht Reuse
+        server_header=False,    # spart ein paar Header-Bytes
+    ))
+    server.run(sockets=sockets)
+
+if __name__ == '__main__':
+    try:
+        run_api_server()
+    except Exception as e:
+        logging.critical(f"Server critical: {e}", extra={"component": "Server", "tag": "RUN", "message_type": "CRITICAL"})
+        sys.exit(1)
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+Gemeinsame Bausteine der ChatBot-Agent-Server (Flask/Waitress und ASGI)
+
+- Schnelle JSON-Engines (orjson > ujson > json)
+- Logging-Setup (asynchron über QueueListener)
+- Parsing von /ask-Requests (FIPA-ACL und Legacy-JSON)
+- FIPA-ACL-Failure-Nachricht, API-Key-Prüfung, MCP-Connectivity-Check
+- Framing für /ask/stream (SSE oder NDJSON)
+- Admission-Control (In-Flight-Limit, kurze Warteschlange, Deadlines, 429/503 + Retry-After)
+- Hintergrund-Health-Prober für den MCP-Server (Jitter, Hysterese, Historie)
+"""
+
+import asyncio
+import hmac
+import math
+import random
+import threading
+import time
+import http.client
+import logging
+import socket
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from ...AgentInterface.Python.logging_setup import setup_logging as _setup_logging
+
+# ───────────────────────────────────────────────────────────────
+# Optionale schnelle JSON-Engines (orjson > ujson > json)
+# ───────────────────────────────────────────────────────────────
+try:
+    import orjson as _fastjson
+    _fast_loads = _fastjson.loads
+
+    def _fast_dumps(obj):
+        # orjson.dumps -> bytes
+        return _fastjson.dumps(obj).decode("utf-8")
+except Exception:
+    try:
+        import ujson as _fastjson
+        _fast_loads = _fastjson.loads
+
+        def _fast_dumps(obj):
+            return _fastjson.dumps(obj)
+    except Exception:
+        import json as _fastjson
+        _fast_loads = _fastjson.loads
+
+        def _fast_dumps(obj):
+            return _fastjson.dumps(obj)
+
+# ───────────────────────────────────────────────────────────────
+# Logging (asynchron über Queue, siehe AgentInterface/Python/logging_setup.py)
+# ───────────────────────────────────────────────────────────────
+LOG_FILE = "flask.log"
+
+def setup_logging(level_name: str = "INFO", access_logger: str = "werkzeug"):
+    """Konsole mit Spalten-Formatter; Fehler des HTTP-Servers zusätzlich rotierend in LOG_FILE."""
+    return _setup_logging(level_name, access_logger=access_logger, access_log_file=LOG_FILE)
+
+# ───────────────────────────────────────────────────────────────
+# /ask – Request-Parsing
+# ───────────────────────────────────────────────────────────────
+@dataclass
+class AskRequest:
+    question: str
+    use_public: bool
+    groups: Optional[List[str]]
+    language: str
+    fipa: bool
+    sender: Optional[str] = None
+    ontology: Optional[str] = None
+
+def parse_ask_request(data) -> Tuple[Optional[AskRequest], Optional[str]]:
+    """
+    Akzeptiert FIPA-ACL oder Legacy-JSON.
+    Liefert (AskRequest, None) oder (None, Fehlermeldung für HTTP 400).
+    """
+    if not isinstance(data, dict):
+        data = {}
+
+    # FIPA-ACL?
+    if "performative" in data and "content" in data:
+        content = data.get("content") or {}
+        question = content.get("question")
+        if not question:
+            return None, "Invalid FIPA-ACL request. 'content.question' is required."
+        return AskRequest(
+            question=question,
+            use_public=bool(content.get("usePublic", False)),
+            groups=content.get("groups"),
+            language=(content.get("language") or "en").lower(),
+            fipa=True,
+            sender=data.get("sender"),
+            ontology=data.get("ontology"),
+        ), None
+
+    # Legacy
+    question = data.get("question")
+    if not question:
+        return None, "Invalid request. 'question' field is required."
+    return AskRequest(
+        question=question,
+        use_public=bool(data.get("usePublic", False)),
+        groups=data.get("groups"),
+        language=(data.get("language") or "en").lower(),
+        fipa=False,
+    ), None
+
+def mcp_failure_message(error) -> dict:
+    return {
+        "performative": "failure",
+        "sender": "Chatbot_Agent",
+        "receiver": "IoT_MQTT_Agent",
+        "language": "fipa-sl",
+        "ontology": "mcp-connection-ontology",
+        "content": {"reason": f"Could not connect to MCP server: {str(error)}"}
+    }
+
+def answer_object(resp_json_text) -> dict:
+    """Antwort des Agenten (JSON-String) robust/schnell in ein Objekt überführen."""
+    if not resp_json_text or not str(resp_json_text).strip():
+        # LLM / MCP returned empty -> return minimal fallback
+        return {"content": {"answer": "ERROR: empty LLM response"}}
+    try:
+        return _fast_loads(resp_json_text)
+    except Exception:
+        # Fallback, falls Agent Unerwartetes liefert
+        return {"content": {"answer": resp_json_text}}
+
+def fipa_reply(ask_req: AskRequest, resp_obj: dict) -> dict:
+    """Antwort-Objekt in den FIPA-ACL-Umschlag packen (inform bzw. failure bei Fehlern)."""
+    return {
+        "performative": "failure" if "error" in resp_obj else "inform",
+        "sender": "Chatbot_Agent",
+        "receiver": ask_req.sender or "Client",
+        "language": "fipa-sl",
+        "ontology": ask_req.ontology or "fujitsu-iot-ontology",
+        "content": resp_obj
+    }
+
+def api_key_valid(provided_key: Optional[str], api_key: str) -> bool:
+    # konstante Zeit
+    return bool(provided_key) and hmac.compare_digest(provided_key, api_key)
+
+# ───────────────────────────────────────────────────────────────
+# MCP-Connectivity
+# ───────────────────────────────────────────────────────────────
+def check_mcp_once(config) -> bool:
+    """
+    Checks if MCP Server is reachable.
+    Since the new server is HTTP based (Express), we can check the /health endpoint.
+    """
+    mcp_cfg = config.get("mcp_server")
+    if not (isinstance(mcp_cfg, dict) and "host" in mcp_cfg and "port" in mcp_cfg):
+        raise Exception("Invalid MCP config (host/port missing).")
+
+    host, port = mcp_cfg["host"], int(mcp_cfg["port"])
+
+    try:
+        # Simple TCP Connect first (fastest)
+        with socket.create_connection((host, port), timeout=2):
+            pass
+
+        # Optional: Verify it's actually the HTTP server we expect
+        # This part ensures we aren't just hitting an open raw socket
+        conn = http.client.HTTPConnection(host, port, timeout=2)
+        conn.request("GET", "/health")
+        resp = conn.getresponse()
+        conn.close()
+
+        return resp.status == 200
+    except Exception:
+        return False
+
+class McpHealthProber:
+    """
+    Prüft den MCP-Server im Hintergrund-Thread mit gejittertem Intervall.
+    Requests lesen nur `healthy` (ein bool – atomar), der Check liegt nie im Request-Pfad.
+    Hysterese: erst nach `fail_threshold` Fehlschlägen in Folge "down",
+    erst nach `recover_threshold` Erfolgen in Folge wieder "up".
+    """
+
+    def __init__(self, config, interval: float = 5.0, jitter: float = 0.2,
+                 fail_threshold: int = 2, recover_threshold: int = 2, history_size: int = 20):
+        self.config = config
+        self.interval = max(0.5, float(interval))
+        self.jitter = min(max(0.0, float(jitter)), 0.9)
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.recover_threshold = max(1, int(recover_threshold))
+        self.healthy = False
+        self.last_error = None
+        self.last_check = None
+        self.probes = 0
+        self._fails = 0
+        self._successes = 0
+        self._history = deque(maxlen=max(1, int(history_size)))
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config,
+            interval=config.get("mcp_probe_interval_seconds", config.get("mcp_check_ttl_seconds", 5)),
+            jitter=config.get("mcp_probe_jitter", 0.2),
+            fail_threshold=config.get("mcp_probe_fail_threshold", 2),
+            recover_threshold=config.get("mcp_probe_recover_threshold", 2),
+            history_size=config.get("mcp_probe_history", 20),
+        )
+
+    def probe_once(self) -> bool:
+        started = time.monotonic()
+        error = None
+        try:
+            ok = bool(check_mcp_once(self.config))
+            if not ok:
+                error = "health check failed"
+        except Exception as e:
+            ok, error = False, str(e)
+        self._record(ok, (time.monotonic() - started) * 1000, error)
+        return ok
+
+    def _record(self, ok: bool, latency_ms: float, error: Optional[str]):
+        self.probes += 1
+        self.last_check = time.time()
+        self.last_error = error
+        if ok:
+            self._successes += 1
+            self._fails = 0
+        else:
+            self._fails += 1
+            self._successes = 0
+
+        was = self.healthy
+        if self.probes == 1:
+            self.healthy = ok  # Startzustand direkt übernehmen
+        elif not was and self._successes >= self.recover_threshold:
+            self.healthy = True
+        elif was and self._fails >= self.fail_threshold:
+            self.healthy = False
+        if was != self.healthy or self.probes == 1:
+            logging.log(
+                logging.INFO if self.healthy else logging.ERROR,
+                f"MCP {'erreichbar' if self.healthy else 'nicht erreichbar'}" + (f": {error}" if error else "."),
+                extra={"component": "MCP", "tag": "HEALTH", "message_type": "INFO" if self.healthy else "ERROR"}
+            )
+
+        self._history.append({
+            "ts": round(self.last_check, 3),
+            "ok": ok,
+            "latency_ms": round(latency_ms, 1),
+            "healthy": self.healthy,
+            "error": error,
+        })
+
+    def start(self):
+        """Ersten Check synchron ausführen (gültiger Startzustand), dann Hintergrund-Thread starten."""
+        if self._thread is not None:
+            return
+        self.probe_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mcp-health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)):
+            self.probe_once()
+
+    def status(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+            "consecutive_failures": self._fails,
+            "probes": self.probes,
+            "history": list(self._history),
+        }
+
+# ───────────────────────────────────────────────────────────────
+# /ask/stream – Framing (SSE oder NDJSON)
+# ───────────────────────────────────────────────────────────────
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def stream_format(fmt_param: Optional[str], accept: Optional[str]) -> str:
+    """?format=sse|ndjson hat Vorrang, sonst Accept-Header; Standard ist SSE."""
+    fmt = (fmt_param or "").lower()
+    if fmt in ("sse", "ndjson"):
+        return fmt
+    return "ndjson" if NDJSON_MEDIA_TYPE in (accept or "") else "sse"
+
+def stream_event(fmt: str, event: str, data: dict) -> str:
+    if fmt == "ndjson":
+        return _fast_dumps({"event": event, "data": data}) + "\n"
+    return f"event: {event}\ndata: {_fast_dumps(data)}\n\n"
+
+# ───────────────────────────────────────────────────────────────
+# Admission-Control
+# ───────────────────────────────────────────────────────────────
+DEADLINE_HEADER = "X-Request-Deadline"   # absolute Unix-Zeit in Sekunden
+TIMEOUT_HEADER = "X-Request-Timeout"     # relative Sekunden ab Eingang
+
+def parse_deadline(headers) -> Optional[float]:
+    """Deadline aus den Request-Headern als time.monotonic()-Zeitpunkt (oder None)."""
+    now = time.monotonic()
+    candidates = []
+    try:
+        if headers.get(DEADLINE_HEADER):
+            candidates.append(now + float(headers.get(DEADLINE_HEADER)) - time.time())
+    except (TypeError, ValueError):
+        pass
+    try:
+        if headers.get(TIMEOUT_HEADER):
+            candidates.append(now + float(headers.get(TIMEOUT_HEADER)))
+    except (TypeError, ValueError):
+        pass
+    return min(candidates) if candidates else None
+
+def deadline_expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+DEADLINE_EXCEEDED = {"error": "Deadline exceeded."}
+
+class AdmissionRejected(Exception):
+    """Request wird nicht angenommen: 429 (Warteschlange voll), 503 (Wartezeit abgelaufen), 504 (Deadline)."""
+
+    def __init__(self, status: int, reason: str, retry_after: int = 0):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def body(self) -> dict:
+        return {"error": self.reason}
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(self.retry_after)} if self.retry_after else {}
+
+class _AdmissionBase:
+    """Zähler, Queue-Time-Metriken und Retry-After-Schätzung (gemeinsam für Threads und asyncio)."""
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = max(0.0, float(queue_timeout))
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.rejected_deadline = 0
+        self.queue_time_sum = 0.0
+        self.queue_time_max = 0.0
+        self._service_ewma = 1.0   # Sekunden pro Request (gleitender Mittelwert)
+
+    def retry_after(self) -> int:
+        # Zeit, bis die aktuelle Warteschlange abgearbeitet ist (grob), 1..60 s
+        backlog = (self.waiting + 1) / self.max_inflight
+        return max(1, min(60, math.ceil(backlog * self._service_ewma)))
+
+    def _wait_budget(self, deadline: Optional[float]) -> float:
+        budget = self.queue_timeout
+        if deadline is not None:
+            budget = min(budget, deadline - time.monotonic())
+        return budget
+
+    def _reject_full(self):
+        self.rejected_full += 1
+        return AdmissionRejected(429, "Too many requests, queue is full.", self.retry_after())
+
+    def _reject_timeout(self, deadline: Optional[float]):
+        if deadline_expired(deadline):
+            self.rejected_deadline += 1
+            return AdmissionRejected(504, DEADLINE_EXCEEDED["error"])
+        self.rejected_timeout += 1
+        return AdmissionRejected(503, "Server busy, please retry.", self.retry_after())
+
+    def _record_admit(self, queued: float):
+        self.admitted += 1
+        self.queue_time_sum += queued
+        if queued > self.queue_time_max:
+            self.queue_time_max = queued
+
+    def _record_done(self, service_time: Optional[float]):
+        if service_time is not None:
+            self._service_ewma = 0.8 * self._service_ewma + 0.2 * service_time
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_queue_timeout": self.rejected_timeout,
+            "rejected_deadline": self.rejected_deadline,
+            "queue_time_avg_ms": round(1000 * self.queue_time_sum / self.admitted, 2) if self.admitted else 0.0,
+            "queue_time_max_ms": round(1000 * self.queue_time_max, 2),
+            "service_time_ewma_ms": round(1000 * self._service_ewma, 2),
+        }
+
+class AdmissionController(_AdmissionBase):
+    """Thread-Variante (Flask/Waitress). acquire() liefert die Wartezeit in Sekunden."""
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float):
+        super().__init__(max_inflight, max_queue, queue_timeout)
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        start = time.monotonic()
+        with self._cond:
+            if deadline_expired(deadline):
+                raise self._reject_timeout(deadline)
+            if self.inflight >= self.max_inflight:
+                if self.waiting >= self.max_queue:
+                    raise self._reject_full()
+                self.waiting += 1
+                try:
+                    end = start + self._wait_budget(deadline)
+                    while self.inflight >= self.max_inflight:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject_timeout(deadline)
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.inflight += 1
+            queued = time.monotonic() - start
+            self._record_admit(queued)
+            return queued
+
+    def release(self, service_time: Optional[float] = None):
+        with self._cond:
+            self.inflight -= 1
+            self._record_done(service_time)
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return super().stats()
+
+class AsyncAdmissionController(_AdmissionBase):
+    """asyncio-Variante (ASGI); nur aus dem Event-Loop benutzen."""
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float):
+        super().__init__(max_inflight, max_queue, queue_timeout)
+        self._cond = None  # asyncio.Condition, beim ersten acquire() im laufenden Loop erzeugt
+
+    async def acquire(self, deadline: Optional[float] = None) -> float:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        start = time.monotonic()
+        if deadline_expired(deadline):
+            raise self._reject_timeout(deadline)
+        if self.inflight >= self.max_inflight:
+            if self.waiting >= self.max_queue:
+                raise self._reject_full()
+            self.waiting += 1
+            try:
+                async with self._cond:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self.inflight < self.max_inflight),
+                        timeout=max(0.0, self._wait_budget(deadline))
+                    )
+            except asyncio.TimeoutError:
+                raise self._reject_timeout(deadline)
+            finally:
+                self.waiting -= 1
+        self.inflight += 1
+        queued = time.monotonic() - start
+        self._record_admit(queued)
+        return queued
+
+    async def release(self, service_time: Optional[float] = None):
+        self.inflight -= 1
+        self._record_done(service_time)
+        async with self._cond:
+            self._cond.notify()
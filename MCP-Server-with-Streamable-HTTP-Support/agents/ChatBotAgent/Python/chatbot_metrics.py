@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus-Metriken des ChatBot-Agenten (Flask/Waitress und ASGI)
+
+Hot-Path-arm:
+- Feste, kleine Label-Mengen (Route/Format/Phase); unbekannte Pfade landen unter "other"
+- Label-Kinder werden beim Import vorab gebunden – pro Request kein labels()-Lookup
+- In-Flight, Warteschlange, MCP-Health und Token-Refreshes werden erst beim Scrape
+  aus den vorhandenen Objekten gelesen (Custom-Collector, kein Update im Request-Pfad)
+
+Die Namen request_count / request_latency_seconds / agent_ask_count passen zum
+Grafana-Beispiel in agents/AgentMonitoring.
+"""
+
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+ROUTES = ("/ask", "/ask/stream", "/ask/batch", "/logs", "/status", "/metrics")
+_METHODS = ("GET", "POST", "OPTIONS", "OTHER")
+_ASK_ROUTES = ("/ask", "/ask/stream", "/ask/batch")
+
+# ───────────────────────────────────────────────────────────────
+# Metriken
+# ───────────────────────────────────────────────────────────────
+REQUEST_COUNT = Counter(
+    "request_count",
+    "Number of requests received",
+    ["method", "endpoint"]
+)
+
+REQUEST_LATENCY = Histogram(
+    "request_latency_seconds",
+    "Request latency in seconds",
+    ["method", "endpoint"]
+)
+
+ASK_COUNT = Counter(
+    "agent_ask_count",
+    "Number of questions received by the ChatBot agent",
+    ["route", "format"]
+)
+
+ASK_PHASE_LATENCY = Histogram(
+    "agent_ask_phase_seconds",
+    "Time spent per phase of a question (queue, mcp, serialization)",
+    ["phase"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+ANSWER_SIZE = Histogram(
+    "agent_answer_size_bytes",
+    "Size of the serialized /ask answer in bytes",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+
+# ───────────────────────────────────────────────────────────────
+# Vorab gebundene Label-Kinder
+# ───────────────────────────────────────────────────────────────
+_REQUEST_CHILDREN = {
+    (method, route): (REQUEST_COUNT.labels(method, route), REQUEST_LATENCY.labels(method, route))
+    for method in _METHODS for route in ROUTES + ("other",)
+}
+_ASK_CHILDREN = {
+    (route, fipa): ASK_COUNT.labels(route, "fipa" if fipa else "legacy")
+    for route in _ASK_ROUTES for fipa in (True, False)
+}
+QUEUE_TIME = ASK_PHASE_LATENCY.labels("queue")
+MCP_TIME = ASK_PHASE_LATENCY.labels("mcp")
+SERIALIZATION_TIME = ASK_PHASE_LATENCY.labels("serialization")
+
+def observe_request(method: str, path: str, seconds: float):
+    children = _REQUEST_CHILDREN.get((method, path if path in ROUTES else "other"))
+    if children is None:
+        children = _REQUEST_CHILDREN[("OTHER", path if path in ROUTES else "other")]
+    count, latency = children
+    count.inc()
+    latency.observe(seconds)
+
+def count_ask(route: str, fipa: bool):
+    _ASK_CHILDREN[(route, fipa)].inc()
+
+# ───────────────────────────────────────────────────────────────
+# Scrape-Zeit-Werte aus Agent, Admission-Control und Health-Prober
+# ───────────────────────────────────────────────────────────────
+class _StateCollector:
+    def __init__(self, agent, admission, mcp_health):
+        self.agent = agent
+        self.admission = admission
+        self.mcp_health = mcp_health
+
+    def collect(self):
+        inflight = GaugeMetricFamily("agent_inflight_requests", "Questions currently being answered")
+        inflight.add_metric([], self.admission.inflight)
+        yield inflight
+
+        waiting = GaugeMetricFamily("agent_queued_requests", "Questions waiting for a free slot")
+        waiting.add_metric([], self.admission.waiting)
+        yield waiting
+
+        rejected = CounterMetricFamily(
+            "agent_rejected_requests", "Questions rejected by admission control", labels=["reason"]
+        )
+        rejected.add_metric(["queue_full"], self.admission.rejected_full)
+        rejected.add_metric(["queue_timeout"], self.admission.rejected_timeout)
+        rejected.add_metric(["deadline"], self.admission.rejected_deadline)
+        yield rejected
+
+        healthy = GaugeMetricFamily("agent_mcp_healthy", "1 if the MCP server is reachable, else 0")
+        healthy.add_metric([], 1 if self.mcp_health.healthy else 0)
+        yield healthy
+
+        refreshes = CounterMetricFamily("agent_token_refresh", "Re-logins after an expired PrivateGPT token")
+        refreshes.add_metric([], getattr(self.agent, "token_refreshes", 0))
+        yield refreshes
+
+_collector = None
+
+def bind_state(agent, admission, mcp_health):
+    """Einmal beim Start aufrufen; registriert den Collector für die Scrape-Zeit-Werte."""
+    global _collector
+    if _collector is not None:
+        REGISTRY.unregister(_collector)
+    _collector = _StateCollector(agent, admission, mcp_health)
+    REGISTRY.register(_collector)
+
+def render_metrics() -> bytes:
+    return generate_latest(REGISTRY)
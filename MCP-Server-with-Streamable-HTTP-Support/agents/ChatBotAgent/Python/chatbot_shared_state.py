@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Gemeinsamer Zustand mehrerer ChatBot-Worker-Prozesse (SQLite im WAL-Modus)
+
+- Login-Token: nur ein Worker loggt sich ein (Lease in der DB), die anderen übernehmen
+  das Token; nach Ablauf erneuert genau ein Worker und alle lesen das neue Token
+- Gruppenliste: einmal geholt, von allen Workern gelesen (Alter begrenzt)
+- Antwort-Cache: gleiche Frage (inkl. Gruppen/Sprache/public) innerhalb der TTL nur einmal ans LLM
+
+WAL erlaubt parallele Leser neben einem Schreiber; jeder Thread bekommt eine eigene Verbindung.
+Aktiv, sobald `shared_state_path` (config.json) bzw. CHATBOT_SHARED_STATE gesetzt ist –
+der Supervisor (chatbot_supervisor.py) setzt die Variable für seine Worker.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from ...AgentInterface.Python.agent import PrivateGPTAgent, AsyncPrivateGPTAgent
+
+SHARED_STATE_ENV = "CHATBOT_SHARED_STATE"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name    TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+# ───────────────────────────────────────────────────────────────
+# Store
+# ───────────────────────────────────────────────────────────────
+class SharedState:
+    PURGE_EVERY = 256  # Schreibzugriffe zwischen zwei Aufräumläufen (pro Prozess)
+
+    def __init__(self, path, answer_ttl: float = 0.0, answer_max_entries: int = 10000):
+        self.path = str(path)
+        self.answer_ttl = float(answer_ttl)
+        self.answer_max_entries = int(answer_max_entries)
+        self.answer_hits = 0
+        self.answer_misses = 0
+        self._local = threading.local()
+        self._puts = 0
+        # Enthält das Login-Token -> nur für den Besitzer lesbar (-wal/-shm erben die Rechte)
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        self._conn().executescript(_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config) -> Optional["SharedState"]:
+        path = os.environ.get(SHARED_STATE_ENV) or config.get("shared_state_path")
+        if not path:
+            return None
+        return cls(
+            path,
+            answer_ttl=float(config.get("answer_cache_ttl_seconds", 0)),
+            answer_max_entries=int(config.get("answer_cache_max_entries", 10000)),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit; Transaktionen nur explizit (BEGIN IMMEDIATE) für die Lease
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Key/Value (Token, Gruppen)
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[str]:
+        row = self._conn().execute("SELECT value, updated FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return row[0]
+
+    def put(self, key: str, value: str):
+        self._conn().execute(
+            "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+            (key, value, time.time())
+        )
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def reset_session(self):
+        """Beim Start des Supervisors: Token/Gruppen/Leases eines früheren Laufs verwerfen."""
+        conn = self._conn()
+        conn.execute("DELETE FROM kv")
+        conn.execute("DELETE FROM leases")
+
+    # Lease (prozessübergreifende Sperre mit Ablaufzeit; verfällt, wenn der Halter abstürzt)
+    def try_lease(self, name: str, owner: str, ttl: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)",
+                (name, owner, now + ttl)
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release_lease(self, name: str, owner: str):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    # Antwort-Cache
+    @property
+    def answers_enabled(self) -> bool:
+        return self.answer_ttl > 0
+
+    @staticmethod
+    def answer_key(question: str, use_public: bool, groups: Optional[List[str]], language: str) -> str:
+        raw = json.dumps([question, bool(use_public), sorted(groups or []), language], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def answer_get(self, key: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT value FROM answers WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            self.answer_misses += 1
+            return None
+        self.answer_hits += 1
+        return json.loads(row[0])
+
+    def answer_put(self, key: str, answer: dict):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO answers (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(answer, ensure_ascii=False), now + self.answer_ttl)
+        )
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM answers WHERE expires <= ?", (now,))
+            conn.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.answer_max_entries,)
+            )
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "answer_cache_ttl": self.answer_ttl,
+            "answer_hits": self.answer_hits,
+            "answer_misses": self.answer_misses,
+        }
+
+# ───────────────────────────────────────────────────────────────
+# Agenten mit geteiltem Token / geteilter Gruppenliste
+# ───────────────────────────────────────────────────────────────
+LOGIN_LEASE = "login"
+LOGIN_LEASE_TTL = 30.0   # s; länger als ein Login dauern darf
+LOGIN_WAIT = 15.0        # s; so lange auf den Login eines anderen Workers warten
+LOGIN_POLL = 0.1
+
+class _SharedTokenMixin:
+    """
+    Token und Gruppen kommen aus dem SharedState. `_seen_token` ist das zuletzt
+    benutzte Token: ist das geteilte Token davon verschieden, hat ein anderer Worker
+    bereits neu eingeloggt und es wird übernommen; ist es gleich, ist es abgelaufen.
+    """
+
+    def _init_shared(self, config, shared: SharedState):
+        self.shared = shared
+        self._seen_token = None
+        self._lease_owner = f"{os.getpid()}-{id(self)}"
+        self._groups_ttl = float(config.get("shared_groups_ttl_seconds", 300))
+
+    def _adopt_shared_token(self) -> bool:
+        token = self.shared.get("token")
+        if token and token != self._seen_token:
+            self.token = self._seen_token = token
+            logging.info("Login-Token aus gemeinsamem Zustand übernommen.",
+                         extra={"component": "Agent", "tag": "SHARED", "message_type": "INFO"})
+            return True
+        return False
+
+    def _publish_token(self):
+        self._seen_token = self.token
+        self.shared.put("token", self.token)
+
+    def _shared_groups(self):
+        raw = self.shared.get("groups", max_age=self._groups_ttl)
+        return json.loads(raw) if raw is not None else None
+
+    def _publish_groups(self, groups):
+        if groups:
+            self.shared.put("groups", json.dumps(groups))
+
+class SharedPrivateGPTAgent(_SharedTokenMixin, PrivateGPTAgent):
+    def __init__(self, config, shared: SharedState):
+        self._init_shared(config, shared)
+        super().__init__(config)
+
+    def login(self):
+        if self._adopt_shared_token():
+            return True
+        deadline = time.monotonic() + LOGIN_WAIT
+        while not self.shared.try_lease(LOGIN_LEASE, self._lease_owner, LOGIN_LEASE_TTL):
+            if self._adopt_shared_token():
+                return True
+            if time.monotonic() > deadline:
+                break  # Halter hängt -> selbst einloggen
+            time.sleep(LOGIN_POLL)
+        try:
+            if self._adopt_shared_token():
+                return True
+            if super().login():
+                self._publish_token()
+                return True
+            return False
+        finally:
+            self.shared.release_lease(LOGIN_LEASE, self._lease_owner)
+
+    def list_personal_groups(self):
+        groups = self._shared_groups()
+        if groups is None:
+            groups = super().list_personal_groups()
+            self._publish_groups(groups)
+        return groups
+
+    def logout(self):
+        # Token gehört allen Workern -> nicht ausloggen, nur die Verbindung schließen
+        self.stop_group_refresh()
+        self.token = None
+        self.network_client.close()
+
+class SharedAsyncPrivateGPTAgent(_SharedTokenMixin, AsyncPrivateGPTAgent):
+    def __init__(self, config, shared: SharedState):
+        self._init_shared(config, shared)
+        super().__init__(config)
+
+    # SQLite-Zugriffe (Busy-Timeout, solange ein anderer Worker schreibt) laufen im Thread-Pool,
+    # damit der Event-Loop dieses Workers weiter Requests bedient
+    async def alogin(self):
+        if await asyncio.to_thread(self._adopt_shared_token):
+            return True
+        deadline = time.monotonic() + LOGIN_WAIT
+        while not await asyncio.to_thread(self.shared.try_lease, LOGIN_LEASE, self._lease_owner, LOGIN_LEASE_TTL):
+            if await asyncio.to_thread(self._adopt_shared_token):
+                return True
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(LOGIN_POLL)
+        try:
+            if await asyncio.to_thread(self._adopt_shared_token):
+                return True
+            if await super().alogin():
+                await asyncio.to_thread(self._publish_token)
+                return True
+            return False
+        finally:
+            await asyncio.to_thread(self.shared.release_lease, LOGIN_LEASE, self._lease_owner)
+
+    async def alist_personal_groups(self):
+        groups = await asyncio.to_thread(self._shared_groups)
+        if groups is None:
+            groups = await super().alist_personal_groups()
+            await asyncio.to_thread(self._publish_groups, groups)
+        return groups
+
+    async def alogout(self):
+        self.stop_group_refresh()
+        self.token = None
+        await self.network_client.close()
+
+def create_agent(config, shared: Optional[SharedState], use_async: bool = False):
+    """Agent passend zum Betriebsmodus (Einzelprozess oder Worker mit gemeinsamem Zustand)."""
+    if shared is None:
+        return AsyncPrivateGPTAgent(config) if use_async else PrivateGPTAgent(config)
+    return SharedAsyncPrivateGPTAgent(config, shared) if use_async else SharedPrivateGPTAgent(config, shared)
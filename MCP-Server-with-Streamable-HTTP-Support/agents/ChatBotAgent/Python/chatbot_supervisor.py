@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-Worker-Betrieb des ChatBot-Agenten (Pre-Fork-Supervisor)
+
+Ein Prozess und ein PrivateGPTAgent begrenzen den Durchsatz (GIL, ein Token, ein Socket-Pfad).
+Der Supervisor
+- bindet api_ip:api_port einmal und reicht den Listen-Socket an N Worker-Prozesse weiter
+  (der Kernel verteilt die Verbindungen; funktioniert auch unter Windows),
+- startet die Worker mit gemeinsamem Zustand (chatbot_shared_state: Token, Gruppen, Antwort-Cache),
+- startet abgestürzte Worker neu (mit Backoff, falls sie direkt wieder sterben),
+- beendet bei SIGINT/SIGTERM alle Worker.
+
+Start:
+    python -m agents.ChatBotAgent.Python.chatbot_supervisor --workers 4          # Flask/Waitress
+    python -m agents.ChatBotAgent.Python.chatbot_supervisor --workers 4 --asgi   # FastAPI/Uvicorn
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+from .chatbot_shared_state import SharedState, SHARED_STATE_ENV
+from ...AgentInterface.Python.config import Config, ConfigError
+from ...AgentInterface.Python.logging_setup import setup_logging
+
+WORKER_ID_ENV = "CHATBOT_WORKER_ID"
+STABLE_AFTER = 10.0   # s; lief ein Worker so lange, gilt der nächste Absturz nicht als Crash-Loop
+MAX_BACKOFF = 30.0
+
+# ───────────────────────────────────────────────────────────────
+# Worker
+# ───────────────────────────────────────────────────────────────
+def _worker_main(index: int, sock: socket.socket, use_asgi: bool, state_path: str):
+    os.environ[SHARED_STATE_ENV] = state_path
+    os.environ[WORKER_ID_ENV] = str(index)
+    # Strg+C trifft die ganze Prozessgruppe; das Herunterfahren steuert der Supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if use_asgi:
+        from . import chatbot_agent_asgi as server
+    else:
+        from . import chatbot_agent as server
+    server.run_api_server(sockets=[sock])
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started = 0.0
+        self.backoff = 0.0
+        self.restart_at = 0.0
+
+# ───────────────────────────────────────────────────────────────
+# Supervisor
+# ───────────────────────────────────────────────────────────────
+class Supervisor:
+    def __init__(self, sock, workers: int, use_asgi: bool, state_path: str):
+        self.sock = sock
+        self.use_asgi = use_asgi
+        self.state_path = state_path
+        self.workers = [_Worker(i) for i in range(workers)]
+        self.restarts = 0
+        self._stopping = False
+        # spawn: gleiches Verhalten unter Linux und Windows, keine geerbten Threads/Locks
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def _spawn(self, worker: _Worker):
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self.sock, self.use_asgi, self.state_path),
+            name=f"chatbot-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started = time.monotonic()
+        logging.info(f"Worker {worker.index} gestartet (pid={worker.process.pid}).",
+                     extra={"component": "Supervisor", "tag": "SPAWN", "message_type": "INFO"})
+
+    def _check(self, worker: _Worker, now: float):
+        if worker.process is not None and worker.process.is_alive():
+            return
+        if worker.process is not None:
+            lived = now - worker.started
+            worker.backoff = 0.0 if lived >= STABLE_AFTER else min(MAX_BACKOFF, max(1.0, worker.backoff * 2))
+            worker.restart_at = now + worker.backoff
+            logging.warning(
+                f"Worker {worker.index} beendet (exit={worker.process.exitcode}, lief {lived:.1f}s), "
+                f"Neustart in {worker.backoff:.0f}s.",
+                extra={"component": "Supervisor", "tag": "EXIT", "message_type": "WARNING"}
+            )
+            worker.process = None
+            self.restarts += 1
+        if now >= worker.restart_at:
+            self._spawn(worker)
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        for worker in self.workers:
+            self._spawn(worker)
+        while not self._stopping:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for worker in self.workers:
+                if self._stopping:
+                    break
+                self._check(worker, now)
+        self._shutdown()
+
+    def _shutdown(self, timeout: float = 10.0):
+        logging.info("Beende Worker...", extra={"component": "Supervisor", "tag": "STOP", "message_type": "INFO"})
+        alive = [w.process for w in self.workers if w.process is not None and w.process.is_alive()]
+        for process in alive:
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in alive:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self.sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatBot-Agent mit mehreren Worker-Prozessen")
+    parser.add_argument("--workers", type=int, help="Anzahl Worker (Default: config 'workers' oder CPU-Anzahl)")
+    parser.add_argument("--asgi", action="store_true", help="FastAPI/Uvicorn-Variante statt Flask/Waitress")
+    args = parser.parse_args()
+
+    setup_logging(os.environ.get("LOG_LEVEL", "INFO"), default_component="Supervisor")
+    try:
+        config = Config(
+            config_file=(Path(__file__).parent.parent / "config.json").resolve(),
+            required_fields=["email", "password", "mcp_server", "api_ip", "api_port", "api_key"]
+        )
+    except ConfigError as e:
+        logging.error(f"Configuration Error: {e}", extra={"component": "Config", "tag": "ERROR", "message_type": "ERROR"})
+        sys.exit(1)
+
+    workers = max(1, args.workers or int(config.get("workers", os.cpu_count() or 2)))
+    state_path = str(Path(config.get("shared_state_path", "chatbot_state.db")).resolve())
+    # Token/Gruppen/Leases eines früheren Laufs verwerfen; der Antwort-Cache bleibt gültig (TTL)
+    SharedState(state_path).reset_session()
+
+    host = config.get("api_ip", "0.0.0.0")
+    port = int(config.get("api_port", 5001))
+    sock = socket.create_server((host, port), backlog=int(config.get("listen_backlog", 2048)))
+    logging.info(
+        f"Supervisor: {workers} Worker ({'ASGI' if args.asgi else 'Flask'}) auf {host}:{port}, Zustand in {state_path}",
+        extra={"component": "Supervisor", "tag": "START", "message_type": "INFO"}
+    )
+
+    supervisor = Supervisor(sock, workers, args.asgi, state_path)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    supervisor.run()
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,31 @@
 # - NEW: Optional SFTP upload of the output file after completion
 # - NEW: Delete local output file upon successful SFTP upload
 # - NEW: logge Dauer zwischen chatbot request und response
+# - NEW: PDF input: parallel page extraction, early stop, SHA-256 cache
+# - NEW: Batch mode – K nodes per request (token budget), single-node fallback
+# - NEW: NDJSON events via buffered background writer (flushed on exit)
+# - NEW: Delta mode – only nodes with changed state go to the LLM
+# - NEW: Daemon mode – watch folder, warm inventory/HTTP session, /status + /metrics
 # ============================================================
 
+import hashlib
 import json
 import re
 import time
 import sys
 import argparse
+import atexit
+import fnmatch
+import importlib.util
 import logging
 import os
+import queue
 import shutil
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -43,8 +57,16 @@ try:
 except Exception:
     _HAS_AGENT_IFACE = False
 
+try:
+    from ...AgentInterface.Python.logging_setup import setup_logging as _setup_logging
+except Exception:
+    _setup_logging = None
+
 colorama_init()  # enable ANSI handling on Windows
 
+# Shared HTTP session (keep-alive to the chatbot agent across requests and daemon runs)
+_HTTP = requests.Session()
+
 # ============================================================
 # Structured console / file logging (white text only)
 # ============================================================
@@ -64,10 +86,26 @@ class StructuredLog:
         "CRITICAL": "‼️",
     }
 
+    # NDJSON writer: bounded queue, records written in batches by one background thread
+    QUEUE_SIZE = 10000
+    BATCH_SIZE = 256
+    FLUSH_INTERVAL = 0.5
+
     def __init__(self, ndjson_path: Optional[str] = None, use_color: bool = True):
         self.ndjson_path = ndjson_path
         self.use_color = use_color
+        self._col_cache: Dict[tuple, str] = {}
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        # lost NDJSON records: queue full (writer stalled) / write or open failed (disk full, permissions)
+        self.dropped_records = 0
+        self.write_errors = 0
         self._ensure_dir()
+        if self.ndjson_path:
+            self._writer = threading.Thread(target=self._writer_loop, name="ndjson-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
 
     # ---------------- internal helpers ----------------
     def _ensure_dir(self) -> None:
@@ -77,27 +115,79 @@ class StructuredLog:
                 with open(self.ndjson_path, "w", encoding="utf-8"):
                     pass
 
+    def _writer_loop(self) -> None:
+        """Keep the NDJSON file open; write queued records in batches until a None sentinel arrives.
+
+        I/O errors only cost the affected batch (counted in write_errors); the file is reopened
+        for the next batch, so the thread keeps draining the queue.
+        """
+        f = None
+        running = True
+        try:
+            while running:
+                try:
+                    first = self._queue.get(timeout=self.FLUSH_INTERVAL)
+                except queue.Empty:
+                    continue
+                batch = [first]
+                while len(batch) < self.BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                lines = []
+                for record in batch:
+                    if record is None:
+                        running = False
+                        continue
+                    try:
+                        lines.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                    except Exception:
+                        pass
+                if not lines:
+                    continue
+                try:
+                    if f is None:
+                        f = open(self.ndjson_path, "a", encoding="utf-8")
+                    f.write("".join(lines))
+                    f.flush()
+                except Exception:
+                    self.write_errors += 1
+                    if f is not None:
+                        try:
+                            f.close()
+                        except Exception:
+                            pass
+                        f = None
+        finally:
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+
     @staticmethod
     def _ts() -> str:
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
+    @staticmethod
+    def _width(s: str) -> int:
+        if s.isascii():
+            return len(s)
+        vis = wcswidth(s)
+        return len(s) if vis < 0 else vis
+
     @staticmethod
     def _pad_raw(s: str, width: int) -> str:
         """Pad string to visual width 'width' (handles emojis & wide chars)."""
         s = (s or "")
-        vis = wcswidth(s)
-        if vis < 0:
-            vis = len(s)
-        return s + " " * max(0, width - vis)
+        return s + " " * max(0, width - StructuredLog._width(s))
 
     @staticmethod
     def _pad_raw_right_aligned(s: str, width: int) -> str:
         """Pad string to visual width 'width', right-aligned."""
         s = (s or "")
-        vis = wcswidth(s)
-        if vis < 0:
-            vis = len(s)
-        return " " * max(0, width - vis) + s
+        return " " * max(0, width - StructuredLog._width(s)) + s
 
     def _white(self, text: str) -> str:
         """Force bright white output for all columns."""
@@ -113,13 +203,22 @@ class StructuredLog:
                 return self.LEVEL_ICONS[lvl] #+ " |"
         return "ℹ️ "
 
+    def _fixed_cols(self, icon: str, component: str, action: str) -> str:
+        """Padded + colored icon/component/action columns; the set of combinations is small, so cache them."""
+        key = (icon, component, action)
+        cols = self._col_cache.get(key)
+        if cols is None:
+            i_col = self._pad_raw(icon, self.COL_ICON)
+            c_col = self._white(self._pad_raw(component, self.COL_COMP))
+            a_col = self._white(self._pad_raw(action, self.COL_ACT))
+            cols = "".join([i_col, " ", c_col, " ", a_col, " "])
+            self._col_cache[key] = cols
+        return cols
+
     # >>> FIXED HERE <<< (kein level mehr!)
     def _line(self, icon: str, component: str, action: str, direction: str, message: str) -> str:
         # icon ist bereits fertig (z. B. "ℹ️ |" oder "‼️ |")
         t_col = self._pad_raw(self._ts(), self.COL_TIME)
-        i_col = self._pad_raw(icon, self.COL_ICON)
-        c_col = self._pad_raw(component, self.COL_COMP)
-        a_col = self._pad_raw(action, self.COL_ACT)
 
         # bestimmte Felder rechtsbündig
         if (
@@ -129,8 +228,6 @@ class StructuredLog:
         else:
             d_col = self._pad_raw(direction, self.COL_DIR)
 
-        c_col = self._white(c_col)
-        a_col = self._white(a_col)
         d_col = self._white(d_col)
         msg_col = self._white(message or "")
 
@@ -138,12 +235,7 @@ class StructuredLog:
             [
                 t_col,
                 " | ",
-                i_col,
-                " ",
-                c_col,
-                " ",
-                a_col,
-                " ",
+                self._fixed_cols(icon, component, action),
                 d_col,
                 " | ",
                 msg_col,
@@ -160,26 +252,41 @@ class StructuredLog:
         message: str,
         level: str = "info",
     ) -> None:
-        line = self._line(self._icon(icon_kind, level), component, action, direction, message)
         lvl = (level or "info").lower()
-        if lvl == "error":
-            logging.error(line)
-        elif lvl == "warning":
-            logging.warning(line)
-        elif lvl == "debug":
-            logging.debug(line)
-        elif lvl == "critical":
-            logging.critical(line)
-        else:
-            logging.info(line)
+        log_level = logging.getLevelName(lvl.upper())
+        if not isinstance(log_level, int):
+            log_level = logging.INFO
+        if not logging.getLogger().isEnabledFor(log_level):
+            return
+        line = self._line(self._icon(icon_kind, level), component, action, direction, message)
+        logging.log(log_level, line)
 
     def file_event(self, **record) -> None:
-        """Append a JSON record to NDJSON log (if configured)."""
-        if not self.ndjson_path:
+        """Queue a JSON record for the NDJSON log (if configured); written by the background writer."""
+        if not self.ndjson_path or self._closed:
             return
         record.setdefault("ts", self._ts())
-        with open(self.ndjson_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        try:
+            self._queue.put_nowait(record)  # never block the pipeline on a stalled writer
+        except queue.Full:
+            self.dropped_records += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush pending NDJSON records and stop the writer thread."""
+        if self._closed or self._writer is None:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass  # writer stalled; it is a daemon thread and must not hold up the exit
+        else:
+            self._writer.join(timeout)
+        if self.dropped_records or self.write_errors:
+            logging.warning(
+                f"NDJSON log {self.ndjson_path}: {self.dropped_records} record(s) dropped, "
+                f"{self.write_errors} failed write(s)"
+            )
 
 
 slog: Optional[StructuredLog] = None
@@ -190,7 +297,11 @@ slog: Optional[StructuredLog] = None
 # ============================================================
 def setup_logging(verbose: bool):
     level = logging.DEBUG if verbose else logging.INFO
-    logging.basicConfig(level=level, format="%(message)s")
+    # Lines arrive pre-formatted from StructuredLog; stdout is written by the shared QueueListener
+    if _setup_logging is not None:
+        _setup_logging(level, fmt="%(message)s")
+    else:
+        logging.basicConfig(level=level, format="%(message)s")
 
 
 # ============================================================
@@ -214,6 +325,15 @@ def load_config(path: Path) -> Dict[str, Any]:
     chatbot.setdefault("groups", [])
     chatbot.setdefault("timeout_seconds", 20)
     chatbot.setdefault("prompt_template", "prompt_template parameter not set. Repeat this sentence.")
+    batch = chatbot.get("batch", {})
+    batch.setdefault("enabled", False)
+    batch.setdefault("max_nodes", 8)
+    batch.setdefault("token_budget", 6000)
+    batch.setdefault("output_tokens_per_node", 250)
+    batch.setdefault("encoding", "o200k_base")
+    if batch.get("prompt_template"):
+        check_batch_prompt_template(batch["prompt_template"])
+    chatbot["batch"] = batch
     data["chatbot_agent"] = chatbot
 
     data.setdefault("language", "en")
@@ -225,8 +345,39 @@ def load_config(path: Path) -> Dict[str, Any]:
     paths.setdefault("ndjson", "agents/ISMAgent/logs/ism_agent.ndjson")
     paths.setdefault("dump_json_dir", "agents/ISMAgent/logs/node_json")
     paths.setdefault("archive_dir", "agents/ISMAgent/archive")
+    paths.setdefault("pdf_cache_dir", "agents/ISMAgent/cache/pdf")
+    paths.setdefault("state", "agents/ISMAgent/state/ism_state.json")
+    paths.setdefault("change_report", "agents/ISMAgent/output/ism_nodes_changes.txt")
     data["paths"] = paths
 
+    # PDF-Extraktion: Worker-Prozesse, Seiten pro Task, Cache
+    pdf = data.get("pdf", {})
+    pdf.setdefault("workers", min(4, os.cpu_count() or 1))
+    pdf.setdefault("pages_per_task", 8)
+    pdf.setdefault("cache", True)
+    pdf.setdefault("cache_dir", paths["pdf_cache_dir"])
+    pdf.setdefault("cache_max_entries", 256)
+    pdf.setdefault("cache_max_age_days", 30)
+    data["pdf"] = pdf
+
+    # Delta-Modus: nur Knoten mit geänderten Zustandsfeldern an das LLM
+    delta = data.get("delta", {})
+    delta.setdefault("enabled", False)
+    delta.setdefault("watch_fields", list(DELTA_WATCH_FIELDS))
+    delta.setdefault("full_report", False)
+    data["delta"] = delta
+
+    # Daemon-Modus: Eingabeverzeichnis beobachten statt Cron
+    daemon = data.get("daemon", {})
+    daemon.setdefault("enabled", False)
+    daemon.setdefault("watch_dir", os.path.dirname(paths["input"]) or ".")
+    daemon.setdefault("patterns", ["*.json", "*.pdf"])
+    daemon.setdefault("poll_interval_seconds", 5)
+    daemon.setdefault("settle_seconds", 2)
+    daemon.setdefault("status_host", "127.0.0.1")
+    daemon.setdefault("status_port", 9102)
+    data["daemon"] = daemon
+
     # optionale SFTP-Konfig
     sftp = data.get("sftp", {})
     if sftp:
@@ -239,22 +390,117 @@ def load_config(path: Path) -> Dict[str, Any]:
     return data
 
 
-def _parse_pdf_json(pdf_path: Path) -> Dict[str, Any]:
-    try:
-        import PyPDF2
-    except Exception as e:
-        raise RuntimeError("PyPDF2 is required to read PDFs. Install via 'pip install PyPDF2'.") from e
+# ============================================================
+# PDF input helpers (parallel page extraction + extraction cache)
+# ============================================================
+class _JsonEndScanner:
+    """Incrementally tracks brace depth to find the end of the top-level JSON object."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.consumed = 0
+
+    def feed(self, text: str) -> int:
+        """Scan 'text'; return the absolute offset of the closing brace or -1."""
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.consumed + i
+        self.consumed += len(text)
+        return -1
+
+
+def _extract_pdf_pages(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract text of pages [start, stop). Top-level so it can run in a worker process."""
+    import PyPDF2
 
-    text_chunks = []
     with open(pdf_path, "rb") as f:
         reader = PyPDF2.PdfReader(f)
-        for page in reader.pages:
-            text_chunks.append(page.extract_text() or "")
-    full = "\n".join(text_chunks)
-    start, end = full.find("{"), full.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        raise ValueError(f"No JSON found inside PDF: {pdf_path}")
-    json_text = full[start : end + 1]
+        return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def _pdf_cache_key(pdf_path: Path) -> str:
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _pdf_cache_read(cache_dir: Optional[Path], key: str) -> Optional[Any]:
+    if cache_dir is None:
+        return None
+    cache_file = cache_dir / f"{key}.json"
+    if not cache_file.exists():
+        return None
+    try:
+        data = json.loads(cache_file.read_text(encoding="utf-8"))
+        os.utime(cache_file)  # mtime = last use (pruning keeps recently used entries)
+        return data
+    except Exception:
+        return None
+
+
+def _pdf_cache_prune(cache_dir: Path, max_entries: int, max_age_days: float) -> int:
+    """Drop entries unused for 'max_age_days' and the least recently used beyond 'max_entries' (0 = no limit)."""
+    entries = []
+    for cache_file in cache_dir.glob("*.json"):
+        try:
+            entries.append((cache_file.stat().st_mtime, cache_file))
+        except OSError:
+            continue
+    entries.sort(reverse=True)  # newest first
+    cutoff = time.time() - max_age_days * 86400 if max_age_days > 0 else None
+    removed = 0
+    for index, (mtime, cache_file) in enumerate(entries):
+        if (max_entries > 0 and index >= max_entries) or (cutoff is not None and mtime < cutoff):
+            try:
+                cache_file.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _pdf_cache_write(cache_dir: Optional[Path], key: str, data: Any,
+                     max_entries: int = 0, max_age_days: float = 0) -> None:
+    if cache_dir is None:
+        return
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache_dir / f"{key}.json.tmp"
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, cache_dir / f"{key}.json")
+        removed = _pdf_cache_prune(cache_dir, max_entries, max_age_days)
+        if removed and slog:
+            slog.file_event(event="pdf_cache_pruned", removed=removed)
+    except Exception as e:
+        if slog:
+            slog.console("warning", "ism", ":pdf-cache", "Error", f"{e}", level="warning")
+
+
+def _clean_pdf_json_text(json_text: str) -> Any:
     json_text = re.sub(r"-\n", "", json_text)
     json_text = re.sub(r"[ \t\r\f\v]+", " ", json_text)
     try:
@@ -264,7 +510,121 @@ def _parse_pdf_json(pdf_path: Path) -> Dict[str, Any]:
         return json.loads(json_text_2)
 
 
-def load_nodes(path: Path) -> List[Dict[str, Any]]:
+# One worker pool per process, reused for every PDF (daemon mode reads many files)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_workers = 0
+
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    global _pdf_pool, _pdf_pool_workers
+    if _pdf_pool is None or _pdf_pool_workers != workers:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=True, cancel_futures=True)
+        else:
+            atexit.register(_shutdown_pdf_pool)
+        _pdf_pool = ProcessPoolExecutor(max_workers=workers)
+        _pdf_pool_workers = workers
+    return _pdf_pool
+
+
+def _shutdown_pdf_pool() -> None:
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=True, cancel_futures=True)
+        _pdf_pool = None
+
+
+def _read_pdf_text(pdf_path: Path, workers: int, pages_per_task: int, stop_early: bool = True) -> tuple:
+    """
+    Extract page text in windows of 'workers * pages_per_task' pages.
+    With 'stop_early', stops as soon as the top-level JSON object is closed.
+    Returns (text, early_stop).
+    """
+    import PyPDF2
+
+    with open(pdf_path, "rb") as f:
+        page_count = len(PyPDF2.PdfReader(f).pages)
+
+    pages_per_task = max(1, int(pages_per_task))
+    workers = max(1, int(workers))
+    use_pool = workers > 1 and page_count > pages_per_task
+    window = workers * pages_per_task if use_pool else pages_per_task
+
+    scanner = _JsonEndScanner()
+    chunks: List[str] = []
+    executor = _get_pdf_pool(workers) if use_pool else None
+    for win_start in range(0, page_count, window):
+        win_stop = min(page_count, win_start + window)
+        if executor:
+            futures = [
+                executor.submit(_extract_pdf_pages, str(pdf_path), s, min(win_stop, s + pages_per_task))
+                for s in range(win_start, win_stop, pages_per_task)
+            ]
+            try:
+                pages = [text for fut in futures for text in fut.result()]
+            finally:
+                for fut in futures:
+                    fut.cancel()  # only matters if a task failed; the pool stays up
+        else:
+            pages = _extract_pdf_pages(str(pdf_path), win_start, win_stop)
+
+        for text in pages:
+            piece = text + "\n"
+            end = scanner.feed(piece) if stop_early else -1
+            chunks.append(piece)
+            if end != -1:
+                return "".join(chunks)[: end + 1], True
+    return "".join(chunks), False
+
+
+def _parse_pdf_json(
+    pdf_path: Path,
+    cache_dir: Optional[Path] = None,
+    workers: int = 1,
+    pages_per_task: int = 8,
+    cache_max_entries: int = 0,
+    cache_max_age_days: float = 0,
+) -> Dict[str, Any]:
+    if importlib.util.find_spec("PyPDF2") is None:
+        raise RuntimeError("PyPDF2 is required to read PDFs. Install via 'pip install PyPDF2'.")
+
+    key = _pdf_cache_key(pdf_path) if cache_dir is not None else ""
+    cached = _pdf_cache_read(cache_dir, key)
+    if cached is not None:
+        if slog:
+            slog.console("info", "ism", ":pdf-cache", "hit", f"Using cached extraction for {pdf_path.name}")
+            slog.file_event(event="pdf_cache_hit", source=str(pdf_path), key=key)
+        return cached
+
+    t_start = time.perf_counter()
+    full, early_stop = _read_pdf_text(pdf_path, workers, pages_per_task)
+    data = None
+    if early_stop:
+        try:
+            data = _clean_pdf_json_text(full[full.find("{"):])
+        except json.JSONDecodeError:
+            # brace tracking can be fooled by mangled quotes; re-read everything
+            full, _ = _read_pdf_text(pdf_path, workers, pages_per_task, stop_early=False)
+            early_stop = False
+
+    if data is None:
+        start, end = full.find("{"), full.rfind("}")
+        if start == -1 or end == -1 or end <= start:
+            raise ValueError(f"No JSON found inside PDF: {pdf_path}")
+        data = _clean_pdf_json_text(full[start : end + 1])
+
+    if slog:
+        slog.file_event(
+            event="pdf_extracted",
+            source=str(pdf_path),
+            early_stop=early_stop,
+            elapsed_seconds=round(time.perf_counter() - t_start, 3),
+        )
+    _pdf_cache_write(cache_dir, key, data, cache_max_entries, cache_max_age_days)
+    return data
+
+
+def load_nodes(path: Path, pdf_cfg: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     if slog:
         slog.console("info", "ism", ":filesystem", "read", f"Reading input file: {path}")
 
@@ -282,7 +642,16 @@ def load_nodes(path: Path) -> List[Dict[str, Any]]:
                 slog.console("error", "ism", ":json", "Error", f"Invalid JSON: {e}", level="error")
             raise
     elif suffix == ".pdf":
-        data = _parse_pdf_json(path)
+        pdf_cfg = pdf_cfg or {}
+        cache_dir = pdf_cfg.get("cache_dir")
+        data = _parse_pdf_json(
+            path,
+            cache_dir=Path(cache_dir) if cache_dir and pdf_cfg.get("cache", True) else None,
+            workers=int(pdf_cfg.get("workers", 1)),
+            pages_per_task=int(pdf_cfg.get("pages_per_task", 8)),
+            cache_max_entries=int(pdf_cfg.get("cache_max_entries", 256)),
+            cache_max_age_days=float(pdf_cfg.get("cache_max_age_days", 30)),
+        )
     else:
         raise ValueError(f"Unsupported input file type: {suffix} (expected .json or .pdf)")
 
@@ -360,7 +729,7 @@ def check_server_health(cfg: Dict[str, Any]) -> None:
     if not url:
         return
     try:
-        r = requests.get(url, timeout=5)
+        r = _HTTP.get(url, timeout=5)
         if r.status_code >= 400:
             if slog:
                 slog.console("warning", "chatbot", ":health", "Warn", f"{r.status_code}: {r.text[:200]}", level="warning")
@@ -484,10 +853,12 @@ def node_params(node: Dict[str, Any], inventory_map: Dict[int, Dict[str, Any]])
 
 
 # ============================================================
-# Chatbot Request (FIPA-ACL) – One Node per Request with retry
+# Chatbot Request (FIPA-ACL) – shared request loop with retry
 # ============================================================
-def generate_logical_sentence(
-    parameters: Dict[str, Any],
+def _chatbot_request(
+    prompt: str,
+    json_data: Any,
+    label: str,
     language_code: str,
     config: Dict[str, Any],
     use_public: Optional[bool] = None,
@@ -498,20 +869,6 @@ def generate_logical_sentence(
     attempt = 0
     last_error = None
 
-    prompt_template = config.get("chatbot_agent", {}).get("prompt_template")
-    if not prompt_template:
-        prompt_template = (
-            "Generate a fluent, well-written paragraph in {language_code} describing the following node. "
-            "It should read like a technical report (no tables or bullet points). "
-            "Here are the data:\n"
-            "{json_data}"
-        )
-
-    prompt = prompt_template.format(
-        language_code=language_code.upper(),
-        json_data=json.dumps(parameters, ensure_ascii=False, indent=4),
-    )
-
     if use_public is None:
         use_public = bool(config.get("chatbot_agent", {}).get("use_public", True))
     if groups is None:
@@ -522,8 +879,6 @@ def generate_logical_sentence(
     timeout_sec = int(config.get("chatbot_agent", {}).get("timeout_seconds", 20))
     api_url = config["chatbot_agent"]["api_url"]
 
-    node_name = parameters.get("Node Name", "<unknown>")
-
     while attempt < max_retries:
         attempt += 1
         try:
@@ -538,8 +893,8 @@ def generate_logical_sentence(
                     "usePublic": use_public,
                     "groups": groups,
                     "language": language_code or config.get("language", "en"),
-                    "json_data": parameters,
-                    "node": parameters,  # falls der Server 'node' statt 'json_data' erwartet
+                    "json_data": json_data,
+                    "node": json_data,  # falls der Server 'node' statt 'json_data' erwartet
                 },
             }
 
@@ -549,12 +904,12 @@ def generate_logical_sentence(
             }
 
             if slog:
-                slog.console("cb", "chatbot", ":request", "Outgoing", f"Request for node: {node_name}")
-                slog.file_event(event="request", component="chatbot_agent", node=node_name)
+                slog.console("cb", "chatbot", ":request", "Outgoing", f"Request for node: {label}")
+                slog.file_event(event="request", component="chatbot_agent", node=label)
 
             # >>> NEU: Zeitmessung
             t_start = time.perf_counter()
-            response = requests.post(api_url, json=payload, headers=headers, timeout=timeout_sec)
+            response = _HTTP.post(api_url, json=payload, headers=headers, timeout=timeout_sec)
             t_end = time.perf_counter()
             elapsed = t_end - t_start  # Sekunden als float
 
@@ -569,7 +924,7 @@ def generate_logical_sentence(
                 slog.file_event(
                     event="response",
                     status=response.status_code,
-                    node=node_name,
+                    node=label,
                     elapsed_seconds=round(elapsed, 3),
                 )
             # <<< ENDE NEU
@@ -609,6 +964,259 @@ def generate_logical_sentence(
     raise RuntimeError(last_error or "Unknown chatbot request error.")
 
 
+# ============================================================
+# Chatbot Request (FIPA-ACL) – One Node per Request with retry
+# ============================================================
+def generate_logical_sentence(
+    parameters: Dict[str, Any],
+    language_code: str,
+    config: Dict[str, Any],
+    use_public: Optional[bool] = None,
+    groups: Optional[List[str]] = None,
+    wait_seconds: float = 5.0,
+    max_retries: int = 5,
+) -> str:
+    prompt_template = config.get("chatbot_agent", {}).get("prompt_template")
+    if not prompt_template:
+        prompt_template = (
+            "Generate a fluent, well-written paragraph in {language_code} describing the following node. "
+            "It should read like a technical report (no tables or bullet points). "
+            "Here are the data:\n"
+            "{json_data}"
+        )
+
+    prompt = prompt_template.format(
+        language_code=language_code.upper(),
+        json_data=json.dumps(parameters, ensure_ascii=False, indent=4),
+    )
+
+    return _chatbot_request(
+        prompt,
+        parameters,
+        parameters.get("Node Name", "<unknown>"),
+        language_code,
+        config,
+        use_public=use_public,
+        groups=groups,
+        wait_seconds=wait_seconds,
+        max_retries=max_retries,
+    )
+
+
+# ============================================================
+# Chatbot Request (FIPA-ACL) – Batch mode (K nodes per request)
+# ============================================================
+DEFAULT_BATCH_PROMPT_TEMPLATE = (
+    "You are an AI service that receives a JSON array of ISM nodes. Each element has a \"NodeId\" "
+    "and the merged node data in \"data\".\n\n"
+    "JSON DATA (source):\n{json_data}\n\n"
+    "Task:\nFor EACH node write ONE concise, narrative-style technical paragraph in {language_code} "
+    "(4–6 sentences) that summarizes all node information in clear sentences. Always include "
+    "\"Alarm Status: <value>\" explicitly. Mention missing values as \"not available\". "
+    "Do NOT use bullet points, tables, markdown or invent fields.\n\n"
+    "Output ONLY a JSON array, one object per input node in the same order, of the form:\n"
+    "[{{\"NodeId\": \"<NodeId>\", \"paragraph\": \"<text>\"}}]"
+)
+
+
+
+def check_batch_prompt_template(template: str) -> None:
+    """Fail at config load (not mid-run) if a custom batch template cannot be filled via str.format."""
+    marker = "\x00json_data\x00"
+    try:
+        filled = template.format(language_code="EN", json_data=marker)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(
+            f"Invalid 'chatbot_agent.batch.prompt_template' ({e!r}): only {{language_code}} and "
+            f"{{json_data}} are placeholders; write literal braces doubled, e.g. "
+            f"[{{{{\"NodeId\": ..., \"paragraph\": ...}}}}]."
+        ) from None
+    if marker not in filled:
+        raise ValueError("Invalid 'chatbot_agent.batch.prompt_template': the {json_data} placeholder is missing.")
+
+
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TOKEN_ENCODERS: Dict[str, Any] = {}
+
+
+def count_tokens(text: str, encoding_name: str = "o200k_base") -> int:
+    """Token count via tiktoken (cached encoder); falls back to ~4 chars per token."""
+    enc = _TOKEN_ENCODERS.get(encoding_name)
+    if enc is None:
+        try:
+            import tiktoken
+
+            enc = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            enc = False
+        _TOKEN_ENCODERS[encoding_name] = enc
+    if enc is False:
+        return len(text) // 4 + 1
+    return len(enc.encode(text))
+
+
+def _node_key(idx: int, params: Dict[str, Any]) -> str:
+    """Stable node identifier: batch answers are matched and delta state is stored under it."""
+    return str(params.get("NodeId") or params.get("Node Name") or f"#{idx}")
+
+
+def plan_batches(
+    items: List[tuple],
+    batch_cfg: Dict[str, Any],
+    language_code: str,
+) -> List[List[tuple]]:
+    """
+    Greedily pack (idx, node_name, params) items into batches.
+    K is chosen per batch so that template + node JSON + expected output stays within 'token_budget'.
+    """
+    encoding = batch_cfg.get("encoding", "o200k_base")
+    budget = int(batch_cfg.get("token_budget", 6000))
+    max_nodes = max(1, int(batch_cfg.get("max_nodes", 8)))
+    out_per_node = int(batch_cfg.get("output_tokens_per_node", 250))
+    template = batch_cfg.get("prompt_template") or DEFAULT_BATCH_PROMPT_TEMPLATE
+    base = count_tokens(template.format(language_code=language_code.upper(), json_data=""), encoding)
+
+    batches: List[List[tuple]] = []
+    current: List[tuple] = []
+    used = base
+    for item in items:
+        idx, _, params = item
+        entry = {"NodeId": _node_key(idx, params), "data": params}
+        cost = count_tokens(json.dumps(entry, ensure_ascii=False), encoding) + out_per_node
+        if current and (len(current) >= max_nodes or used + cost > budget):
+            batches.append(current)
+            current, used = [], base
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_answer(answer: str, expected_keys: List[str]) -> Dict[str, str]:
+    """Parse the structured batch answer into {NodeId: paragraph}; raises ValueError if unusable."""
+    text = answer.strip()
+    m = _FENCED_JSON_RE.search(text)
+    if m:
+        text = m.group(1).strip()
+    start = text.find("[")
+    if start == -1:
+        raise ValueError("No JSON array in batch answer.")
+    data = json.loads(text[start : text.rfind("]") + 1])
+    if not isinstance(data, list):
+        raise ValueError("Batch answer is not a JSON array.")
+
+    paragraphs: Dict[str, str] = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        key = str(entry.get("NodeId", "")).strip()
+        para = str(entry.get("paragraph") or "").strip()
+        if key in expected_keys and para:
+            paragraphs[key] = para
+    if not paragraphs:
+        raise ValueError("Batch answer contains no usable paragraphs.")
+    return paragraphs
+
+
+def generate_batch_sentences(
+    batch: List[tuple],
+    language_code: str,
+    config: Dict[str, Any],
+    max_retries: int = 2,
+) -> Dict[int, str]:
+    """
+    Send K nodes in one request; returns {idx: paragraph} for every node that was answered.
+    Nodes missing from the answer are left for the caller's single-node fallback.
+    """
+    batch_cfg = config.get("chatbot_agent", {}).get("batch", {})
+    template = batch_cfg.get("prompt_template") or DEFAULT_BATCH_PROMPT_TEMPLATE
+    entries = [{"NodeId": _node_key(idx, params), "data": params} for idx, _, params in batch]
+    prompt = template.format(
+        language_code=language_code.upper(),
+        json_data=json.dumps(entries, ensure_ascii=False, indent=2),
+    )
+    label = f"batch[{len(batch)}] {batch[0][1]} … {batch[-1][1]}"
+
+    answer = _chatbot_request(prompt, entries, label, language_code, config, max_retries=max_retries)
+    paragraphs = parse_batch_answer(answer, [e["NodeId"] for e in entries])
+    return {
+        idx: paragraphs[_node_key(idx, params)]
+        for idx, _, params in batch
+        if _node_key(idx, params) in paragraphs
+    }
+
+
+# ============================================================
+# Delta mode – per-node state snapshot and field-level diff
+# ============================================================
+DELTA_WATCH_FIELDS = ("Status", "AlarmStatus", "PowerStatus", "Hardware Issues", "Disk Health Issues")
+
+DEFAULT_DELTA_PROMPT_TEMPLATE = (
+    "You are an AI service that monitors ISM nodes. The state of the node below changed since the previous run.\n\n"
+    "CHANGES (field: previous → current):\n{changes}\n\n"
+    "CURRENT NODE DATA (JSON):\n{json_data}\n\n"
+    "Task:\nWrite ONE concise, narrative-style paragraph in {language_code} that first states what changed and "
+    "then summarizes the node's current state. Always include \"Alarm Status: <value>\" explicitly. "
+    "Do NOT use bullet points, tables or markdown. Output ONLY the paragraph."
+)
+
+
+def load_state(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {"nodes": {}}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(data, dict) and isinstance(data.get("nodes"), dict):
+            return data
+    except Exception as e:
+        if slog:
+            slog.console("warning", "ism", ":state", "Error", f"Ignoring unreadable state {path}: {e}", level="warning")
+    return {"nodes": {}}
+
+
+def save_state(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    if slog:
+        slog.file_event(event="state_saved", path=str(path), nodes=len(state.get("nodes", {})))
+
+
+def diff_params(old: Dict[str, Any], new: Dict[str, Any], fields: List[str]) -> Dict[str, tuple]:
+    """Field-level diff over the watched fields: {field: (previous, current)}."""
+    changes = {}
+    for field in fields:
+        before, after = old.get(field, ""), new.get(field, "")
+        if before != after:
+            changes[field] = (before or "N/A", after or "N/A")
+    return changes
+
+
+def generate_delta_sentence(
+    parameters: Dict[str, Any],
+    changes: Dict[str, tuple],
+    language_code: str,
+    config: Dict[str, Any],
+    max_retries: int = 5,
+) -> str:
+    template = config.get("delta", {}).get("prompt_template") or DEFAULT_DELTA_PROMPT_TEMPLATE
+    prompt = template.format(
+        language_code=language_code.upper(),
+        changes="\n".join(f"- {f}: {a} → {b}" for f, (a, b) in changes.items()),
+        json_data=json.dumps(parameters, ensure_ascii=False, indent=4),
+    )
+    return _chatbot_request(
+        prompt,
+        parameters,
+        parameters.get("Node Name", "<unknown>"),
+        language_code,
+        config,
+        max_retries=max_retries,
+    )
+
+
 # ============================================================
 # Per-node JSON dump helpers
 # ============================================================
@@ -765,52 +1373,16 @@ def sftp_upload_file(local_path: Path, sftp_cfg: Dict[str, Any]) -> bool:
 
 
 # ============================================================
-# Main
+# Node processing (single / batched)
 # ============================================================
-def main():
-    parser = argparse.ArgumentParser(description="ISM Agent – robust generator for ISM nodes.")
-    parser.add_argument("--config", default="agents/ISMAgent/config.json", help="Path to config.json")
-    parser.add_argument("--language", help="Override language from config (optional)")
-    parser.add_argument("--delay", type=float, default=0.5, help="Seconds to wait between requests")
-    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
-    args = parser.parse_args()
-
-    setup_logging(args.verbose)
-    global slog
-
-    cfg = load_config(Path(args.config))
-    paths = cfg.get("paths", {})
-    input_path = Path(paths.get("input", "agents/ISMAgent/data/ism_nodes.json"))
-    inventory_path = Path(paths.get("inventory", "agents/ISMAgent/data/ism_inventory.json"))
-    output_path = Path(paths.get("output", "agents/ISMAgent/output/ism_nodes_report.txt"))
-    ndjson_path = paths.get("ndjson", "agents/ISMAgent/logs/ism_agent.ndjson")
-    dump_dir = Path(paths.get("dump_json_dir", "agents/ISMAgent/logs/node_json"))
-    archive_dir = Path(paths.get("archive_dir", "agents/ISMAgent/archive"))
-
-    slog = StructuredLog(ndjson_path, use_color=True)
-
-    check_server_health(cfg)
-
-    lang = (args.language or cfg.get("language") or "en").strip().lower()
-
-    try:
-        nodes = load_nodes(input_path)
-    except FileNotFoundError as e:
-        if slog:
-            slog.console("critical", "main", ":fatal", "Error", f"Fatal: Missing primary input file. {e}", level="critical")
-        sys.exit(1)
-    except Exception as e:
-        if slog:
-            slog.console("critical", "main", ":fatal", "Error", f"Fatal: Error loading nodes. {e}", level="critical")
-        sys.exit(1)
-
-    try:
-        inventory_map = load_inventory_map(inventory_path)
-    except Exception:
-        inventory_map = {}
-
-    archive_input_file(input_path, archive_dir)
-
+def process_nodes(
+    nodes: List[Dict[str, Any]],
+    inventory_map: Dict[int, Dict[str, Any]],
+    lang: str,
+    cfg: Dict[str, Any],
+    dump_dir: Optional[Path],
+    delay: float,
+) -> List[str]:
     results: List[str] = []
 
     for idx, node in enumerate(nodes, 1):
@@ -828,64 +1400,661 @@ def main():
 
             dump_node_json(dump_dir, idx, node_name, params, text)
 
-            time.sleep(max(0.0, float(args.delay)))
+            time.sleep(max(0.0, float(delay)))
         except Exception as e:
             if slog:
                 slog.console("error", "ism", ":process", "Error", f"{node_name}: {e}", level="error")
                 slog.file_event(event="node_failed", node=node_name, error=str(e))
             # continue
 
-    if not results:
+    return results
+
+
+def process_nodes_batched(
+    nodes: List[Dict[str, Any]],
+    inventory_map: Dict[int, Dict[str, Any]],
+    lang: str,
+    cfg: Dict[str, Any],
+    dump_dir: Optional[Path],
+    delay: float,
+) -> List[str]:
+    """Batch mode: K nodes per request, single-node fallback for anything the batch did not answer."""
+    items: List[tuple] = []
+    for idx, node in enumerate(nodes, 1):
+        node_name = node.get("Name", f"Node{idx}")
+        try:
+            items.append((idx, node_name, node_params(node, inventory_map)))
+        except Exception as e:
+            if slog:
+                slog.console("error", "ism", ":process", "Error", f"{node_name}: {e}", level="error")
+                slog.file_event(event="node_failed", node=node_name, error=str(e))
+
+    batches = plan_batches(items, cfg["chatbot_agent"]["batch"], lang)
+    if slog:
+        slog.console("info", "ism", ":batch", "-", f"{len(items)} nodes packed into {len(batches)} requests.")
+        slog.file_event(event="batch_plan", nodes=len(items), batches=len(batches), sizes=[len(b) for b in batches])
+
+    texts: Dict[int, str] = {}
+    for b_idx, batch in enumerate(batches, 1):
+        counter_str = f"{b_idx}/{len(batches)}"
+        answered: Dict[int, str] = {}
+        if len(batch) > 1:
+            if slog:
+                slog.console("proc", "ism", ":process", counter_str, f"Processing batch of {len(batch)} nodes")
+                slog.file_event(event="batch_processing", index=b_idx, nodes=[name for _, name, _ in batch])
+            try:
+                answered = generate_batch_sentences(batch, lang, cfg)
+            except Exception as e:
+                if slog:
+                    slog.console("warning", "ism", ":batch", "Fallback", f"Batch {counter_str} failed: {e}", level="warning")
+                    slog.file_event(event="batch_failed", index=b_idx, error=str(e))
+            time.sleep(max(0.0, float(delay)))
+
+        for idx, node_name, params in batch:
+            text = answered.get(idx)
+            if text is None:
+                try:
+                    if slog:
+                        slog.console("proc", "ism", ":process", counter_str, f"Processing node: {node_name}")
+                        slog.file_event(event="node_processing", node=node_name, index=idx)
+                    text = generate_logical_sentence(params, lang, cfg, max_retries=5)
+                    time.sleep(max(0.0, float(delay)))
+                except Exception as e:
+                    if slog:
+                        slog.console("error", "ism", ":process", "Error", f"{node_name}: {e}", level="error")
+                        slog.file_event(event="node_failed", node=node_name, error=str(e))
+                    continue
+            texts[idx] = text.strip()
+            dump_node_json(dump_dir, idx, node_name, params, text)
+
+    return [texts[idx] for idx in sorted(texts)]
+
+
+def _batch_new_nodes(
+    items: List[tuple],
+    lang: str,
+    cfg: Dict[str, Any],
+    delay: float,
+) -> Dict[int, str]:
+    """Batch mode inside delta mode: answer new nodes K per request; returns {idx: paragraph}."""
+    batches = plan_batches(items, cfg["chatbot_agent"]["batch"], lang)
+    if slog:
+        slog.console("info", "ism", ":batch", "-", f"{len(items)} new nodes packed into {len(batches)} requests.")
+        slog.file_event(event="batch_plan", nodes=len(items), batches=len(batches), sizes=[len(b) for b in batches])
+    answered: Dict[int, str] = {}
+    for b_idx, batch in enumerate(batches, 1):
+        if len(batch) < 2:
+            continue  # single nodes go through the regular per-node path
         if slog:
-            slog.console("error", "main", ":report", "Error", "No report could be generated.", level="error")
-        sys.exit(2)
+            slog.console("proc", "ism", ":process", f"{b_idx}/{len(batches)}", f"Processing batch of {len(batch)} new nodes")
+            slog.file_event(event="batch_processing", index=b_idx, nodes=[name for _, name, _ in batch])
+        try:
+            answered.update(generate_batch_sentences(batch, lang, cfg))
+        except Exception as e:
+            if slog:
+                slog.console("warning", "ism", ":batch", "Fallback", f"Batch {b_idx}/{len(batches)} failed: {e}", level="warning")
+                slog.file_event(event="batch_failed", index=b_idx, error=str(e))
+        time.sleep(max(0.0, float(delay)))
+    return answered
 
-    wrote_ok = False
-    try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        out_text = "\n\n".join(results).rstrip() + "\n"
-        output_length_bytes = len(out_text.encode("utf-8"))
-        byte_output_str = str(output_length_bytes) + "B"
-
-        if output_path.exists():
-            with open(output_path, "a", encoding="utf-8") as f:
-                f.write(out_text)
+
+def process_nodes_delta(
+    nodes: List[Dict[str, Any]],
+    inventory_map: Dict[int, Dict[str, Any]],
+    lang: str,
+    cfg: Dict[str, Any],
+    dump_dir: Optional[Path],
+    delay: float,
+    state_path: Path,
+) -> tuple:
+    """
+    Delta mode: only nodes whose watched fields changed (or that are new) go to the LLM.
+    With batch mode enabled, new nodes are packed K per request; changed nodes keep their
+    per-node change prompt.
+    Returns (change_entries, full_report); full_report combines fresh and cached paragraphs in input order.
+    """
+    fields = list(cfg["delta"].get("watch_fields") or DELTA_WATCH_FIELDS)
+    state = load_state(state_path)
+    previous: Dict[str, Any] = state["nodes"]
+    current: Dict[str, Any] = {}
+    changes_out: List[str] = []
+    full: Dict[int, str] = {}
+    seen = set()
+    pending: List[tuple] = []  # (idx, node_name, params, key, prev, changes)
+
+    for idx, node in enumerate(nodes, 1):
+        node_name = node.get("Name", f"Node{idx}")
+        try:
+            params = node_params(node, inventory_map)
+        except Exception as e:
             if slog:
-                slog.console("file", "filesystem", ":append", byte_output_str, f"Appended {output_length_bytes} bytes to: {output_path}")
-                slog.file_event(event="report_appended", path=str(output_path), size=len(out_text))
+                slog.console("error", "ism", ":process", "Error", f"{node_name}: {e}", level="error")
+                slog.file_event(event="node_failed", node=node_name, error=str(e))
+            continue
+
+        key = _node_key(idx, params)
+        seen.add(key)
+        prev = previous.get(key)
+        paragraph = (prev or {}).get("paragraph")
+
+        if prev is None or not paragraph:
+            changes = {"Node": ("N/A", "new")}
+        else:
+            changes = diff_params(prev.get("params", {}), params, fields)
+
+        if not changes:
+            current[key] = {"params": params, "paragraph": paragraph, "ts": prev.get("ts")}
+            full[idx] = paragraph
+            continue
+        pending.append((idx, node_name, params, key, prev, changes))
+
+    answered: Dict[int, str] = {}
+    if cfg["chatbot_agent"]["batch"].get("enabled"):
+        new_items = [(idx, name, params) for idx, name, params, _, prev, _ in pending
+                     if prev is None or not prev.get("paragraph")]
+        if len(new_items) > 1:
+            answered = _batch_new_nodes(new_items, lang, cfg, delay)
+
+    for idx, node_name, params, key, prev, changes in pending:
+        paragraph = (prev or {}).get("paragraph")
+        counter_str = f"{idx}/{len(nodes)}"
+        if slog:
+            slog.console("proc", "ism", ":process", counter_str, f"Changed node: {node_name} ({', '.join(changes)})")
+            slog.file_event(
+                event="node_changed",
+                node=node_name,
+                index=idx,
+                changes={f: list(v) for f, v in changes.items()},
+            )
+        try:
+            text = answered.get(idx)
+            if text is None:
+                if prev is None or not paragraph:
+                    text = generate_logical_sentence(params, lang, cfg, max_retries=5)
+                else:
+                    text = generate_delta_sentence(params, changes, lang, cfg, max_retries=5)
+                time.sleep(max(0.0, float(delay)))
+            text = text.strip()
+            dump_node_json(dump_dir, idx, node_name, params, text)
+        except Exception as e:
+            if slog:
+                slog.console("error", "ism", ":process", "Error", f"{node_name}: {e}", level="error")
+                slog.file_event(event="node_failed", node=node_name, error=str(e))
+            # keep the old snapshot so the node is retried next run
+            if prev is not None:
+                current[key] = prev
+                if paragraph:
+                    full[idx] = paragraph
+            continue
+
+        current[key] = {"params": params, "paragraph": text, "ts": StructuredLog._ts()}
+        full[idx] = text
+        summary = "; ".join(f"{f}: {a} → {b}" for f, (a, b) in changes.items())
+        changes_out.append(f"{node_name} (NodeId {params.get('NodeId', 'N/A')}) – {summary}\n{text}")
+
+    for key, prev in previous.items():
+        if key not in seen:
+            name = (prev.get("params") or {}).get("Node Name", key)
+            changes_out.append(f"{name} (NodeId {key}) – removed from input")
+            if slog:
+                slog.file_event(event="node_removed", node=name, key=key)
+
+    save_state(state_path, {"updated": StructuredLog._ts(), "nodes": current})
+    if slog:
+        slog.console("info", "ism", ":delta", "-", f"{len(changes_out)} change(s) across {len(nodes)} nodes.")
+        slog.file_event(event="delta_summary", nodes=len(nodes), changed=len(changes_out))
+    return changes_out, [full[idx] for idx in sorted(full)]
+
+
+# ============================================================
+# Report output
+# ============================================================
+def write_report(output_path: Path, results: List[str]) -> None:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    out_text = "\n\n".join(results).rstrip() + "\n"
+    output_length_bytes = len(out_text.encode("utf-8"))
+    byte_output_str = str(output_length_bytes) + "B"
+
+    if output_path.exists():
+        with open(output_path, "a", encoding="utf-8") as f:
+            f.write(out_text)
+        if slog:
+            slog.console("file", "filesystem", ":append", byte_output_str, f"Appended {output_length_bytes} bytes to: {output_path}")
+            slog.file_event(event="report_appended", path=str(output_path), size=len(out_text))
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(out_text)
+        if slog:
+            slog.console("file", "filesystem", ":write", byte_output_str, f"Report created: {output_path}")
+            slog.file_event(event="report_written", path=str(output_path), size=len(out_text))
+
+
+def publish_report(output_path: Path, cfg: Dict[str, Any]) -> None:
+    sftp_cfg = cfg.get("sftp") or {}
+    if sftp_cfg.get("enabled", False):
+        upload_ok = sftp_upload_file(output_path, sftp_cfg)
+
+        if upload_ok:
+            try:
+                os.remove(output_path)
+                if slog:
+                    slog.console("file", "filesystem", ":delete", "Done", f"Local report deleted after successful SFTP: {output_path}")
+                    slog.file_event(event="report_deleted", path=str(output_path))
+            except Exception as e:
+                if slog:
+                    slog.console("error", "filesystem", ":delete", "Error", f"Failed to delete local report: {e}", level="error")
+                    slog.file_event(event="delete_failed", path=str(output_path), error=str(e))
         else:
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(out_text)
             if slog:
-                slog.console("file", "filesystem", ":write", byte_output_str, f"Report created: {output_path}")
-                slog.file_event(event="report_written", path=str(output_path), size=len(out_text))
-        wrote_ok = True
+                slog.console("warning", "sftp", ":post", "Warn", "Upload failed; report remains local.", level="warning")
+    else:
+        if slog:
+            slog.console("info", "sftp", ":post", "Skip", "SFTP disabled in config.")
+
+
+# ============================================================
+# Pipeline (one input file -> report)
+# ============================================================
+def run_pipeline(
+    cfg: Dict[str, Any],
+    args: argparse.Namespace,
+    input_path: Path,
+    inventory_map: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> int:
+    """Process one input file end to end. Returns an exit code (0 = ok)."""
+    paths = cfg.get("paths", {})
+    inventory_path = Path(paths.get("inventory", "agents/ISMAgent/data/ism_inventory.json"))
+    output_path = Path(paths.get("output", "agents/ISMAgent/output/ism_nodes_report.txt"))
+    dump_dir = Path(paths.get("dump_json_dir", "agents/ISMAgent/logs/node_json"))
+    archive_dir = Path(paths.get("archive_dir", "agents/ISMAgent/archive"))
+
+    lang = (args.language or cfg.get("language") or "en").strip().lower()
+
+    try:
+        nodes = load_nodes(input_path, cfg.get("pdf"))
+    except FileNotFoundError as e:
+        if slog:
+            slog.console("critical", "main", ":fatal", "Error", f"Fatal: Missing primary input file. {e}", level="critical")
+        return 1
     except Exception as e:
         if slog:
-            slog.console("error", "filesystem", ":write", "Error", f"{e}", level="error")
-        sys.exit(3)
+            slog.console("critical", "main", ":fatal", "Error", f"Fatal: Error loading nodes. {e}", level="critical")
+        return 1
 
-    if wrote_ok:
-        sftp_cfg = cfg.get("sftp") or {}
-        if sftp_cfg.get("enabled", False):
-            upload_ok = sftp_upload_file(output_path, sftp_cfg)
+    if inventory_map is None:
+        try:
+            inventory_map = load_inventory_map(inventory_path)
+        except Exception:
+            inventory_map = {}
 
-            if upload_ok:
-                try:
-                    os.remove(output_path)
-                    if slog:
-                        slog.console("file", "filesystem", ":delete", "Done", f"Local report deleted after successful SFTP: {output_path}")
-                        slog.file_event(event="report_deleted", path=str(output_path))
-                except Exception as e:
-                    if slog:
-                        slog.console("error", "filesystem", ":delete", "Error", f"Failed to delete local report: {e}", level="error")
-                        slog.file_event(event="delete_failed", path=str(output_path), error=str(e))
+    archive_input_file(input_path, archive_dir)
+
+    batch_cfg = cfg["chatbot_agent"]["batch"]
+    if args.batch:
+        batch_cfg["enabled"] = True
+    delta_cfg = cfg["delta"]
+    if args.delta:
+        delta_cfg["enabled"] = True
+
+    reports: List[tuple] = []
+    if delta_cfg.get("enabled"):
+        change_report_path = Path(paths.get("change_report", "agents/ISMAgent/output/ism_nodes_changes.txt"))
+        state_path = Path(paths.get("state", "agents/ISMAgent/state/ism_state.json"))
+        changes, full = process_nodes_delta(nodes, inventory_map, lang, cfg, dump_dir, args.delay, state_path)
+        if changes:
+            header = f"ISM change report {StructuredLog._ts()} – {len(changes)} changed node(s)"
+            reports.append((change_report_path, [header] + changes))
+        if delta_cfg.get("full_report") and full:
+            reports.append((output_path, full))
+        if not reports:
+            if slog:
+                slog.console("info", "main", ":report", "-", "No node state changes; nothing to report.")
+            return 0
+    else:
+        if batch_cfg.get("enabled"):
+            results = process_nodes_batched(nodes, inventory_map, lang, cfg, dump_dir, args.delay)
+        else:
+            results = process_nodes(nodes, inventory_map, lang, cfg, dump_dir, args.delay)
+
+        if not results:
+            if slog:
+                slog.console("error", "main", ":report", "Error", "No report could be generated.", level="error")
+            return 2
+        reports.append((output_path, results))
+
+    for report_path, entries in reports:
+        try:
+            write_report(report_path, entries)
+        except Exception as e:
+            if slog:
+                slog.console("error", "filesystem", ":write", "Error", f"{e}", level="error")
+            return 3
+
+    for report_path, _ in reports:
+        publish_report(report_path, cfg)
+    return 0
+
+
+# ============================================================
+# Daemon mode – watch folder + status/metrics endpoint
+# ============================================================
+class InventoryCache:
+    """Keeps the inventory map in memory and reloads it only when the file changes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._sig: Optional[tuple] = None
+        self._loaded = False
+        self._map: Dict[int, Dict[str, Any]] = {}
+
+    def get(self) -> Dict[int, Dict[str, Any]]:
+        try:
+            st = self.path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        if not self._loaded or sig != self._sig:
+            try:
+                self._map = load_inventory_map(self.path)
+            except Exception:
+                self._map = {}
+            self._sig = sig
+            self._loaded = True
+        return self._map
+
+
+class InputWatcher:
+    """
+    Watches a directory for new input files.
+    Uses watchdog (inotify/FSEvents/ReadDirectoryChangesW) when installed, otherwise polls.
+    """
+
+    def __init__(self, watch_dir: Path, patterns: List[str], poll_interval: float):
+        self.watch_dir = watch_dir
+        self.patterns = patterns
+        self.poll_interval = max(0.5, float(poll_interval))
+        self.queue: "queue.Queue[Path]" = queue.Queue()
+        self.backend = "polling"
+        self._seen: Dict[str, tuple] = {}
+        self._seen_lock = threading.Lock()
+        self._observer = None
+        self._stop = threading.Event()
+
+    def _matches(self, path: Path) -> bool:
+        return path.is_file() and any(fnmatch.fnmatch(path.name, pat) for pat in self.patterns)
+
+    def _offer(self, path: Path) -> None:
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        sig = (st.st_mtime_ns, st.st_size)
+        if not self._matches(path):
+            return
+        with self._seen_lock:
+            if self._seen.get(str(path)) == sig:
+                return
+            self._seen[str(path)] = sig
+        self.queue.put(path)
+
+    def scan(self) -> None:
+        for p in sorted(self.watch_dir.iterdir()):
+            self._offer(p)
+        # forget files that are gone (archived), so a re-drop with the same name is picked up
+        with self._seen_lock:
+            for key in [k for k in self._seen if not os.path.exists(k)]:
+                del self._seen[key]
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.scan()
+            except Exception as e:
+                if slog:
+                    slog.console("warning", "daemon", ":watch", "Error", f"{e}", level="warning")
+
+    def start(self) -> None:
+        self.watch_dir.mkdir(parents=True, exist_ok=True)
+        self.scan()
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+
+            watcher = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_created(self, event):
+                    if not event.is_directory:
+                        watcher._offer(Path(event.src_path))
+
+                def on_moved(self, event):
+                    if not event.is_directory:
+                        watcher._offer(Path(event.dest_path))
+
+                def on_closed(self, event):
+                    if not event.is_directory:
+                        watcher._offer(Path(event.src_path))
+
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), str(self.watch_dir), recursive=False)
+            self._observer.start()
+            self.backend = "watchdog"
+        except Exception:
+            self._observer = None
+        # polling also runs as safety net next to watchdog (missed events, network shares), just slower
+        interval = self.poll_interval if self._observer is None else max(self.poll_interval, 60.0)
+        self.poll_interval = interval
+        threading.Thread(target=self._poll_loop, name="ism-watch-poll", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+
+
+class DaemonStatus:
+    """Counters for the daemon's /status (JSON) and /metrics (Prometheus text) endpoints."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.files_processed = 0
+        self.files_failed = 0
+        self.last_file: Optional[str] = None
+        self.last_exit_code: Optional[int] = None
+        self.last_run_seconds = 0.0
+        self.run_seconds_total = 0.0
+        self.busy = False
+        self.backend = "-"
+        self.queue_depth = lambda: 0
+
+    def record(self, path: Path, code: int, seconds: float) -> None:
+        with self.lock:
+            if code == 0:
+                self.files_processed += 1
             else:
+                self.files_failed += 1
+            self.last_file = str(path)
+            self.last_exit_code = code
+            self.last_run_seconds = seconds
+            self.run_seconds_total += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "status": "busy" if self.busy else "idle",
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "watcher": self.backend,
+                "queue_depth": self.queue_depth(),
+                "files_processed": self.files_processed,
+                "files_failed": self.files_failed,
+                "last_file": self.last_file,
+                "last_exit_code": self.last_exit_code,
+                "last_run_seconds": round(self.last_run_seconds, 3),
+            }
+
+    def prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = [
+            "# TYPE ism_daemon_files_total counter",
+            f'ism_daemon_files_total{{result="ok"}} {snap["files_processed"]}',
+            f'ism_daemon_files_total{{result="failed"}} {snap["files_failed"]}',
+            "# TYPE ism_daemon_run_seconds_total counter",
+            f"ism_daemon_run_seconds_total {self.run_seconds_total:.3f}",
+            "# TYPE ism_daemon_last_run_seconds gauge",
+            f'ism_daemon_last_run_seconds {snap["last_run_seconds"]}',
+            "# TYPE ism_daemon_queue_depth gauge",
+            f'ism_daemon_queue_depth {snap["queue_depth"]}',
+            "# TYPE ism_daemon_busy gauge",
+            f"ism_daemon_busy {1 if snap['status'] == 'busy' else 0}",
+            "# TYPE ism_daemon_uptime_seconds gauge",
+            f'ism_daemon_uptime_seconds {snap["uptime_seconds"]}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def start_status_server(status: DaemonStatus, host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            route = self.path.split("?", 1)[0]
+            if route in ("/status", "/health"):
+                body = json.dumps(status.snapshot()).encode("utf-8")
+                ctype = "application/json"
+            elif route == "/metrics":
+                body = status.prometheus().encode("utf-8")
+                ctype = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"status {self.address_string()} {format % args}")
+
+    try:
+        httpd = ThreadingHTTPServer((host, int(port)), _Handler)
+    except OSError as e:
+        if slog:
+            slog.console("warning", "daemon", ":status", "Error", f"Status endpoint disabled: {e}", level="warning")
+        return None
+    threading.Thread(target=httpd.serve_forever, name="ism-status", daemon=True).start()
+    if slog:
+        slog.console("info", "daemon", ":status", "-", f"Status endpoint on http://{host}:{port}/status")
+    return httpd
+
+
+def _wait_until_settled(path: Path, settle_seconds: float) -> bool:
+    """Wait until the file size stops changing (producer finished writing)."""
+    last = -1
+    while True:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return False
+        if size == last:
+            return True
+        last = size
+        time.sleep(max(0.1, float(settle_seconds)))
+
+
+def run_daemon(cfg: Dict[str, Any], args: argparse.Namespace) -> None:
+    daemon_cfg = cfg["daemon"]
+    paths = cfg.get("paths", {})
+    inventory = InventoryCache(Path(paths.get("inventory", "agents/ISMAgent/data/ism_inventory.json")))
+    watcher = InputWatcher(
+        Path(daemon_cfg["watch_dir"]),
+        list(daemon_cfg.get("patterns") or ["*.json", "*.pdf"]),
+        float(daemon_cfg.get("poll_interval_seconds", 5)),
+    )
+    # the inventory lives next to the inputs in the default layout – never treat it as an input
+    inventory_abs = inventory.path.resolve()
+
+    status = DaemonStatus()
+    status.queue_depth = watcher.queue.qsize
+    httpd = start_status_server(status, daemon_cfg.get("status_host", "127.0.0.1"), daemon_cfg.get("status_port", 9102))
+
+    stop = threading.Event()
+    try:
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    except (ValueError, AttributeError):
+        pass
+
+    watcher.start()
+    status.backend = watcher.backend
+    inventory.get()
+    if slog:
+        slog.console("info", "daemon", ":watch", watcher.backend, f"Watching {watcher.watch_dir} for {', '.join(watcher.patterns)}")
+        slog.file_event(event="daemon_started", watch_dir=str(watcher.watch_dir), backend=watcher.backend)
+
+    try:
+        while not stop.is_set():
+            try:
+                path = watcher.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if path.resolve() == inventory_abs or not _wait_until_settled(path, daemon_cfg.get("settle_seconds", 2)):
+                continue
+
+            status.busy = True
+            t_start = time.perf_counter()
+            try:
+                code = run_pipeline(cfg, args, path, inventory.get())
+            except Exception as e:
+                code = 99
                 if slog:
-                    slog.console("warning", "sftp", ":post", "Warn", "Upload failed; report remains local.", level="warning")
-        else:
+                    slog.console("error", "daemon", ":process", "Error", f"{path.name}: {e}", level="error")
+            elapsed = time.perf_counter() - t_start
+            status.busy = False
+            status.record(path, code, elapsed)
             if slog:
-                slog.console("info", "sftp", ":post", "Skip", "SFTP disabled in config.")
+                slog.file_event(event="daemon_file_done", file=str(path), exit_code=code, elapsed_seconds=round(elapsed, 3))
+    finally:
+        watcher.stop()
+        if httpd is not None:
+            httpd.shutdown()
+        if slog:
+            slog.console("info", "daemon", ":shutdown", "-", "Daemon stopped.")
+            slog.file_event(event="daemon_stopped")
+
+
+# ============================================================
+# Main
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="ISM Agent – robust generator for ISM nodes.")
+    parser.add_argument("--config", default="agents/ISMAgent/config.json", help="Path to config.json")
+    parser.add_argument("--language", help="Override language from config (optional)")
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds to wait between requests")
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--batch", action="store_true", help="Pack several nodes into one chatbot request")
+    parser.add_argument("--delta", action="store_true", help="Only report nodes whose state changed since the last run")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and process new input files as they arrive")
+    args = parser.parse_args()
+
+    setup_logging(args.verbose)
+    global slog
+
+    cfg = load_config(Path(args.config))
+    paths = cfg.get("paths", {})
+    input_path = Path(paths.get("input", "agents/ISMAgent/data/ism_nodes.json"))
+    ndjson_path = paths.get("ndjson", "agents/ISMAgent/logs/ism_agent.ndjson")
+
+    slog = StructuredLog(ndjson_path, use_color=True)
+
+    check_server_health(cfg)
+
+    if args.daemon or cfg["daemon"].get("enabled"):
+        run_daemon(cfg, args)
+        return
+
+    code = run_pipeline(cfg, args, input_path)
+    if code:
+        sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ import time
 import warnings
 from .language import languages  # Correct import statement
 from ...AgentInterface.Python.color import Color
+from ...AgentInterface.Python.logging_setup import setup_logging
 import socket  # For display_startup_header
 import platform  # For display_startup_header
 
@@ -44,49 +45,9 @@ def format_text(text: str, width: int, align: str = "<") -> str:
     """
     return f"{text:{align}{width}}"[:width]
 
-# ───────────────────────────────────────────────────────────────
-# Custom Logging Formatter (Emoji + uniform column widths)
-# ───────────────────────────────────────────────────────────────
-class CustomFormatter(logging.Formatter):
-    LEVEL_ICONS = {
-        'DEBUG': '🐛',
-        'INFO': 'ℹ️',
-        'WARNING': '⚠️',
-        'ERROR': '❌',
-        'CRITICAL': '‼️'
-    }
-
-    def format(self, record):
-        record.level_icon = self.LEVEL_ICONS.get(record.levelname, record.levelname)
-        record.component = format_text(getattr(record, "component", "iot"), COMPONENT_WIDTH)
-        record.tag = format_text(getattr(record, "tag", "-"), TAG_WIDTH)
-        record.message_type = format_text(getattr(record, "message_type", "-"), MESSAGE_WIDTH)
-
-        log_format = "{asctime} | {level_icon} {component} :{tag} | {message_type} | {message}"
-        return log_format.format(
-            asctime=self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
-            level_icon=record.level_icon,
-            component=record.component,
-            tag=record.tag,
-            message_type=record.message_type,
-            message=record.getMessage()
-        )
-
-def setup_logging(logging_config):
-    level_name = logging_config.get("level", "INFO")
-    log_level = getattr(logging, level_name.upper(), logging.INFO)
-
-    formatter = CustomFormatter()
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
-
-    # basicConfig is only called once before logging is used.
-    logging.basicConfig(level=log_level, handlers=[handler])
-
 if __name__ == "__main__":
-    setup_logging({"level": "DEBUG"})
-    # From now on, all subsequent logging calls will use the custom formatter.
-    # Rest of the code...
+    # Until the configuration is loaded: DEBUG to the console (queued, see logging_setup)
+    setup_logging("DEBUG", default_component="iot")
 
 # Temporary filtering of DeprecationWarning (as a transitional solution)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -694,15 +655,10 @@ def main():
     config = load_config(args.config, current_language)
 
     # Logging
-    log_level = getattr(logging, config['logging'].get('level', 'INFO').upper(), logging.INFO)
-    log_format = config['logging'].get('format', '%(asctime)s - %(levelname)s - %(message)s')
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler("iot_agent.log", encoding='utf-8')
-        ]
+    setup_logging(
+        config['logging'].get('level', 'INFO'),
+        default_component="iot",
+        log_file=config['logging'].get('file', "iot_agent.log")
     )
 
     # Start Prometheus (custom WSGI) in extra Thread